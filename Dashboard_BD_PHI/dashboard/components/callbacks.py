@@ -3,12 +3,8 @@ import plotly.graph_objects as go
 from ..utils.database import (
     get_db_engine, 
     get_filter_options, 
-    get_kpi_data,
-    get_map_data, 
     get_detailed_data, 
-    get_temporal_analysis,
-    get_distribution_analysis, 
-    get_comparative_analysis
+    get_dashboard_data
 )
 from ..config.settings import DATABASE_URL, MAPBOX_TOKEN, THEME
 import io
@@ -61,18 +57,16 @@ def update_map(map_type, map_level, basemap_style, df):
         # Definir zoom_level al inicio de la función
         zoom_level = 8 if map_level in ['veredas', 'cabeceras'] else 5
         
-        # Proyectar las geometrías a Web Mercator para mejor visualización
-        df_proj = df.to_crs(epsg=3857)
         fig = go.Figure()
 
         if map_type == 'points':
             # Mapa de puntos con tamaño variable según actividades
-            centroids = df_proj.geometry.centroid.to_crs(epsg=4326)
+            lat, lon = get_map_centroids(df)
             marker_sizes = normalize_sizes(df['total_actividades'], min_size=5, max_size=20)
             
             fig.add_trace(go.Scattermapbox(
-                lat=centroids.y,
-                lon=centroids.x,
+                lat=lat,
+                lon=lon,
                 mode='markers',
                 marker=dict(
                     size=marker_sizes,
@@ -86,10 +80,10 @@ def update_map(map_type, map_level, basemap_style, df):
             ))
         elif map_type == 'heat':
             # Mapa de calor
-            centroids = df_proj.geometry.centroid.to_crs(epsg=4326)
+            lat, lon = get_map_centroids(df)
             fig.add_trace(go.Densitymapbox(
-                lat=centroids.y,
-                lon=centroids.x,
+                lat=lat,
+                lon=lon,
                 z=df['total_actividades'],
                 radius=20,
                 colorscale='Viridis',
@@ -97,8 +91,8 @@ def update_map(map_type, map_level, basemap_style, df):
                 colorbar=dict(title='Densidad de Actividades')
             ))
         else:  # choropleth
-            # Convertir a GeoJSON en WGS84 (4326)
-            df_4326 = df_proj.to_crs(epsg=4326)
+            # Las geometrías ya vienen en WGS84 (4326)
+            df_4326 = df.to_crs(epsg=4326)
             
             # Agregar el mapa coroplético
             fig.add_trace(go.Choroplethmapbox(
@@ -151,6 +145,17 @@ def update_map(map_type, map_level, basemap_style, df):
             title_x=0.5
         )
 
+def get_map_centroids(df):
+    """
+    Retorna (lat, lon) de cada fila del mapa. Los municipios traen el centroide
+    precalculado de municipios_centroides; el resto de niveles lo calcula en
+    Web Mercator.
+    """
+    if {'latitud', 'longitud'}.issubset(df.columns) and df[['latitud', 'longitud']].notna().all().all():
+        return df['latitud'], df['longitud']
+    centroids = df.to_crs(epsg=3857).geometry.centroid.to_crs(epsg=4326)
+    return centroids.y, centroids.x
+
 def create_hover_text(df):
     """Crea el texto para el hover del mapa"""
     hover_text = []
@@ -427,34 +432,41 @@ def get_fullscreen_map_data(start_date, end_date, ano, zona, depto, categoria, g
     
     # Query para departamentos
     query_departamentos = """
-    SELECT d.departamento, d.geometry, COUNT(*) as total_actividades
-    FROM actividades_departamentos d
-    JOIN actividades a ON d.departamento = a.departamento
-    WHERE d.geometry IS NOT NULL 
-    AND (%(start_date)s IS NULL OR a.fecha >= %(start_date)s)
-    AND (%(end_date)s IS NULL OR a.fecha <= %(end_date)s)
-    AND (%(ano)s IS NULL OR EXTRACT(YEAR FROM a.fecha) = %(ano)s)
-    AND (%(zona)s IS NULL OR a.zona_geografica = %(zona)s)
-    AND (%(depto)s IS NULL OR a.departamento = %(depto)s)
-    AND (%(categoria)s IS NULL OR a.categoria_unica = %(categoria)s)
-    AND (%(grupo)s IS NULL OR a.grupo_interes = %(grupo)s)
-    GROUP BY d.departamento, d.geometry;
+    SELECT c.departamento, l.geometry, c.total_actividades
+    FROM (
+        SELECT a.cod_depto, MIN(a.departamento) as departamento, COUNT(*) as total_actividades
+        FROM actividades_departamentos a
+        WHERE a.cod_depto IS NOT NULL 
+        AND (%(start_date)s IS NULL OR a.fecha >= %(start_date)s)
+        AND (%(end_date)s IS NULL OR a.fecha <= %(end_date)s)
+        AND (%(ano)s IS NULL OR EXTRACT(YEAR FROM a.fecha) = %(ano)s)
+        AND (%(zona)s IS NULL OR a.zona_geografica = %(zona)s)
+        AND (%(depto)s IS NULL OR a.departamento = %(depto)s)
+        AND (%(categoria)s IS NULL OR a.categoria_unica = %(categoria)s)
+        AND (%(grupo)s IS NULL OR a.grupo_interes = %(grupo)s)
+        GROUP BY a.cod_depto
+    ) c
+    JOIN limites_departamentos l ON l.cod_depto = c.cod_depto;
     """
     
     # Query para municipios
     query_municipios = """
-    SELECT m.municipio, m.departamento, m.geometry, COUNT(*) as total_actividades
-    FROM actividades_municipios m
-    JOIN actividades a ON m.municipio = a.municipio AND m.departamento = a.departamento
-    WHERE m.geometry IS NOT NULL 
-    AND (%(start_date)s IS NULL OR a.fecha >= %(start_date)s)
-    AND (%(end_date)s IS NULL OR a.fecha <= %(end_date)s)
-    AND (%(ano)s IS NULL OR EXTRACT(YEAR FROM a.fecha) = %(ano)s)
-    AND (%(zona)s IS NULL OR a.zona_geografica = %(zona)s)
-    AND (%(depto)s IS NULL OR a.departamento = %(depto)s)
-    AND (%(categoria)s IS NULL OR a.categoria_unica = %(categoria)s)
-    AND (%(grupo)s IS NULL OR a.grupo_interes = %(grupo)s)
-    GROUP BY m.municipio, m.departamento, m.geometry;
+    SELECT c.municipio, c.departamento, l.geometry, c.total_actividades
+    FROM (
+        SELECT a.cod_mpio, MIN(a.municipio) as municipio, MIN(a.departamento) as departamento,
+               COUNT(*) as total_actividades
+        FROM actividades_municipios a
+        WHERE a.cod_mpio IS NOT NULL 
+        AND (%(start_date)s IS NULL OR a.fecha >= %(start_date)s)
+        AND (%(end_date)s IS NULL OR a.fecha <= %(end_date)s)
+        AND (%(ano)s IS NULL OR EXTRACT(YEAR FROM a.fecha) = %(ano)s)
+        AND (%(zona)s IS NULL OR a.zona_geografica = %(zona)s)
+        AND (%(depto)s IS NULL OR a.departamento = %(depto)s)
+        AND (%(categoria)s IS NULL OR a.categoria_unica = %(categoria)s)
+        AND (%(grupo)s IS NULL OR a.grupo_interes = %(grupo)s)
+        GROUP BY a.cod_mpio
+    ) c
+    JOIN limites_municipios l ON l.cod_mpio = c.cod_mpio;
     """
     
     # Query para geometrías detalladas (veredas y cabeceras)
@@ -1665,8 +1677,8 @@ def register_callbacks(app):
             if end_date:
                 end_date = pd.to_datetime(end_date).date()
                 
-            # Obtener datos detallados primero
-            df = get_detailed_data(
+            # Una sola consulta filtrada; el resto de conjuntos se derivan en pandas
+            dashboard_data = get_dashboard_data(
                 start_date=start_date, 
                 end_date=end_date,
                 ano=ano,
@@ -1677,21 +1689,11 @@ def register_callbacks(app):
                 categoria=categoria,
                 grupo=grupo,
                 grupo_intervencion=grupo_intervencion,
-                contrato=contrato
-            )
-            
-            # Obtener datos para KPIs
-            kpi_data = get_kpi_data(
-                start_date=start_date, 
-                end_date=end_date,
-                ano=ano,
-                zona=zona,
-                depto=depto,
-                municipio=municipio,
-                categoria=categoria,
-                grupo=grupo,
-                contrato=contrato
+                contrato=contrato,
+                nivel=map_level
             )
+            df = dashboard_data['detalle']
+            kpi_data = dashboard_data['kpis']
             
             # Formatear KPIs
             kpis = [
@@ -1705,56 +1707,13 @@ def register_callbacks(app):
                 f"{int(kpi_data['total_contratos']):,}"
             ]
             
-            # Obtener datos para análisis temporal y comparativo
-            df_temporal = get_temporal_analysis(
-                start_date=start_date, 
-                end_date=end_date,
-                ano=ano,
-                zona=zona,
-                depto=depto,
-                municipio=municipio,
-                categoria=categoria,
-                grupo=grupo,
-                contrato=contrato
-            )
-            
-            df_distribucion = get_distribution_analysis(
-                start_date=start_date, 
-                end_date=end_date,
-                ano=ano,
-                zona=zona,
-                depto=depto,
-                municipio=municipio,
-                categoria=categoria,
-                grupo=grupo,
-                contrato=contrato
-            )
-            
-            df_comparativo = get_comparative_analysis(
-                start_date=start_date, 
-                end_date=end_date,
-                ano=ano,
-                zona=zona,
-                depto=depto,
-                municipio=municipio,
-                categoria=categoria,
-                grupo=grupo,
-                contrato=contrato
-            )
+            # Datos para análisis temporal, distribución y comparativo
+            df_temporal = dashboard_data['temporal']
+            df_distribucion = dashboard_data['distribucion']
+            df_comparativo = dashboard_data['comparativo']
             
             # Crear todos los gráficos
-            map_data = get_map_data(
-                start_date=start_date,
-                end_date=end_date,
-                ano=ano,
-                zona=zona,
-                depto=depto,
-                municipio=municipio,
-                categoria=categoria,
-                grupo=grupo,
-                contrato=contrato,
-                nivel=map_level
-            )
+            map_data = dashboard_data['mapa']
             map_fig = update_map(map_type, map_level, basemap_style, map_data)
             basic_charts = create_charts(df)
             temporal_charts = create_temporal_charts(df_temporal)
@@ -0,0 +1,121 @@
+from sqlalchemy import create_engine, text
+import os
+from dotenv import load_dotenv
+
+# Vistas materializadas con los agregados de actividades que consultan el dashboard
+# y el geoportal. Las dimensiones de cada vista forman su índice único, requisito
+# para poder refrescarlas con CONCURRENTLY sin bloquear las lecturas.
+# Los conteos distintos de grupos de interés no son aditivos, así que cada celda
+# guarda el conjunto de grupos y se cuentan al consultar.
+ROLLUPS = {
+    'mv_actividades_mes_depto_mun_cat': {
+        'dimensiones': ['mes', 'ano', 'zona_geografica', 'departamento', 'municipio',
+                        'categoria_unica', 'contrato'],
+        'consulta': """
+            SELECT
+                DATE_TRUNC('month', fecha)::date AS mes,
+                ano,
+                zona_geografica,
+                departamento,
+                municipio,
+                categoria_unica,
+                contrato,
+                COUNT(*) AS total_actividades,
+                SUM(total_asistentes) AS total_asistentes,
+                COUNT(total_asistentes) AS asistentes_registrados,
+                array_agg(DISTINCT grupo_interes) FILTER (WHERE grupo_interes IS NOT NULL) AS grupos_interes
+            FROM actividades
+            GROUP BY 1, 2, 3, 4, 5, 6, 7
+        """
+    },
+    'mv_actividades_semana_depto_mun_cat': {
+        'dimensiones': ['semana', 'ano', 'zona_geografica', 'departamento', 'municipio',
+                        'categoria_unica', 'contrato'],
+        'consulta': """
+            SELECT
+                DATE_TRUNC('week', fecha)::date AS semana,
+                ano,
+                zona_geografica,
+                departamento,
+                municipio,
+                categoria_unica,
+                contrato,
+                COUNT(*) AS total_actividades,
+                SUM(total_asistentes) AS total_asistentes,
+                COUNT(total_asistentes) AS asistentes_registrados,
+                array_agg(DISTINCT grupo_interes) FILTER (WHERE grupo_interes IS NOT NULL) AS grupos_interes
+            FROM actividades
+            GROUP BY 1, 2, 3, 4, 5, 6, 7
+        """
+    },
+    'mv_actividades_mes_mun_grupo_cat': {
+        'dimensiones': ['mes', 'departamento', 'municipio', 'tipo_geometria',
+                        'grupo_interes', 'categoria_actividad'],
+        'consulta': """
+            SELECT
+                DATE_TRUNC('month', fecha)::date AS mes,
+                departamento,
+                municipio,
+                tipo_geometria,
+                grupo_interes,
+                categoria_actividad,
+                COUNT(*) AS total_actividades,
+                SUM(total_asistentes) AS total_asistentes
+            FROM actividades
+            GROUP BY 1, 2, 3, 4, 5, 6
+        """
+    },
+}
+
+def crear_rollups(engine):
+    """
+    Crea las vistas materializadas que aún no existen junto con sus índices.
+    Retorna los nombres de las vistas creadas (ya pobladas).
+    """
+    creadas = []
+    with engine.connect() as conn:
+        for nombre, rollup in ROLLUPS.items():
+            existe = conn.execute(text("SELECT to_regclass(:nombre) IS NOT NULL"), {"nombre": nombre}).scalar()
+            if existe:
+                continue
+
+            print(f"Creando vista materializada {nombre}...")
+            dimensiones = ', '.join(rollup['dimensiones'])
+            conn.execute(text(f"CREATE MATERIALIZED VIEW {nombre} AS {rollup['consulta']} WITH DATA;"))
+            conn.execute(text(f"CREATE UNIQUE INDEX idx_{nombre}_dimensiones ON {nombre} ({dimensiones});"))
+            conn.execute(text(f"CREATE INDEX idx_{nombre}_departamento ON {nombre} (departamento, municipio);"))
+            conn.commit()
+            creadas.append(nombre)
+    return creadas
+
+def eliminar_rollups(engine):
+    """
+    Elimina las vistas materializadas. Se usa antes de recrear la tabla
+    actividades, que no se puede eliminar mientras las vistas dependan de ella.
+    """
+    with engine.connect() as conn:
+        for nombre in ROLLUPS:
+            conn.execute(text(f"DROP MATERIALIZED VIEW IF EXISTS {nombre};"))
+        conn.commit()
+    print("Vistas materializadas eliminadas")
+
+def refrescar_rollups(engine):
+    """
+    Refresca las vistas materializadas después de una importación. El refresco
+    concurrente permite que el dashboard siga leyendo las vistas mientras tanto.
+    """
+    creadas = crear_rollups(engine)
+    with engine.connect() as conn:
+        for nombre in ROLLUPS:
+            if nombre in creadas:
+                continue
+            print(f"Refrescando vista materializada {nombre}...")
+            conn.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {nombre};"))
+            conn.execute(text(f"ANALYZE {nombre};"))
+            conn.commit()
+    print("Vistas materializadas actualizadas")
+
+if __name__ == "__main__":
+    load_dotenv()
+    engine = create_engine(os.getenv('DATABASE_URL'))
+    refrescar_rollups(engine)
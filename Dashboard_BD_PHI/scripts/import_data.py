@@ -2,7 +2,14 @@ import pandas as pd
 import geopandas as gpd
 from sqlalchemy import create_engine, text
 import os
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
+from crear_rollups import eliminar_rollups, refrescar_rollups
+
+# Feature store del modelo de asistencia (ml_module/ml_module/utils/feature_store.py)
+sys.path.append(str(Path(__file__).resolve().parents[2] / 'ml_module' / 'ml_module'))
+from utils.feature_store import construir_feature_store
 
 def verificar_columnas_shapefile(gdf, nombre_shapefile):
     print(f"\nColumnas en {nombre_shapefile}:")
@@ -126,6 +133,10 @@ def importar_datos_excel():
     engine = create_engine(DATABASE_URL)
     
     try:
+        # Las vistas materializadas dependen de actividades: se eliminan antes de
+        # recrear la tabla y refrescar_rollups las vuelve a crear tras la carga
+        eliminar_rollups(engine)
+        
         # PRIMERO: Crear la tabla si no existe
         with engine.connect() as conn:
             # Habilitar PostGIS
@@ -210,6 +221,16 @@ def importar_datos_excel():
         print(f"Total de registros importados: {len(gdf)}")
         print(f"Registros con ubicación exitosa: {len(gdf.dropna(subset=['geometry']))}")
         
+        # Recrear los agregados que consultan el dashboard y el geoportal
+        refrescar_rollups(engine)
+        
+        # Actualizar el feature store desde su último mes; si falla, el
+        # predictor sigue calculando las estadísticas en vivo
+        try:
+            construir_feature_store(engine)
+        except Exception as e:
+            print(f"⚠️ No se pudo actualizar el feature store: {str(e)}")
+        
         # Mostrar resumen de tipos de geometría
         print("\nResumen de tipos de geometría:")
         print(gdf['tipo_geometria'].value_counts())
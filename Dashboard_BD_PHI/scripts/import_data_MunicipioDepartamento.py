@@ -4,6 +4,126 @@ from sqlalchemy import create_engine, text
 import os
 from dotenv import load_dotenv
 
+# Tolerancias (en grados) de la pirámide de geometrías simplificadas, de mayor a menor detalle
+TOLERANCIAS_PIRAMIDE = [0.0001, 0.0005, 0.001, 0.005, 0.02]
+
+def crear_piramide_geometrias(engine, tolerancias=TOLERANCIAS_PIRAMIDE):
+    """
+    Precalcula las geometrías simplificadas de departamentos, municipios y veredas
+    para cada tolerancia, de modo que la API no tenga que simplificar ni unir
+    polígonos en cada petición.
+    """
+    print("\nConstruyendo pirámide de geometrías simplificadas...")
+    with engine.connect() as conn:
+        conn.execute(text("""
+            DROP TABLE IF EXISTS geometrias_simplificadas;
+            CREATE TABLE geometrias_simplificadas (
+                id SERIAL PRIMARY KEY,
+                capa TEXT NOT NULL,
+                tolerancia DOUBLE PRECISION NOT NULL,
+                nombre TEXT,
+                municipio TEXT,
+                departamento TEXT,
+                geometry geometry(Geometry, 4326)
+            );
+        """))
+
+        params = {"tolerancias": list(tolerancias)}
+
+        conn.execute(text("""
+            INSERT INTO geometrias_simplificadas (capa, tolerancia, nombre, municipio, departamento, geometry)
+            SELECT 'departamentos', t.tolerancia, d.departamento, NULL, d.departamento,
+                   ST_SimplifyPreserveTopology(l.geometry, t.tolerancia)
+            FROM (
+                SELECT cod_depto, MIN(departamento) AS departamento
+                FROM actividades_departamentos
+                WHERE cod_depto IS NOT NULL
+                GROUP BY cod_depto
+            ) d
+            JOIN limites_departamentos l ON l.cod_depto = d.cod_depto
+            CROSS JOIN unnest(CAST(:tolerancias AS double precision[])) AS t(tolerancia);
+        """), params)
+
+        conn.execute(text("""
+            INSERT INTO geometrias_simplificadas (capa, tolerancia, nombre, municipio, departamento, geometry)
+            SELECT 'municipios', t.tolerancia, m.municipio, m.municipio, m.departamento,
+                   ST_SimplifyPreserveTopology(l.geometry, t.tolerancia)
+            FROM (
+                SELECT cod_mpio, MIN(municipio) AS municipio, MIN(departamento) AS departamento
+                FROM actividades_municipios
+                WHERE cod_mpio IS NOT NULL
+                GROUP BY cod_mpio
+            ) m
+            JOIN limites_municipios l ON l.cod_mpio = m.cod_mpio
+            CROSS JOIN unnest(CAST(:tolerancias AS double precision[])) AS t(tolerancia);
+        """), params)
+
+        conn.execute(text("""
+            INSERT INTO geometrias_simplificadas (capa, tolerancia, nombre, municipio, departamento, geometry)
+            SELECT 'veredas', t.tolerancia, v.grupo_interes, v.municipio, v.departamento,
+                   ST_SimplifyPreserveTopology(v.geometry, t.tolerancia)
+            FROM (
+                SELECT DISTINCT ON (grupo_interes, municipio)
+                    grupo_interes, municipio, departamento, geometry
+                FROM (
+                    SELECT grupo_interes, municipio, departamento, ST_Union(geometry) AS geometry
+                    FROM actividades
+                    WHERE tipo_geometria = 'vereda'
+                    AND geometry IS NOT NULL
+                    GROUP BY grupo_interes, municipio, departamento
+                ) u
+            ) v
+            CROSS JOIN unnest(CAST(:tolerancias AS double precision[])) AS t(tolerancia);
+        """), params)
+
+        conn.execute(text("""
+            CREATE INDEX idx_geometrias_simplificadas_capa_tolerancia
+                ON geometrias_simplificadas (capa, tolerancia);
+            ANALYZE geometrias_simplificadas;
+        """))
+        conn.commit()
+
+        total = conn.execute(text("SELECT COUNT(*) FROM geometrias_simplificadas")).scalar()
+        print(f"Pirámide creada con {total} geometrías en {len(tolerancias)} niveles")
+
+def crear_centroides_municipios(engine):
+    """
+    Precalcula por municipio (clave DANE) su centroide en WGS84, un punto
+    representativo dentro del polígono, el rectángulo envolvente y el área,
+    para que los mapas y el clustering no calculen centroides en cada consulta.
+    """
+    print("\nCalculando centroides municipales...")
+    with engine.connect() as conn:
+        conn.execute(text("""
+            DROP TABLE IF EXISTS municipios_centroides;
+            CREATE TABLE municipios_centroides AS
+            SELECT
+                cod_mpio,
+                cod_depto,
+                municipio,
+                departamento,
+                ST_X(ST_Centroid(geometry)) AS longitud,
+                ST_Y(ST_Centroid(geometry)) AS latitud,
+                ST_X(ST_PointOnSurface(geometry)) AS punto_longitud,
+                ST_Y(ST_PointOnSurface(geometry)) AS punto_latitud,
+                ST_XMin(geometry) AS xmin,
+                ST_YMin(geometry) AS ymin,
+                ST_XMax(geometry) AS xmax,
+                ST_YMax(geometry) AS ymax,
+                ST_Area(geometry::geography) / 1000000.0 AS area_km2,
+                ST_SetSRID(ST_Centroid(geometry), 4326)::geometry(Point, 4326) AS centroide
+            FROM limites_municipios
+            WHERE geometry IS NOT NULL;
+
+            ALTER TABLE municipios_centroides ADD PRIMARY KEY (cod_mpio);
+            CREATE INDEX idx_municipios_centroides_centroide ON municipios_centroides USING GIST(centroide);
+            ANALYZE municipios_centroides;
+        """))
+        conn.commit()
+
+        total = conn.execute(text("SELECT COUNT(*) FROM municipios_centroides")).scalar()
+        print(f"Centroides municipales calculados: {total}")
+
 def crear_tablas_escalas():
     # Cargar variables de entorno
     load_dotenv()
@@ -11,11 +131,41 @@ def crear_tablas_escalas():
     engine = create_engine(DATABASE_URL)
     
     try:
-        # Crear tablas si no existen
+        # Crear tablas si no existen. Los límites se guardan una sola vez por unidad
+        # (clave DANE) y las tablas de actividades solo referencian esa clave
         with engine.connect() as conn:
-            # Tabla municipios
             conn.execute(text("""
+                DROP TABLE IF EXISTS municipios_centroides;
                 DROP TABLE IF EXISTS actividades_municipios;
+                DROP TABLE IF EXISTS actividades_departamentos;
+                DROP TABLE IF EXISTS limites_municipios;
+                DROP TABLE IF EXISTS limites_departamentos;
+            """))
+            
+            # Límites departamentales
+            conn.execute(text("""
+                CREATE TABLE limites_departamentos (
+                    cod_depto TEXT PRIMARY KEY,
+                    id SERIAL UNIQUE,
+                    departamento TEXT,
+                    geometry geometry(Geometry, 4326)
+                );
+            """))
+            
+            # Límites municipales
+            conn.execute(text("""
+                CREATE TABLE limites_municipios (
+                    cod_mpio TEXT PRIMARY KEY,
+                    id SERIAL UNIQUE,
+                    cod_depto TEXT REFERENCES limites_departamentos (cod_depto),
+                    municipio TEXT,
+                    departamento TEXT,
+                    geometry geometry(Geometry, 4326)
+                );
+            """))
+            
+            # Tabla municipios
+            conn.execute(text("""
                 CREATE TABLE actividades_municipios (
                     id SERIAL PRIMARY KEY,
                     contrato TEXT,
@@ -33,13 +183,12 @@ def crear_tablas_escalas():
                     categoria_unica TEXT,
                     total_asistentes INTEGER,
                     pais TEXT,
-                    geometry geometry(Geometry, 4326)
+                    cod_mpio TEXT REFERENCES limites_municipios (cod_mpio)
                 );
             """))
             
             # Tabla departamentos
             conn.execute(text("""
-                DROP TABLE IF EXISTS actividades_departamentos;
                 CREATE TABLE actividades_departamentos (
                     id SERIAL PRIMARY KEY,
                     contrato TEXT,
@@ -57,7 +206,7 @@ def crear_tablas_escalas():
                     categoria_unica TEXT,
                     total_asistentes INTEGER,
                     pais TEXT,
-                    geometry geometry(Geometry, 4326)
+                    cod_depto TEXT REFERENCES limites_departamentos (cod_depto)
                 );
             """))
             conn.commit()
@@ -84,6 +233,60 @@ def crear_tablas_escalas():
         print(f"CRS Municipios: {municipios_gdf.crs}")
         print(f"CRS Departamentos: {departamentos_gdf.crs}")
         
+        # Códigos DANE normalizados (departamento de 2 dígitos, municipio de 5)
+        departamentos_gdf['cod_depto'] = departamentos_gdf['DeCodigo'].astype(str).str.zfill(2)
+        municipios_gdf['cod_mpio'] = municipios_gdf['MpCodigo'].astype(str).str.zfill(5)
+        municipios_gdf['cod_depto'] = municipios_gdf['cod_mpio'].str[:2]
+        
+        # Guardar una única geometría por unidad administrativa
+        print("\nGuardando límites administrativos...")
+        limites_departamentos = departamentos_gdf.drop_duplicates(subset=['cod_depto'])
+        limites_departamentos = gpd.GeoDataFrame(
+            {
+                'cod_depto': limites_departamentos['cod_depto'],
+                'departamento': limites_departamentos['DeNombre']
+            },
+            geometry=limites_departamentos.geometry.buffer(0),
+            crs="EPSG:4326"
+        )
+        limites_municipios = municipios_gdf.drop_duplicates(subset=['cod_mpio'])
+        limites_municipios = gpd.GeoDataFrame(
+            {
+                'cod_mpio': limites_municipios['cod_mpio'],
+                'cod_depto': limites_municipios['cod_depto'],
+                'municipio': limites_municipios['MpNombre'],
+                'departamento': limites_municipios['Depto']
+            },
+            geometry=limites_municipios.geometry.buffer(0),
+            crs="EPSG:4326"
+        )
+        
+        limites_departamentos.to_postgis(
+            name='limites_departamentos',
+            con=engine,
+            if_exists='append',
+            index=False,
+            dtype={'geometry': 'geometry(Geometry, 4326)'}
+        )
+        limites_municipios.to_postgis(
+            name='limites_municipios',
+            con=engine,
+            if_exists='append',
+            index=False,
+            dtype={'geometry': 'geometry(Geometry, 4326)'}
+        )
+        
+        with engine.connect() as conn:
+            conn.execute(text("""
+                CREATE INDEX IF NOT EXISTS idx_limites_departamentos_geometry ON limites_departamentos USING GIST(geometry);
+                CREATE INDEX IF NOT EXISTS idx_limites_municipios_geometry ON limites_municipios USING GIST(geometry);
+                CREATE INDEX IF NOT EXISTS idx_limites_municipios_cod_depto ON limites_municipios(cod_depto);
+            """))
+            conn.commit()
+        
+        print(f"Límites departamentales: {len(limites_departamentos)}")
+        print(f"Límites municipales: {len(limites_municipios)}")
+        
         # Leer datos de la tabla original
         print("Leyendo datos de la tabla original...")
         query = "SELECT * FROM actividades;"
@@ -120,7 +323,7 @@ def crear_tablas_escalas():
         
         # Procesar tabla de municipios con verificación de departamento
         print("\nProcesando tabla de municipios...")
-        municipios_geom = []
+        municipios_cod = []
         municipios_no_encontrados = set()
         coincidencias_municipios = 0
 
@@ -130,15 +333,15 @@ def crear_tablas_escalas():
             mun_norm = normalizar_texto(row['MpNombre'])
             dep_norm = normalizar_texto(row['Depto'])
             key = (mun_norm, dep_norm)
-            municipios_dict[key] = row['geometry']
+            municipios_dict[key] = row['cod_mpio']
             
             # Agregar variantes del nombre
             if 'santa fe' in mun_norm:
                 key_alt = (mun_norm.replace('santa fe', 'santafe'), dep_norm)
-                municipios_dict[key_alt] = row['geometry']
+                municipios_dict[key_alt] = row['cod_mpio']
             elif 'santafe' in mun_norm:
                 key_alt = (mun_norm.replace('santafe', 'santa fe'), dep_norm)
-                municipios_dict[key_alt] = row['geometry']
+                municipios_dict[key_alt] = row['cod_mpio']
 
         for idx, row in df.iterrows():
             municipio = normalizar_texto(row['municipio'])
@@ -149,39 +352,39 @@ def crear_tablas_escalas():
             
             # Buscar coincidencia exacta con municipio y departamento
             if (municipio, departamento) in municipios_dict:
-                municipios_geom.append(municipios_dict[(municipio, departamento)])
+                municipios_cod.append(municipios_dict[(municipio, departamento)])
                 coincidencias_municipios += 1
             else:
                 # Intentar encontrar coincidencias parciales
                 encontrado = False
-                for (mun, dep), geom in municipios_dict.items():
+                for (mun, dep), cod_mpio in municipios_dict.items():
                     if municipio in mun and departamento == dep:
-                        municipios_geom.append(geom)
+                        municipios_cod.append(cod_mpio)
                         coincidencias_municipios += 1
                         encontrado = True
                         break
                 
                 if not encontrado:
-                    municipios_geom.append(None)
+                    municipios_cod.append(None)
                     municipios_no_encontrados.add(f"{row['municipio']} ({row['departamento']})")
 
         # Procesar tabla de departamentos con normalización
         print("\nProcesando tabla de departamentos...")
-        departamentos_geom = []
+        departamentos_cod = []
         departamentos_no_encontrados = set()
         coincidencias_departamentos = 0
 
         # Crear diccionario de departamentos para búsqueda más rápida
-        departamentos_dict = {normalizar_texto(row['DeNombre']): row['geometry'] 
+        departamentos_dict = {normalizar_texto(row['DeNombre']): row['cod_depto'] 
                             for idx, row in departamentos_gdf.iterrows()}
 
         for idx, row in df.iterrows():
             departamento = normalizar_texto(row['departamento'])
             if departamento in departamentos_dict:
-                departamentos_geom.append(departamentos_dict[departamento])
+                departamentos_cod.append(departamentos_dict[departamento])
                 coincidencias_departamentos += 1
             else:
-                departamentos_geom.append(None)
+                departamentos_cod.append(None)
                 departamentos_no_encontrados.add(row['departamento'])
 
         # Imprimir estadísticas detalladas con más información
@@ -208,72 +411,54 @@ def crear_tablas_escalas():
         print("\nDepartamentos disponibles:")
         print(sorted(departamentos_gdf['DeNombre'].unique()))
         
-        # Crear GeoDataFrame para municipios
-        gdf_municipios = gpd.GeoDataFrame(
-            df.drop(columns=['geometry', 'tipo_geometria']),
-            geometry=municipios_geom,
-            crs="EPSG:4326"
-        )
-        
-        # Crear GeoDataFrame para departamentos
-        gdf_departamentos = gpd.GeoDataFrame(
-            df.drop(columns=['geometry', 'tipo_geometria']),
-            geometry=departamentos_geom,
-            crs="EPSG:4326"
-        )
+        # Las tablas de actividades solo guardan la clave DANE de su unidad
+        df_municipios = pd.DataFrame(df.drop(columns=['geometry', 'tipo_geometria']))
+        df_municipios['cod_mpio'] = municipios_cod
         
-        # Verificar límites de las geometrías antes de guardar
-        print("\nVerificando límites de las geometrías:")
-        if not gdf_municipios.empty:
-            bounds_mun = gdf_municipios.total_bounds
-            print(f"Municipios: Lat [{bounds_mun[1]:.4f}, {bounds_mun[3]:.4f}], Lon [{bounds_mun[0]:.4f}, {bounds_mun[2]:.4f}]")
-        
-        if not gdf_departamentos.empty:
-            bounds_dep = gdf_departamentos.total_bounds
-            print(f"Departamentos: Lat [{bounds_dep[1]:.4f}, {bounds_dep[3]:.4f}], Lon [{bounds_dep[0]:.4f}, {bounds_dep[2]:.4f}]")
+        df_departamentos = pd.DataFrame(df.drop(columns=['geometry', 'tipo_geometria']))
+        df_departamentos['cod_depto'] = departamentos_cod
         
         # Guardar en la base de datos
         print("Guardando tablas en la base de datos...")
-        
-        # Verificar que las geometrías son válidas antes de guardar
-        print("\nVerificando geometrías municipales...")
-        invalid_geoms_mun = gdf_municipios[~gdf_municipios.geometry.is_valid]
-        if not invalid_geoms_mun.empty:
-            print(f"Hay {len(invalid_geoms_mun)} geometrías municipales inválidas")
-            gdf_municipios.geometry = gdf_municipios.geometry.buffer(0)
-        
-        print("\nVerificando geometrías departamentales...")
-        invalid_geoms_dep = gdf_departamentos[~gdf_departamentos.geometry.is_valid]
-        if not invalid_geoms_dep.empty:
-            print(f"Hay {len(invalid_geoms_dep)} geometrías departamentales inválidas")
-            gdf_departamentos.geometry = gdf_departamentos.geometry.buffer(0)
-        
-        # Guardar con to_postgis especificando el tipo de geometría
-        gdf_municipios.to_postgis(
+        df_municipios.to_sql(
             name='actividades_municipios',
             con=engine,
             if_exists='append',
-            index=False,
-            dtype={'geometry': 'geometry(MultiPolygon, 4326)'}
+            index=False
         )
         
-        gdf_departamentos.to_postgis(
+        df_departamentos.to_sql(
             name='actividades_departamentos',
             con=engine,
             if_exists='append',
-            index=False,
-            dtype={'geometry': 'geometry(MultiPolygon, 4326)'}
+            index=False
         )
         
+        with engine.connect() as conn:
+            conn.execute(text("""
+                CREATE INDEX IF NOT EXISTS idx_actividades_municipios_cod_mpio ON actividades_municipios(cod_mpio);
+                CREATE INDEX IF NOT EXISTS idx_actividades_departamentos_cod_depto ON actividades_departamentos(cod_depto);
+            """))
+            conn.commit()
+        
         print("Tablas creadas exitosamente")
-        print(f"Total de registros en tabla municipal: {len(gdf_municipios)}")
-        print(f"Registros con geometría municipal: {len(gdf_municipios.dropna(subset=['geometry']))}")
-        print(f"Total de registros en tabla departamental: {len(gdf_departamentos)}")
-        print(f"Registros con geometría departamental: {len(gdf_departamentos.dropna(subset=['geometry']))}")
+        print(f"Total de registros en tabla municipal: {len(df_municipios)}")
+        print(f"Registros con municipio asociado: {df_municipios['cod_mpio'].notna().sum()}")
+        print(f"Total de registros en tabla departamental: {len(df_departamentos)}")
+        print(f"Registros con departamento asociado: {df_departamentos['cod_depto'].notna().sum()}")
+        
+        crear_piramide_geometrias(engine)
+        crear_centroides_municipios(engine)
         
     except Exception as e:
         print(f"Error durante la creación de tablas: {str(e)}")
         raise
 
 if __name__ == "__main__":
-    crear_tablas_escalas()
+    import sys
+    if '--centroides' in sys.argv:
+        # Solo recalcula los centroides a partir de los límites ya importados
+        load_dotenv()
+        crear_centroides_municipios(create_engine(os.getenv('DATABASE_URL')))
+    else:
+        crear_tablas_escalas()
@@ -18,23 +18,23 @@ def visualizar_geometrias():
         # Verificar primero el contenido de las tablas
         with engine.connect() as conn:
             # Verificar municipios
-            result = conn.execute(text("SELECT COUNT(*) FROM actividades_municipios WHERE geometry IS NOT NULL"))
+            result = conn.execute(text("SELECT COUNT(*) FROM actividades_municipios WHERE cod_mpio IS NOT NULL"))
             count_mun = result.scalar()
             print(f"Registros con geometría en tabla municipios: {count_mun}")
             
             # Verificar departamentos
-            result = conn.execute(text("SELECT COUNT(*) FROM actividades_departamentos WHERE geometry IS NOT NULL"))
+            result = conn.execute(text("SELECT COUNT(*) FROM actividades_departamentos WHERE cod_depto IS NOT NULL"))
             count_dep = result.scalar()
             print(f"Registros con geometría en tabla departamentos: {count_dep}")
         
         # Leer los datos con transformación de coordenadas
         municipios = gpd.read_postgis(
             """
-            SELECT municipio, 
-                   ST_Transform(geometry, 4326) as geometry
-            FROM actividades_municipios 
-            WHERE geometry IS NOT NULL 
-            GROUP BY municipio, geometry;
+            SELECT MIN(a.municipio) as municipio, 
+                   ST_Transform(l.geometry, 4326) as geometry
+            FROM actividades_municipios a
+            JOIN limites_municipios l ON l.cod_mpio = a.cod_mpio
+            GROUP BY l.cod_mpio;
             """, 
             engine, 
             geom_col='geometry'
@@ -42,11 +42,11 @@ def visualizar_geometrias():
         
         departamentos = gpd.read_postgis(
             """
-            SELECT departamento, 
-                   ST_Transform(geometry, 4326) as geometry
-            FROM actividades_departamentos 
-            WHERE geometry IS NOT NULL 
-            GROUP BY departamento, geometry;
+            SELECT MIN(a.departamento) as departamento, 
+                   ST_Transform(l.geometry, 4326) as geometry
+            FROM actividades_departamentos a
+            JOIN limites_departamentos l ON l.cod_depto = a.cod_depto
+            GROUP BY l.cod_depto;
             """, 
             engine, 
             geom_col='geometry'
@@ -28,19 +28,28 @@ def visualizar_todas_geometrias():
         
         # 2. Municipios
         query_municipios = """
-        SELECT municipio, departamento, geometry, COUNT(*) as total_actividades
-        FROM actividades_municipios 
-        WHERE geometry IS NOT NULL 
-        GROUP BY municipio, departamento, geometry;
+        SELECT c.municipio, c.departamento, l.geometry, c.total_actividades
+        FROM (
+            SELECT cod_mpio, MIN(municipio) as municipio, MIN(departamento) as departamento,
+                   COUNT(*) as total_actividades
+            FROM actividades_municipios 
+            WHERE cod_mpio IS NOT NULL 
+            GROUP BY cod_mpio
+        ) c
+        JOIN limites_municipios l ON l.cod_mpio = c.cod_mpio;
         """
         gdf_municipios = gpd.read_postgis(query_municipios, engine, geom_col='geometry')
         
         # 3. Departamentos
         query_departamentos = """
-        SELECT departamento, geometry, COUNT(*) as total_actividades
-        FROM actividades_departamentos 
-        WHERE geometry IS NOT NULL 
-        GROUP BY departamento, geometry;
+        SELECT c.departamento, l.geometry, c.total_actividades
+        FROM (
+            SELECT cod_depto, MIN(departamento) as departamento, COUNT(*) as total_actividades
+            FROM actividades_departamentos 
+            WHERE cod_depto IS NOT NULL 
+            GROUP BY cod_depto
+        ) c
+        JOIN limites_departamentos l ON l.cod_depto = c.cod_depto;
         """
         gdf_departamentos = gpd.read_postgis(query_departamentos, engine, geom_col='geometry')
         
@@ -1,4 +1,5 @@
 from .statistics import router as statistics_router
 from .spatial import router as spatial_router
+from .tiles import router as tiles_router
 
-__all__ = ['statistics_router', 'spatial_router']
\ No newline at end of file
+__all__ = ['statistics_router', 'spatial_router', 'tiles_router']
\ No newline at end of file
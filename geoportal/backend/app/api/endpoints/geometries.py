@@ -1,6 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from ...core.database import get_db
+from fastapi import APIRouter, HTTPException
 from ...services.spatial_analysis import SpatialService
 import logging
 
@@ -13,8 +11,7 @@ router = APIRouter(
 
 @router.get("/{level}")
 async def get_geometries(
-    level: str,
-    db: Session = Depends(get_db)
+    level: str
 ):
     """
     Obtiene las geometrías para un nivel específico (departamentos o municipios)
@@ -26,7 +23,7 @@ async def get_geometries(
                 detail="Nivel no válido. Use 'departamentos' o 'municipios'"
             )
 
-        service = SpatialService(db)
+        service = SpatialService()
         if level == "departamentos":
             return await service.get_department_geometries()
         else:
@@ -1,42 +1,44 @@
-from fastapi import APIRouter, Depends, Query, HTTPException, Path
+from fastapi import APIRouter, Depends, Query, HTTPException, Path, Request
 from typing import Optional
 from datetime import datetime
 from ...services.spatial_analysis import SpatialAnalysisService
 from ...schemas.geometry_schemas import ActivityFilter, FeatureCollection
+from ...core.cache import layer_cache
+from ...core.database import fetch_all, fetch_one, stream_rows, run_blocking
 import logging
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.encoders import jsonable_encoder
-from sqlalchemy.sql import text
+import asyncio
 import json
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+# Features leídas del cursor por cada escritura al socket
+FEATURE_BATCH_SIZE = 500
+
 @router.get("/geometries/{level}")
 async def get_geometries(
+    request: Request,
     level: str = Path(..., description="Nivel de geometría: departamentos, municipios, veredas, etc"),
     departamento: Optional[str] = Query(None),
-    municipio: Optional[str] = Query(None)
+    municipio: Optional[str] = Query(None),
+    zoom: Optional[int] = Query(None, ge=0, le=22, description="Zoom del mapa para elegir el nivel de simplificación"),
+    tolerance: Optional[float] = Query(None, gt=0, description="Tolerancia de simplificación en grados")
 ):
     """Obtiene las geometrías filtradas por nivel y filtros opcionales"""
     try:
         logger.info(f"Recibida petición para nivel: {level}")
         
         spatial_service = SpatialAnalysisService()
-        filters = {
-            "departamento": departamento,
-            "municipio": municipio
-        }
-        
-        geojson = await spatial_service.get_geometries(level, filters)
-        
-        # Añadir logs detallados para puntos de encuentro
-        if level == 'puntos_encuentro':
-            logger.info(f"Total de features: {len(geojson['features'])}")
-            if geojson['features']:
-                logger.info(f"Ejemplo de feature: {geojson['features'][0]}")
+        body, entry = await _get_layer_body(
+            spatial_service, level, departamento, municipio, zoom, tolerance
+        )
+        if entry is None:
+            return Response(content=body, media_type="application/json")
         
-        return JSONResponse(content=jsonable_encoder(geojson))
+        return _cached_layer_response(request, entry)
         
     except Exception as e:
         logger.error(f"Error en get_geometries endpoint: {str(e)}")
@@ -46,6 +48,148 @@ async def get_geometries(
             status_code=500
         )
 
+async def _get_layer_body(
+    spatial_service: SpatialAnalysisService,
+    level: str,
+    departamento: Optional[str] = None,
+    municipio: Optional[str] = None,
+    zoom: Optional[int] = None,
+    tolerance: Optional[float] = None
+):
+    """
+    Devuelve el GeoJSON serializado de una capa y su entrada de cache (None si
+    la respuesta no se cacheó)
+    """
+    filters = {
+        "departamento": departamento,
+        "municipio": municipio,
+        "zoom": zoom,
+        "tolerance": tolerance
+    }
+    
+    # Las capas se sirven desde cache mientras no cambien sus tablas de origen.
+    # La clave solo incluye lo que cambia la respuesta: get_geometries no filtra
+    # por departamento ni municipio, y el zoom o la tolerancia se reducen al
+    # nivel de la pirámide que se serviría
+    try:
+        version = await spatial_service.get_layer_version(level)
+        variant = await spatial_service.get_cache_variant(level, version, zoom, tolerance)
+        cache_key = f"{level}:{variant}"
+    except Exception as e:
+        logger.warning(f"No se pudo obtener la versión de {level}: {str(e)}")
+        version = None
+
+    # Redis, la serialización y la compresión bloquean: se ejecutan en el pool
+    # de hilos para no detener las demás peticiones del worker
+    entry = None
+    if version:
+        entry = layer_cache.get_from_memory(cache_key, version)
+        if entry is None:
+            entry = await run_blocking(layer_cache.get, cache_key, version)
+    if entry is not None:
+        return entry["body"], entry
+
+    geojson = await spatial_service.get_geometries(level, filters)
+    
+    # Añadir logs detallados para puntos de encuentro
+    if level == 'puntos_encuentro':
+        logger.info(f"Total de features: {len(geojson['features'])}")
+    
+    body = await run_blocking(_serialize_geojson, geojson)
+    
+    # No cachear colecciones vacías: pueden venir de un error ya registrado
+    if not version or not geojson.get("features"):
+        return body, None
+    entry = await run_blocking(layer_cache.set, cache_key, version, body)
+    return body, entry
+
+def _serialize_geojson(geojson: dict) -> bytes:
+    return json.dumps(
+        jsonable_encoder(geojson),
+        ensure_ascii=False,
+        separators=(",", ":")
+    ).encode("utf-8")
+
+def _cached_layer_response(request: Request, entry: dict) -> Response:
+    """
+    Construye la respuesta HTTP de una capa cacheada, con ETag y compresión.
+    Cada codificación es una representación distinta, así que lleva su propio
+    ETag fuerte (la base más el sufijo de la codificación).
+    """
+    accept_encoding = request.headers.get("accept-encoding", "")
+    if entry["br"] is not None and "br" in accept_encoding:
+        encoding, content = "br", entry["br"]
+    elif "gzip" in accept_encoding:
+        encoding, content = "gzip", entry["gzip"]
+    else:
+        encoding, content = None, entry["body"]
+
+    etag = f'"{entry["etag"]}-{encoding}"' if encoding else f'"{entry["etag"]}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": entry["last_modified"],
+        "Cache-Control": "public, no-cache",
+        "Vary": "Accept-Encoding"
+    }
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=content, media_type="application/json", headers=headers)
+
+@router.get("/layers/batch")
+async def get_layers_batch(
+    layers: str = Query(..., description="Capas separadas por coma: vias,embalse,puntos_encuentro,...")
+):
+    """
+    Devuelve varias capas en una sola respuesta NDJSON: una línea por capa con
+    la forma {"layer": <nombre>, "data": <FeatureCollection>}. Las capas se
+    consultan en paralelo y cada línea se envía en cuanto su capa está lista.
+    """
+    spatial_service = SpatialAnalysisService()
+    requested = list(dict.fromkeys(name.strip() for name in layers.split(",") if name.strip()))
+    if not requested:
+        raise HTTPException(status_code=400, detail="Debe indicar al menos una capa")
+
+    unknown = [name for name in requested if name not in spatial_service.table_mappings]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Capas no encontradas: {', '.join(unknown)}")
+
+    logger.info(f"Recibida petición de capas en lote: {requested}")
+
+    async def stream_layers():
+        tasks = [
+            asyncio.create_task(_get_batch_line(spatial_service, level))
+            for level in requested
+        ]
+        try:
+            for next_line in asyncio.as_completed(tasks):
+                yield await next_line
+        finally:
+            # Si el cliente se desconecta no se siguen consultando las capas pendientes
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(
+        stream_layers(),
+        media_type=NDJSON_MEDIA_TYPE,
+        # X-Accel-Buffering evita que nginx retenga las líneas hasta el final
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _get_batch_line(spatial_service: SpatialAnalysisService, level: str) -> bytes:
+    """Serializa una capa como línea NDJSON reutilizando el cuerpo cacheado"""
+    layer_name = json.dumps(level).encode("utf-8")
+    try:
+        body, _ = await _get_layer_body(spatial_service, level)
+        return b'{"layer":' + layer_name + b',"data":' + body + b'}\n'
+    except Exception as e:
+        logger.error(f"Error obteniendo la capa {level} del lote: {str(e)}")
+        return json.dumps({"layer": level, "error": str(e)}, ensure_ascii=False).encode("utf-8") + b"\n"
+
 @router.get("/statistics/{level}")
 async def get_statistics(
     level: str,
@@ -100,24 +244,22 @@ async def test_puntos_encuentro():
 async def test_punto(id: int):
     """Endpoint de prueba para verificar un punto específico"""
     try:
-        spatial_service = SpatialAnalysisService()
-        with spatial_service.engine.connect() as connection:
-            query = text("""
-                SELECT 
-                    id, nombre_pe, codigo_pe, nombre_mun,
-                    ruta_de_evacuacion, tiempo_de_llegada,
-                    ST_AsGeoJSON(geometry)::json as geom
-                FROM puntos_encuentro
-                WHERE id = :id
-            """)
-            result = connection.execute(query, {"id": id}).first()
+        query = """
+            SELECT 
+                id, nombre_pe, codigo_pe, nombre_mun,
+                ruta_de_evacuacion, tiempo_de_llegada,
+                ST_AsGeoJSON(geometry)::json as geom
+            FROM puntos_encuentro
+            WHERE id = :id
+        """
+        result = await fetch_one(query, {"id": id})
             
-            if result:
-                return JSONResponse(content=jsonable_encoder(dict(result)))
-            return JSONResponse(
-                content={"error": "Punto no encontrado"},
-                status_code=404
-            )
+        if result:
+            return JSONResponse(content=jsonable_encoder(dict(result._mapping)))
+        return JSONResponse(
+            content={"error": "Punto no encontrado"},
+            status_code=404
+        )
     except Exception as e:
         logger.error(f"Error en test_punto: {str(e)}")
         return JSONResponse(
@@ -129,25 +271,22 @@ async def test_punto(id: int):
 async def test_puntos_raw():
     """Endpoint para verificar los datos crudos de puntos de encuentro"""
     try:
-        spatial_service = SpatialAnalysisService()
-        with spatial_service.engine.connect() as connection:
-            query = text("""
-                SELECT 
-                    id,
-                    nombre_pe,
-                    codigo_pe,
-                    nombre_mun,
-                    ruta_de_evacuacion,
-                    tiempo_de_llegada,
-                    ST_AsText(geometry) as geom_text
-                FROM puntos_encuentro
-                LIMIT 5;
-            """)
-            result = connection.execute(query)
-            rows = result.fetchall()
+        query = """
+            SELECT 
+                id,
+                nombre_pe,
+                codigo_pe,
+                nombre_mun,
+                ruta_de_evacuacion,
+                tiempo_de_llegada,
+                ST_AsText(geometry) as geom_text
+            FROM puntos_encuentro
+            LIMIT 5;
+        """
+        rows = await fetch_all(query)
             
-            data = [dict(row._mapping) for row in rows]
-            return JSONResponse(content=jsonable_encoder(data))
+        data = [dict(row._mapping) for row in rows]
+        return JSONResponse(content=jsonable_encoder(data))
     except Exception as e:
         logger.error(f"Error en test_puntos_raw: {str(e)}")
         logger.exception(e)
@@ -175,69 +314,44 @@ async def filter_features(
                 detail=f"Capa no encontrada: {layer}"
             )
         
-        # Consulta simplificada
+        # Una fila por feature, ya serializada como texto GeoJSON por PostgreSQL
         query = f"""
             SELECT json_build_object(
-                'type', 'FeatureCollection',
-                'features', COALESCE(
-                    (
-                        SELECT json_agg(
-                            json_build_object(
-                                'type', 'Feature',
-                                'id', id,
-                                'geometry', ST_AsGeoJSON(geometry)::json,
-                                'properties', json_build_object(
-                                    '{field}', {field},
-                                    'id', id
-                                )
-                            )
-                        )
-                        FROM {table_name}
-                        WHERE {field}::text ILIKE :value
-                        AND geometry IS NOT NULL
-                    ),
-                    '[]'
+                'type', 'Feature',
+                'id', id,
+                'geometry', ST_AsGeoJSON(geometry)::json,
+                'properties', json_build_object(
+                    '{field}', {field},
+                    'id', id
                 )
-            )::text AS geojson
+            )::text AS feature
+            FROM {table_name}
+            WHERE {field}::text ILIKE :value
+            AND geometry IS NOT NULL
         """
         
         logger.info(f"Ejecutando consulta: {query}")
         logger.info(f"Con parámetros: value={value}")
         
-        with spatial_service.engine.connect() as connection:
-            try:
-                result = connection.execute(
-                    text(query),
-                    {"value": f"%{value}%"}
-                )
-                row = result.fetchone()
-                
-                if not row or not row.geojson:
-                    return JSONResponse(content={
-                        "type": "FeatureCollection",
-                        "features": []
-                    })
-                
-                # Convertir el texto JSON a diccionario
-                try:
-                    geojson_dict = json.loads(row.geojson)
-                    logger.info(f"Resultado filtrado: {len(geojson_dict.get('features', []))} elementos encontrados")
-                    return JSONResponse(content=geojson_dict)
-                except json.JSONDecodeError as e:
-                    logger.error(f"Error decodificando JSON: {e}")
-                    logger.error(f"JSON recibido: {row.geojson}")
-                    raise HTTPException(
-                        status_code=500,
-                        detail="Error procesando resultados"
-                    )
-                
-            except Exception as e:
-                logger.error(f"Error ejecutando consulta: {str(e)}")
-                logger.error(f"Query: {query}")
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Error al ejecutar la consulta: {str(e)}"
-                )
+        # El primer lote se lee antes de responder para que un error de consulta
+        # todavía pueda devolverse como 500
+        batches = stream_rows(query, {"value": f"%{value}%"}, batch_size=FEATURE_BATCH_SIZE)
+        try:
+            first_batch = await batches.__anext__()
+        except StopAsyncIteration:
+            first_batch = []
+        except Exception as e:
+            logger.error(f"Error ejecutando consulta: {str(e)}")
+            logger.error(f"Query: {query}")
+            raise HTTPException(
+                status_code=500,
+                detail=f"Error al ejecutar la consulta: {str(e)}"
+            )
+        
+        return StreamingResponse(
+            _stream_feature_collection(first_batch, batches, layer),
+            media_type="application/json"
+        )
     
     except HTTPException:
         raise
@@ -249,6 +363,29 @@ async def filter_features(
             detail=f"Error al filtrar: {str(e)}"
         )
 
+async def _stream_feature_collection(first_batch, batches, layer: str):
+    """
+    Escribe un FeatureCollection por partes a medida que llegan los lotes del
+    cursor; en memoria solo se mantiene un lote a la vez
+    """
+    total = 0
+    yield b'{"type":"FeatureCollection","features":['
+    try:
+        batch = first_batch
+        while True:
+            if batch:
+                chunk = ",".join(row.feature for row in batch)
+                yield (b"," if total else b"") + chunk.encode("utf-8")
+                total += len(batch)
+            try:
+                batch = await batches.__anext__()
+            except StopAsyncIteration:
+                break
+    finally:
+        await batches.aclose()
+        logger.info(f"Resultado filtrado de {layer}: {total} elementos enviados")
+    yield b"]}"
+
 @router.get("/fields/{table_name}")
 async def get_table_fields(table_name: str):
     """Obtiene los campos disponibles de una tabla"""
@@ -294,17 +431,12 @@ async def test_filter(layer: str, field: str, value: str):
             LIMIT 5;
         """
         
-        with spatial_service.engine.connect() as connection:
-            result = connection.execute(
-                text(query),
-                {"value": f"%{value}%"}
-            )
-            rows = result.fetchall()
+        rows = await fetch_all(query, {"value": f"%{value}%"})
             
-            return JSONResponse(content={
-                "count": len(rows),
-                "sample": [dict(row._mapping) for row in rows]
-            })
+        return JSONResponse(content={
+            "count": len(rows),
+            "sample": [dict(row._mapping) for row in rows]
+        })
             
     except Exception as e:
         logger.error(f"Error en test_filter: {str(e)}")
@@ -339,17 +471,12 @@ async def test_filter_format(layer: str, field: str, value: str):
             ) t;
         """
         
-        with spatial_service.engine.connect() as connection:
-            result = connection.execute(
-                text(query),
-                {"value": f"%{value}%"}
-            )
-            row = result.fetchone()
+        row = await fetch_one(query, {"value": f"%{value}%"})
             
-            return JSONResponse(content={
-                "query": query,
-                "sample": row.feature if row else None
-            })
+        return JSONResponse(content={
+            "query": query,
+            "sample": row.feature if row else None
+        })
             
     except Exception as e:
         logger.error(f"Error en test_filter_format: {str(e)}")
@@ -377,26 +504,21 @@ async def test_filter_raw(layer: str, field: str, value: str):
             LIMIT 5;
         """
         
-        with spatial_service.engine.connect() as connection:
-            result = connection.execute(
-                text(query),
-                {"value": f"%{value}%"}
-            )
-            rows = result.fetchall()
+        rows = await fetch_all(query, {"value": f"%{value}%"})
             
-            return JSONResponse(content={
-                "query": query,
-                "params": {"value": f"%{value}%"},
-                "count": len(rows),
-                "sample": [
-                    {
-                        "id": row.id,
-                        "field_value": row.field_value,
-                        "geom_wkt": row.geom_wkt
-                    }
-                    for row in rows
-                ]
-            })
+        return JSONResponse(content={
+            "query": query,
+            "params": {"value": f"%{value}%"},
+            "count": len(rows),
+            "sample": [
+                {
+                    "id": row.id,
+                    "field_value": row.field_value,
+                    "geom_wkt": row.geom_wkt
+                }
+                for row in rows
+            ]
+        })
             
     except Exception as e:
         logger.error(f"Error en test_filter_raw: {str(e)}")
@@ -433,24 +555,19 @@ async def test_filter_json(layer: str, field: str, value: str):
             LIMIT 1;
         """
         
-        with spatial_service.engine.connect() as connection:
-            result = connection.execute(
-                text(query),
-                {"value": f"%{value}%"}
-            )
-            row = result.fetchone()
+        row = await fetch_one(query, {"value": f"%{value}%"})
             
-            if row:
-                return JSONResponse(content={
-                    "raw_values": {
-                        "id": row.id,
-                        "field_value": row.field_value,
-                        "geom_json": row.geom_json
-                    },
-                    "feature_json": row.feature_json,
-                    "parsed_feature": json.loads(row.feature_json) if row.feature_json else None
-                })
-            return JSONResponse(content={"message": "No se encontraron resultados"})
+        if row:
+            return JSONResponse(content={
+                "raw_values": {
+                    "id": row.id,
+                    "field_value": row.field_value,
+                    "geom_json": row.geom_json
+                },
+                "feature_json": row.feature_json,
+                "parsed_feature": json.loads(row.feature_json) if row.feature_json else None
+            })
+        return JSONResponse(content={"message": "No se encontraron resultados"})
             
     except Exception as e:
         logger.error(f"Error en test_filter_json: {str(e)}")
@@ -1,6 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from ...core.database import get_db
+from fastapi import APIRouter, HTTPException
 from ...services.statistics import StatisticsService
 from typing import Optional
 from datetime import date
@@ -14,8 +12,7 @@ async def get_statistics(
     level: str,
     geometry_id: str,
     start_date: Optional[date] = None,
-    end_date: Optional[date] = None,
-    db: Session = Depends(get_db)
+    end_date: Optional[date] = None
 ):
     """
     Obtiene estadísticas para una geometría específica
@@ -30,7 +27,7 @@ async def get_statistics(
                 detail="Nivel no válido"
             )
 
-        service = StatisticsService(db)
+        service = StatisticsService()
         result = await service.get_activity_statistics(
             level=level,
             geometry_id=geometry_id,
@@ -0,0 +1,48 @@
+from fastapi import APIRouter, Path, HTTPException
+from fastapi.responses import Response
+from ...services.spatial_analysis import SpatialAnalysisService
+import logging
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/tiles", tags=["tiles"])
+
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+MAX_ZOOM = 22
+# Las capas no cambian entre importaciones, así que nginx y el navegador pueden cachear
+TILE_CACHE_CONTROL = "public, max-age=3600"
+
+@router.get("/{layer}/{z}/{x}/{y}.mvt")
+async def get_tile(
+    layer: str = Path(..., description="Capa a renderizar: vias, rios_principales, municipios, etc"),
+    z: int = Path(..., ge=0, le=MAX_ZOOM),
+    x: int = Path(..., ge=0),
+    y: int = Path(..., ge=0)
+):
+    """Devuelve un tile vectorial (Mapbox Vector Tile) de la capa solicitada"""
+    spatial_service = SpatialAnalysisService()
+
+    if layer not in spatial_service.tile_layers:
+        raise HTTPException(status_code=404, detail=f"Capa no encontrada: {layer}")
+
+    max_index = 2 ** z - 1
+    if x > max_index or y > max_index:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Coordenadas de tile fuera de rango para zoom {z}"
+        )
+
+    try:
+        tile = await spatial_service.get_tile(layer, z, x, y)
+    except Exception as e:
+        logger.error(f"Error en get_tile endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error generando tile: {str(e)}")
+
+    # Un tile vacío se responde con 204 para que el cliente no lo reintente
+    if not tile:
+        return Response(status_code=204, headers={"Cache-Control": TILE_CACHE_CONTROL})
+
+    return Response(
+        content=tile,
+        media_type=MVT_MEDIA_TYPE,
+        headers={"Cache-Control": TILE_CACHE_CONTROL}
+    )
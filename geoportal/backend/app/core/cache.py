@@ -0,0 +1,135 @@
+import gzip
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate
+
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    brotli = None
+    BROTLI_AVAILABLE = False
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Campos de una entrada: metadatos en texto y cuerpos en bytes
+TEXT_FIELDS = ("version", "etag", "last_modified")
+BODY_FIELDS = ("body", "gzip", "br")
+
+
+class LayerCache:
+    """
+    Cache de respuestas serializadas de capas del geoportal.
+
+    Cada entrada guarda el JSON ya serializado (y sus versiones comprimidas)
+    junto con la versión de las tablas de origen. Vive en memoria del proceso
+    como LRU acotado a max_entries y, si se configura REDIS_URL, también en
+    Redis (como hash de bytes, sin pickle) para compartirla entre workers.
+    Las entradas vencen después de ttl segundos en ambos niveles.
+    """
+
+    def __init__(self, redis_url=None, prefix="geoportal:layer:", ttl=86400, max_entries=32):
+        self.prefix = prefix
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+
+        if redis_url and redis is not None:
+            try:
+                client = redis.Redis.from_url(redis_url, socket_timeout=2)
+                client.ping()
+                self._redis = client
+                logger.info("Cache de capas con Redis habilitado")
+            except Exception as e:
+                logger.warning(f"Redis no disponible para cache de capas: {str(e)}")
+
+    def get_from_memory(self, key, version):
+        """Busca solo en memoria; no bloquea, así que se puede llamar desde el event loop"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry["version"] == version and time.monotonic() - entry["creado"] < self.ttl:
+                    self._memory.move_to_end(key)
+                    return entry
+                del self._memory[key]
+        return None
+
+    def get(self, key, version):
+        """
+        Devuelve la entrada cacheada si corresponde a la versión indicada. Puede
+        consultar Redis, así que desde código async se ejecuta en un hilo.
+        """
+        entry = self.get_from_memory(key, version)
+        if entry is not None:
+            return entry
+
+        if self._redis is not None:
+            try:
+                raw = self._redis.hgetall(self.prefix + key)
+                if raw and raw.get(b"version", b"").decode("utf-8") == version:
+                    entry = {field: raw[field.encode()].decode("utf-8") for field in TEXT_FIELDS}
+                    entry.update({field: raw.get(field.encode()) for field in BODY_FIELDS})
+                    self._remember(key, entry)
+                    return entry
+            except Exception as e:
+                logger.warning(f"Error leyendo cache Redis para {key}: {str(e)}")
+        return None
+
+    def set(self, key, version, body: bytes):
+        """
+        Guarda el cuerpo serializado y precalcula ETag y versiones comprimidas.
+        Comprime y escribe en Redis: desde código async se ejecuta en un hilo.
+        """
+        entry = {
+            "version": version,
+            # Base del ETag; cada codificación lo sufija al construir la respuesta
+            "etag": hashlib.sha256(body).hexdigest()[:32],
+            "last_modified": formatdate(usegmt=True),
+            "body": body,
+            "gzip": gzip.compress(body, compresslevel=6),
+            "br": brotli.compress(body) if BROTLI_AVAILABLE else None,
+        }
+        self._remember(key, entry)
+
+        if self._redis is not None:
+            try:
+                mapping = {field: entry[field] for field in TEXT_FIELDS + BODY_FIELDS if entry[field] is not None}
+                pipeline = self._redis.pipeline()
+                pipeline.delete(self.prefix + key)
+                pipeline.hset(self.prefix + key, mapping=mapping)
+                pipeline.expire(self.prefix + key, self.ttl)
+                pipeline.execute()
+            except Exception as e:
+                logger.warning(f"Error guardando cache Redis para {key}: {str(e)}")
+        return entry
+
+    def _remember(self, key, entry):
+        """Guarda la entrada en memoria descartando las menos usadas"""
+        entry["creado"] = time.monotonic()
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def clear(self):
+        """Vacía el cache en memoria (las entradas de Redis se invalidan por versión)"""
+        with self._lock:
+            self._memory.clear()
+
+
+layer_cache = LayerCache(
+    os.getenv("REDIS_URL"),
+    max_entries=int(os.getenv("LAYER_CACHE_ENTRIES", "32"))
+)
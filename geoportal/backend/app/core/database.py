@@ -1,9 +1,21 @@
 from sqlalchemy import create_engine, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool, iterate_in_threadpool
 from dotenv import load_dotenv
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
+try:
+    from sqlalchemy.ext.asyncio import create_async_engine
+    import asyncpg  # noqa: F401  (driver requerido por postgresql+asyncpg)
+    ASYNC_DRIVER_AVAILABLE = True
+except ImportError:
+    create_async_engine = None
+    ASYNC_DRIVER_AVAILABLE = False
+
 load_dotenv()
 
 # Configuración de la base de datos
@@ -15,6 +27,7 @@ DB_NAME = os.getenv("DB_NAME", "bd_actividades_historicas")
 
 # Construir URL con parámetros adicionales para codificación
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
 try:
     engine = create_engine(
@@ -62,4 +75,87 @@ def get_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close() 
+
+# Engine asíncrono para las consultas de los endpoints: no bloquea el event loop,
+# así una consulta lenta no detiene las demás peticiones del worker
+async_engine = None
+if ASYNC_DRIVER_AVAILABLE:
+    try:
+        async_engine = create_async_engine(
+            ASYNC_DATABASE_URL,
+            pool_pre_ping=True,
+            connect_args={
+                'server_settings': {
+                    'client_encoding': 'utf8',
+                    'search_path': 'public'
+                }
+            }
+        )
+        print("✅ Engine asíncrono (asyncpg) configurado")
+    except Exception as e:
+        logger.warning(f"No se pudo crear el engine asíncrono, se usará el síncrono en un threadpool: {str(e)}")
+else:
+    logger.warning("asyncpg no está instalado, las consultas se ejecutarán en un threadpool")
+
+def _execute_sync(query: str, params: dict, mode: str):
+    with engine.connect() as connection:
+        result = connection.execute(text(query), params)
+        if mode == "scalar":
+            return result.scalar()
+        if mode == "one":
+            return result.fetchone()
+        return result.fetchall()
+
+async def _execute(query: str, params: dict = None, mode: str = "all"):
+    params = params or {}
+    if async_engine is None:
+        return await run_in_threadpool(_execute_sync, query, params, mode)
+
+    async with async_engine.connect() as connection:
+        result = await connection.execute(text(query), params)
+        if mode == "scalar":
+            return result.scalar()
+        if mode == "one":
+            return result.fetchone()
+        return result.fetchall()
+
+async def fetch_all(query: str, params: dict = None):
+    """Ejecuta una consulta de lectura sin bloquear el event loop y devuelve todas las filas"""
+    return await _execute(query, params, "all")
+
+async def fetch_one(query: str, params: dict = None):
+    """Ejecuta una consulta de lectura sin bloquear el event loop y devuelve la primera fila"""
+    return await _execute(query, params, "one")
+
+async def fetch_scalar(query: str, params: dict = None):
+    """Ejecuta una consulta de lectura sin bloquear el event loop y devuelve un valor"""
+    return await _execute(query, params, "scalar")
+
+def _stream_sync(query: str, params: dict, batch_size: int):
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True, max_row_buffer=batch_size).execute(
+            text(query), params
+        )
+        for partition in result.partitions(batch_size):
+            yield partition
+
+async def stream_rows(query: str, params: dict = None, batch_size: int = 500):
+    """
+    Recorre el resultado de una consulta con un cursor del servidor, en lotes de
+    batch_size filas, sin cargar el resultado completo en memoria
+    """
+    params = params or {}
+    if async_engine is None:
+        async for partition in iterate_in_threadpool(_stream_sync(query, params, batch_size)):
+            yield partition
+        return
+
+    async with async_engine.connect() as connection:
+        result = await connection.stream(text(query), params)
+        async for partition in result.partitions(batch_size):
+            yield partition
+
+async def run_blocking(func, *args, **kwargs):
+    """Ejecuta código síncrono (GeoPandas, ORM) en un threadpool"""
+    return await run_in_threadpool(func, *args, **kwargs)
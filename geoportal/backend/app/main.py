@@ -4,6 +4,7 @@ from .core.database import engine, Base
 from .api.endpoints import spatial, geometries
 from .api.endpoints.statistics import router as statistics_router
 from .api.endpoints.geometries import router as geometries_router
+from .api.endpoints.tiles import router as tiles_router
 import logging
 
 # Crear todas las tablas
@@ -32,6 +33,7 @@ app.add_middleware(
 app.include_router(spatial.router, prefix="/api", tags=["spatial"])
 app.include_router(geometries_router, prefix="/api")
 app.include_router(statistics_router, prefix="/api")
+app.include_router(tiles_router, prefix="/api")
 
 
 @app.get("/")
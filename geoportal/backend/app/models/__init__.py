@@ -1,3 +1,3 @@
-from .models import Activity, MunicipalActivity, DepartmentalActivity
+from .models import Activity, MunicipalActivity, DepartmentalActivity, LimiteMunicipal, LimiteDepartamental
 
-__all__ = ['Activity', 'MunicipalActivity', 'DepartmentalActivity'] 
\ No newline at end of file
+__all__ = ['Activity', 'MunicipalActivity', 'DepartmentalActivity', 'LimiteMunicipal', 'LimiteDepartamental'] 
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
 from sqlalchemy.ext.declarative import declarative_base
 from geoalchemy2 import Geometry
 
@@ -29,13 +29,31 @@ class Activity(Base):
     class Config:
         orm_mode = True
 
+class LimiteDepartamental(Base):
+    __tablename__ = 'limites_departamentos'
+
+    cod_depto = Column(String, primary_key=True)
+    id = Column(Integer, unique=True)
+    departamento = Column(String)
+    geometry = Column(Geometry('GEOMETRY', srid=4326))
+
+class LimiteMunicipal(Base):
+    __tablename__ = 'limites_municipios'
+
+    cod_mpio = Column(String, primary_key=True)
+    id = Column(Integer, unique=True)
+    cod_depto = Column(String, ForeignKey('limites_departamentos.cod_depto'))
+    municipio = Column(String)
+    departamento = Column(String)
+    geometry = Column(Geometry('GEOMETRY', srid=4326))
+
 class MunicipalActivity(Base):
     __tablename__ = 'actividades_municipios'
 
     id = Column(Integer, primary_key=True)
     municipio = Column(String)
     departamento = Column(String)
-    geometry = Column(Geometry('GEOMETRY', srid=4326))
+    cod_mpio = Column(String, ForeignKey('limites_municipios.cod_mpio'))
     total_actividades = Column(Integer)
 
 class DepartmentalActivity(Base):
@@ -43,7 +61,7 @@ class DepartmentalActivity(Base):
 
     id = Column(Integer, primary_key=True)
     departamento = Column(String)
-    geometry = Column(Geometry('GEOMETRY', srid=4326))
+    cod_depto = Column(String, ForeignKey('limites_departamentos.cod_depto'))
     total_actividades = Column(Integer)
 
 class PuntoEncuentro(Base):
@@ -8,29 +8,36 @@ router = APIRouter()
 async def get_geometries(level: str):
     db = get_db()
     try:
-        # Seleccionar la tabla según el nivel
+        # Seleccionar la tabla según el nivel; las geometrías administrativas
+        # vienen de las tablas de límites, unidas por código DANE
         if level == "departamentos":
             table = "actividades_departamentos"
-            group_by = "departamento"
+            group_by = "cod_depto"
+            geometry_join = "JOIN limites_departamentos l ON l.cod_depto = t.cod_depto"
         elif level == "municipios":
             table = "actividades_municipios"
-            group_by = "municipio"
+            group_by = "cod_mpio"
+            geometry_join = "JOIN limites_municipios l ON l.cod_mpio = t.cod_mpio"
         else:
             table = "actividades"
             group_by = "ubicacion"
+            geometry_join = ""
+
+        geometry_source = "l.geometry" if geometry_join else "t.geometry"
 
         # Consulta SQL para obtener las geometrías únicas
         query = text(f"""
-            SELECT DISTINCT ON ({group_by})
-                id,
-                departamento,
-                municipio,
-                ubicacion,
-                zona_geografica,
-                ST_AsGeoJSON(geometry)::json as geometry
-            FROM {table}
-            WHERE geometry IS NOT NULL
-            ORDER BY {group_by}, fecha DESC
+            SELECT DISTINCT ON (t.{group_by})
+                t.id,
+                t.departamento,
+                t.municipio,
+                t.ubicacion,
+                t.zona_geografica,
+                ST_AsGeoJSON({geometry_source})::json as geometry
+            FROM {table} t
+            {geometry_join}
+            WHERE {geometry_source} IS NOT NULL
+            ORDER BY t.{group_by}, t.fecha DESC
         """)
 
         result = db.execute(query)
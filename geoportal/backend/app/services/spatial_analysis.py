@@ -1,26 +1,26 @@
 import geopandas as gpd
-from sqlalchemy import text
-from ..models.models import Activity, MunicipalActivity, DepartmentalActivity
-from ..core.database import engine  # Importar el engine directamente
+from ..core.database import engine, fetch_all, fetch_one, fetch_scalar, run_blocking
 import logging
 import json
 from shapely import wkb
 import pandas as pd
 from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from geoalchemy2.shape import to_shape
-from shapely.geometry import mapping
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Tolerancia usada históricamente por la API cuando no se indica zoom ni tolerancia
+DEFAULT_SIMPLIFY_TOLERANCE = 0.001
+
+# Tolerancias de la pirámide por capa, junto con la versión de las tablas con que se leyeron
+_pyramid_tolerances = {}
+
 class SpatialAnalysisService:
     def __init__(self):
         self.engine = engine  # Usar el engine global
         self.table_mappings = {
-            'departamentos': 'actividades_departamentos',
-            'municipios': 'actividades_municipios',
+            'departamentos': 'limites_departamentos',
+            'municipios': 'limites_municipios',
             'veredas': 'actividades',
             'puntos_encuentro': 'puntos_encuentro',
             'senales_evacuacion': 'senales_evacuacion',
@@ -33,6 +33,107 @@ class SpatialAnalysisService:
             'rios_principales': 'rios_principales',
             'vias': 'vias'
         }
+        # Atributos que viajan en cada tile vectorial y filtro base por capa
+        self.tile_layers = {
+            'departamentos': {
+                'columns': ['cod_depto', 'departamento']
+            },
+            'municipios': {
+                'columns': ['cod_mpio', 'cod_depto', 'municipio', 'departamento']
+            },
+            'veredas': {
+                'columns': ['grupo_interes', 'municipio', 'departamento'],
+                'where': "tipo_geometria = 'vereda'"
+            },
+            'puntos_encuentro': {
+                'columns': ['id', 'nombre_pe', 'codigo_pe', 'nombre_mun',
+                            'ruta_de_evacuacion', 'tiempo_de_llegada', 'recorrido_maximo']
+            },
+            'senales_evacuacion': {
+                'columns': ['id', 'tipo_señal', 'cod_señal', 'nombre_mun', 'nombre_sec',
+                            'estado', 'cod_pe', 'cod_sector', 'jurisdiccion']
+            },
+            'rutas_evacuacion': {
+                'columns': ['id', 'estado_rut', 'nombre_rut', 'nombre_mun', 'nombre_sec',
+                            'cod_ruta', 'longitud_rut', 'tiempo_rut', 'codigo_pe',
+                            'descrip_rut', 'orden_geo_re', 'cod_sector']
+            },
+            'drenaje_doble': {'columns': ['id']},
+            'drenaje_sencillo': {'columns': ['id']},
+            'mancha_inundacion': {'columns': ['id']},
+            'embalse': {'columns': ['id']},
+            'obra_principal': {'columns': ['id']},
+            'rios_principales': {'columns': ['id', 'nombre_geografico']},
+            'vias': {'columns': ['id', 'tipo_via']}
+        }
+
+    async def get_layer_version(self, level: str) -> str:
+        """
+        Devuelve una versión barata de las tablas de origen de la capa, basada en el
+        OID de la tabla y el contador de filas modificadas de pg_stat_user_tables.
+        Cambia cuando la tabla se recrea o se inserta/actualiza/borra algún registro.
+        """
+        table_name = self.table_mappings.get(level)
+        if not table_name:
+            raise ValueError(f"Capa no encontrada: {level}")
+
+        tables = [table_name]
+        if level in ('departamentos', 'municipios', 'veredas'):
+            tables.append('geometrias_simplificadas')
+
+        query = """
+            SELECT string_agg(
+                relid::text || ':' || (n_tup_ins + n_tup_upd + n_tup_del)::text,
+                ',' ORDER BY relname
+            )
+            FROM pg_stat_user_tables
+            WHERE relname = ANY(:tables);
+        """
+        version = await fetch_scalar(query, {"tables": tables})
+        return version or ""
+
+    async def get_tile(self, layer: str, z: int, x: int, y: int) -> bytes:
+        """Genera un tile vectorial (MVT) de la capa para las coordenadas z/x/y"""
+        table_name = self.table_mappings.get(layer)
+        tile_config = self.tile_layers.get(layer)
+        if not table_name or not tile_config:
+            raise ValueError(f"Capa no encontrada: {layer}")
+
+        columns = ", ".join(f"t.{column}" for column in tile_config['columns'])
+        extra_where = f"AND {tile_config['where']}" if tile_config.get('where') else ""
+
+        # ST_TileEnvelope devuelve el tile en EPSG:3857; el filtro espacial se hace en
+        # EPSG:4326 para aprovechar el índice GiST de la columna geometry
+        query = f"""
+            WITH bounds AS (
+                SELECT
+                    ST_TileEnvelope(:z, :x, :y) AS geom_3857,
+                    ST_Transform(ST_TileEnvelope(:z, :x, :y), 4326) AS geom_4326
+            ),
+            mvtgeom AS (
+                SELECT
+                    ST_AsMVTGeom(
+                        ST_Transform(t.geometry, 3857),
+                        bounds.geom_3857,
+                        4096, 64, true
+                    ) AS geom,
+                    {columns}
+                FROM {table_name} t, bounds
+                WHERE t.geometry IS NOT NULL
+                AND t.geometry && bounds.geom_4326
+                {extra_where}
+            )
+            SELECT ST_AsMVT(mvtgeom.*, :layer, 4096, 'geom') AS tile
+            FROM mvtgeom
+            WHERE geom IS NOT NULL;
+        """
+
+        try:
+            result = await fetch_scalar(query, {"z": z, "x": x, "y": y, "layer": layer})
+            return bytes(result) if result else b""
+        except Exception as e:
+            logger.error(f"Error generando tile {layer}/{z}/{x}/{y}: {str(e)}")
+            raise e
 
     async def get_geometries(self, level='departamentos', filters=None):
         """Obtiene las geometrías según el nivel especificado"""
@@ -55,23 +156,41 @@ class SpatialAnalysisService:
             }
 
             if level in admin_layers:
-                # Mantener la lógica existente para capas administrativas
+                # Usar la pirámide precalculada si existe; si no, simplificar al vuelo
+                tolerance = self._resolve_tolerance(
+                    (filters or {}).get('zoom'),
+                    (filters or {}).get('tolerance')
+                )
+                geojson = await self._get_simplified_geometries(level, tolerance)
+                if geojson is not None:
+                    return geojson
+
                 if level == 'departamentos':
                     query = """
                         SELECT 
-                            departamento as nombre,
-                            ST_AsGeoJSON(ST_SimplifyPreserveTopology(geometry, 0.001))::json as geom
-                        FROM actividades_departamentos
-                        GROUP BY departamento, geometry;
+                            d.departamento as nombre,
+                            ST_AsGeoJSON(ST_SimplifyPreserveTopology(l.geometry, 0.001))::json as geom
+                        FROM (
+                            SELECT cod_depto, MIN(departamento) as departamento
+                            FROM actividades_departamentos
+                            WHERE cod_depto IS NOT NULL
+                            GROUP BY cod_depto
+                        ) d
+                        JOIN limites_departamentos l ON l.cod_depto = d.cod_depto;
                     """
                 elif level == 'municipios':
                     query = """
                         SELECT 
-                            municipio as nombre,
-                            departamento,
-                            ST_AsGeoJSON(ST_SimplifyPreserveTopology(geometry, 0.001))::json as geom
-                        FROM actividades_municipios
-                        GROUP BY municipio, departamento, geometry;
+                            m.municipio as nombre,
+                            m.departamento,
+                            ST_AsGeoJSON(ST_SimplifyPreserveTopology(l.geometry, 0.001))::json as geom
+                        FROM (
+                            SELECT cod_mpio, MIN(municipio) as municipio, MIN(departamento) as departamento
+                            FROM actividades_municipios
+                            WHERE cod_mpio IS NOT NULL
+                            GROUP BY cod_mpio
+                        ) m
+                        JOIN limites_municipios l ON l.cod_mpio = m.cod_mpio;
                     """
                 else:  # veredas
                     query = """
@@ -111,23 +230,21 @@ class SpatialAnalysisService:
                         WHERE geometry IS NOT NULL;
                     """
                     
-                    with self.engine.connect() as connection:
-                        try:
-                            result = connection.execute(text(query))
-                            row = result.fetchone()
+                    try:
+                        row = await fetch_one(query)
                             
-                            if row and row.geojson:
-                                logger.info(f"Datos obtenidos para puntos_encuentro: {row.geojson}")
-                                return row.geojson
+                        if row and row.geojson:
+                            logger.info(f"Datos obtenidos para puntos_encuentro: {row.geojson}")
+                            return row.geojson
                             
-                            logger.warning("No se encontraron puntos de encuentro")
-                            return {
-                                "type": "FeatureCollection",
-                                "features": []
-                            }
-                        except Exception as e:
-                            logger.error(f"Error procesando puntos de encuentro: {str(e)}")
-                            raise e
+                        logger.warning("No se encontraron puntos de encuentro")
+                        return {
+                            "type": "FeatureCollection",
+                            "features": []
+                        }
+                    except Exception as e:
+                        logger.error(f"Error procesando puntos de encuentro: {str(e)}")
+                        raise e
                 elif level == 'senales_evacuacion':
                     query = """
                         SELECT 
@@ -155,23 +272,21 @@ class SpatialAnalysisService:
                         WHERE geometry IS NOT NULL;
                     """
                     
-                    with self.engine.connect() as connection:
-                        try:
-                            result = connection.execute(text(query))
-                            row = result.fetchone()
+                    try:
+                        row = await fetch_one(query)
                             
-                            if row and row.geojson:
-                                logger.info(f"Datos obtenidos para senales_evacuacion: {row.geojson}")
-                                return row.geojson
+                        if row and row.geojson:
+                            logger.info(f"Datos obtenidos para senales_evacuacion: {row.geojson}")
+                            return row.geojson
                             
-                            logger.warning("No se encontraron señales de evacuación")
-                            return {
-                                "type": "FeatureCollection",
-                                "features": []
-                            }
-                        except Exception as e:
-                            logger.error(f"Error procesando señales de evacuación: {str(e)}")
-                            raise e
+                        logger.warning("No se encontraron señales de evacuación")
+                        return {
+                            "type": "FeatureCollection",
+                            "features": []
+                        }
+                    except Exception as e:
+                        logger.error(f"Error procesando señales de evacuación: {str(e)}")
+                        raise e
                 elif level == 'rutas_evacuacion':
                     query = """
                         SELECT 
@@ -202,23 +317,21 @@ class SpatialAnalysisService:
                         WHERE geometry IS NOT NULL;
                     """
                     
-                    with self.engine.connect() as connection:
-                        try:
-                            result = connection.execute(text(query))
-                            row = result.fetchone()
+                    try:
+                        row = await fetch_one(query)
                             
-                            if row and row.geojson:
-                                logger.info(f"Datos obtenidos para rutas_evacuacion: {row.geojson}")
-                                return row.geojson
+                        if row and row.geojson:
+                            logger.info(f"Datos obtenidos para rutas_evacuacion: {row.geojson}")
+                            return row.geojson
                             
-                            logger.warning("No se encontraron rutas de evacuación")
-                            return {
-                                "type": "FeatureCollection",
-                                "features": []
-                            }
-                        except Exception as e:
-                            logger.error(f"Error procesando rutas de evacuación: {str(e)}")
-                            raise e
+                        logger.warning("No se encontraron rutas de evacuación")
+                        return {
+                            "type": "FeatureCollection",
+                            "features": []
+                        }
+                    except Exception as e:
+                        logger.error(f"Error procesando rutas de evacuación: {str(e)}")
+                        raise e
                 elif level == 'rios_principales':
                     query = """
                         SELECT json_build_object(
@@ -241,24 +354,22 @@ class SpatialAnalysisService:
                         WHERE geometry IS NOT NULL;
                     """
                     
-                    with self.engine.connect() as connection:
-                        try:
-                            result = connection.execute(text(query))
-                            row = result.fetchone()
+                    try:
+                        row = await fetch_one(query)
                             
-                            if row and row.geojson:
-                                logger.info(f"Datos obtenidos para rios_principales")
-                                return row.geojson
+                        if row and row.geojson:
+                            logger.info(f"Datos obtenidos para rios_principales")
+                            return row.geojson
                             
-                            logger.warning("No se encontraron ríos principales")
-                            return {
-                                "type": "FeatureCollection",
-                                "features": []
-                            }
-                        except Exception as e:
-                            logger.error(f"Error procesando rios_principales: {str(e)}")
-                            logger.error(f"Query: {query}")
-                            raise e
+                        logger.warning("No se encontraron ríos principales")
+                        return {
+                            "type": "FeatureCollection",
+                            "features": []
+                        }
+                    except Exception as e:
+                        logger.error(f"Error procesando rios_principales: {str(e)}")
+                        logger.error(f"Query: {query}")
+                        raise e
                 elif level == 'vias':
                     query = """
                         SELECT json_build_object(
@@ -281,24 +392,22 @@ class SpatialAnalysisService:
                         WHERE geometry IS NOT NULL;
                     """
                     
-                    with self.engine.connect() as connection:
-                        try:
-                            result = connection.execute(text(query))
-                            row = result.fetchone()
+                    try:
+                        row = await fetch_one(query)
                             
-                            if row and row.geojson:
-                                logger.info(f"Datos obtenidos para vias")
-                                return row.geojson
+                        if row and row.geojson:
+                            logger.info(f"Datos obtenidos para vias")
+                            return row.geojson
                             
-                            logger.warning("No se encontraron vías")
-                            return {
-                                "type": "FeatureCollection",
-                                "features": []
-                            }
-                        except Exception as e:
-                            logger.error(f"Error procesando vias: {str(e)}")
-                            logger.error(f"Query: {query}")
-                            raise e
+                        logger.warning("No se encontraron vías")
+                        return {
+                            "type": "FeatureCollection",
+                            "features": []
+                        }
+                    except Exception as e:
+                        logger.error(f"Error procesando vias: {str(e)}")
+                        logger.error(f"Query: {query}")
+                        raise e
                 else:
                     # Mantener consulta original para otras capas operativas
                     query = f"""
@@ -312,47 +421,45 @@ class SpatialAnalysisService:
 
             logger.info(f"Ejecutando consulta para {level}")
             
-            with self.engine.connect() as connection:
-                try:
-                    result = connection.execute(text(query))
-                    rows = result.fetchall()
+            try:
+                rows = await fetch_all(query)
                     
-                    features = []
-                    for row in rows:
-                        if level in admin_layers:
-                            # Propiedades para capas administrativas
-                            properties = {
-                                "nombre": row.nombre,
-                                **({"departamento": row.departamento} if hasattr(row, 'departamento') else {}),
-                                **({"municipio": row.municipio} if hasattr(row, 'municipio') else {})
-                            }
-                        else:
-                            # Para capas operativas, solo incluir un id genérico
-                            properties = {"id": len(features) + 1}
-                        
-                        feature = {
-                            "type": "Feature",
-                            "properties": properties,
-                            "geometry": row.geom
+                features = []
+                for row in rows:
+                    if level in admin_layers:
+                        # Propiedades para capas administrativas
+                        properties = {
+                            "nombre": row.nombre,
+                            **({"departamento": row.departamento} if hasattr(row, 'departamento') else {}),
+                            **({"municipio": row.municipio} if hasattr(row, 'municipio') else {})
                         }
-                        features.append(feature)
-
-                    geojson = {
-                        "type": "FeatureCollection",
-                        "features": features
+                    else:
+                        # Para capas operativas, solo incluir un id genérico
+                        properties = {"id": len(features) + 1}
+                        
+                    feature = {
+                        "type": "Feature",
+                        "properties": properties,
+                        "geometry": row.geom
                     }
+                    features.append(feature)
+
+                geojson = {
+                    "type": "FeatureCollection",
+                    "features": features
+                }
                     
-                    logger.info(f"GeoJSON generado con {len(features)} features para {level}")
-                    logger.debug(f"Ejemplo de feature: {features[0] if features else 'No features'}")
+                logger.info(f"GeoJSON generado con {len(features)} features para {level}")
+                logger.debug(f"Ejemplo de feature: {features[0] if features else 'No features'}")
                     
-                    return geojson
+                return geojson
 
-                except Exception as e:
-                    logger.error(f"Error ejecutando consulta para {level}: {str(e)}")
-                    return {
-                        "type": "FeatureCollection",
-                        "features": []
-                    }
+            except Exception as e:
+                logger.error(f"Error ejecutando consulta para {level}: {str(e)}")
+                return {
+                    "type": "FeatureCollection",
+                    "features": []
+                }
 
         except Exception as e:
             logger.error(f"Error en get_geometries para {level}: {str(e)}")
@@ -361,49 +468,148 @@ class SpatialAnalysisService:
                 "features": []
             }
 
+    def _resolve_tolerance(self, zoom=None, tolerance=None):
+        """Traduce el zoom del mapa (o una tolerancia explícita) a grados de simplificación"""
+        if tolerance is not None:
+            return float(tolerance)
+        if zoom is not None:
+            # Tamaño aproximado de un píxel en grados para tiles de 256px
+            return 360.0 / (256 * 2 ** int(zoom))
+        return DEFAULT_SIMPLIFY_TOLERANCE
+
+    async def get_cache_variant(self, level, version, zoom=None, tolerance=None) -> str:
+        """
+        Distingue las respuestas de get_geometries para una misma capa: el nivel
+        de la pirámide que se serviría para el zoom o la tolerancia pedidos. Las
+        capas operativas y las administrativas sin pirámide no dependen de ellos.
+        """
+        if level not in ('departamentos', 'municipios', 'veredas'):
+            return ""
+
+        cached = _pyramid_tolerances.get(level)
+        if cached is None or cached[0] != version:
+            tolerancias = []
+            if await fetch_scalar("SELECT to_regclass('public.geometrias_simplificadas') IS NOT NULL"):
+                rows = await fetch_all(
+                    "SELECT DISTINCT tolerancia FROM geometrias_simplificadas WHERE capa = :capa;",
+                    {"capa": level}
+                )
+                tolerancias = sorted(float(row.tolerancia) for row in rows)
+            cached = (version, tolerancias)
+            _pyramid_tolerances[level] = cached
+
+        tolerancias = cached[1]
+        if not tolerancias:
+            return "base"
+        # Mismo criterio que _get_simplified_geometries
+        solicitada = self._resolve_tolerance(zoom, tolerance)
+        aplicables = [t for t in tolerancias if t <= solicitada]
+        return repr(max(aplicables) if aplicables else tolerancias[0])
+
+    async def _get_simplified_geometries(self, level, tolerance):
+        """
+        Lee las geometrías administrativas del nivel de la pirámide más simple cuya
+        tolerancia no supere la solicitada. Devuelve None si la pirámide no existe.
+        """
+        query = """
+            SELECT
+                nombre,
+                municipio,
+                departamento,
+                ST_AsGeoJSON(geometry)::json as geom
+            FROM geometrias_simplificadas
+            WHERE capa = :capa
+            AND geometry IS NOT NULL
+            AND tolerancia = (
+                SELECT COALESCE(
+                    MAX(tolerancia) FILTER (WHERE tolerancia <= :tolerancia),
+                    MIN(tolerancia)
+                )
+                FROM geometrias_simplificadas
+                WHERE capa = :capa
+            );
+        """
+
+        exists = await fetch_scalar("SELECT to_regclass('public.geometrias_simplificadas') IS NOT NULL")
+        if not exists:
+            logger.warning("Tabla geometrias_simplificadas no encontrada, se simplifica al vuelo")
+            return None
+
+        rows = await fetch_all(query, {"capa": level, "tolerancia": tolerance})
+
+        if not rows:
+            return None
+
+        features = []
+        for row in rows:
+            properties = {"nombre": row.nombre}
+            if level in ('municipios', 'veredas'):
+                properties["departamento"] = row.departamento
+            if level == 'veredas':
+                properties["municipio"] = row.municipio
+            features.append({
+                "type": "Feature",
+                "properties": properties,
+                "geometry": row.geom
+            })
+
+        logger.info(f"GeoJSON generado con {len(features)} features para {level} (tolerancia {tolerance})")
+        return {
+            "type": "FeatureCollection",
+            "features": features
+        }
+
     async def get_geometries_with_filters(self, level: str, filters: dict):
         """Obtiene las geometrías según el nivel y filtros especificados"""
         try:
+            # Filtros sobre las actividades; las geometrías se unen después por clave
+            conditions = ""
+            params = {'nivel': level}
+            if filters.get('start_date'):
+                conditions += " AND fecha >= :start_date"
+                params['start_date'] = filters['start_date']
+            if filters.get('end_date'):
+                conditions += " AND fecha <= :end_date"
+                params['end_date'] = filters['end_date']
+
             if level == 'departamentos':
-                query = """
-                SELECT d.departamento, d.geometry, COUNT(*) as total_actividades
-                FROM actividades_departamentos d
-                JOIN actividades a ON d.departamento = a.departamento
-                WHERE 1=1
+                query = f"""
+                SELECT a.departamento, l.geometry, a.total_actividades
+                FROM (
+                    SELECT cod_depto, MIN(departamento) as departamento, COUNT(*) as total_actividades
+                    FROM actividades_departamentos
+                    WHERE cod_depto IS NOT NULL
+                    {conditions}
+                    GROUP BY cod_depto
+                ) a
+                JOIN limites_departamentos l ON l.cod_depto = a.cod_depto
                 """
             elif level == 'municipios':
-                query = """
-                SELECT m.municipio, m.departamento, m.geometry, COUNT(*) as total_actividades
-                FROM actividades_municipios m
-                JOIN actividades a ON m.municipio = a.municipio
-                WHERE 1=1
+                query = f"""
+                SELECT a.municipio, a.departamento, l.geometry, a.total_actividades
+                FROM (
+                    SELECT cod_mpio, MIN(municipio) as municipio, MIN(departamento) as departamento,
+                           COUNT(*) as total_actividades
+                    FROM actividades_municipios
+                    WHERE cod_mpio IS NOT NULL
+                    {conditions}
+                    GROUP BY cod_mpio
+                ) a
+                JOIN limites_municipios l ON l.cod_mpio = a.cod_mpio
                 """
             else:  # veredas o cabeceras
-                query = """
+                query = f"""
                 SELECT ubicacion, tipo_geometria, geometry, COUNT(*) as total_actividades
                 FROM actividades
                 WHERE tipo_geometria = :nivel
+                {conditions}
+                GROUP BY ubicacion, tipo_geometria, geometry
                 """
 
-            # Aplicar filtros
-            params = {'nivel': level}
-            if filters.get('start_date'):
-                query += " AND fecha >= :start_date"
-                params['start_date'] = filters['start_date']
-            if filters.get('end_date'):
-                query += " AND fecha <= :end_date"
-                params['end_date'] = filters['end_date']
-            
-            # Agrupar por geometría
-            if level == 'departamentos':
-                query += " GROUP BY d.departamento, d.geometry"
-            elif level == 'municipios':
-                query += " GROUP BY m.municipio, m.departamento, m.geometry"
-            else:
-                query += " GROUP BY ubicacion, tipo_geometria, geometry"
-
-            # Leer datos con GeoPandas
-            gdf = gpd.read_postgis(query, self.engine, geom_col='geometry', params=params)
+            # GeoPandas solo trabaja con el engine síncrono: se lee en un threadpool
+            gdf = await run_blocking(
+                gpd.read_postgis, query, self.engine, geom_col='geometry', params=params
+            )
             return gdf
 
         except Exception as e:
@@ -427,60 +633,56 @@ class SpatialAnalysisService:
                 );
             """
             
-            with self.engine.connect() as connection:
-                result = connection.execute(
-                    text(check_query), 
-                    {"table_name": table_name}
-                ).scalar()
+            result = await fetch_scalar(check_query, {"table_name": table_name})
                 
-                if not result:
-                    logger.error(f"Tabla no encontrada: {table_name}")
-                    raise ValueError(f"Tabla no encontrada: {table_name}")
-
-                # Obtener campos - consulta simplificada
-                query = """
-                    SELECT 
-                        column_name,
-                        data_type
-                    FROM information_schema.columns
-                    WHERE table_name = :table_name
-                    AND column_name NOT IN ('id', 'geometry')
-                    ORDER BY ordinal_position;
-                """
+            if not result:
+                logger.error(f"Tabla no encontrada: {table_name}")
+                raise ValueError(f"Tabla no encontrada: {table_name}")
+
+            # Obtener campos - consulta simplificada
+            query = """
+                SELECT 
+                    column_name,
+                    data_type
+                FROM information_schema.columns
+                WHERE table_name = :table_name
+                AND column_name NOT IN ('id', 'geometry')
+                ORDER BY ordinal_position;
+            """
                 
-                result = connection.execute(text(query), {"table_name": table_name})
+            result = await fetch_all(query, {"table_name": table_name})
                 
-                # Mapeo de nombres amigables para los campos
-                field_labels = {
-                    'departamento': 'Departamento',
-                    'municipio': 'Municipio',
-                    'cod_depto': 'Código DANE Departamento',
-                    'cod_mpio': 'Código DANE Municipio',
-                    'nombre': 'Nombre',
-                    'grupo_interes': 'Grupo de Interés',
-                    'nombre_pe': 'Nombre Punto',
-                    'codigo_pe': 'Código',
-                    'nombre_mun': 'Municipio',
-                    'tipo_señal': 'Tipo de Señal',
-                    'cod_señal': 'Código Señal',
-                    'estado': 'Estado',
-                    'nombre_rut': 'Nombre Ruta',
-                    'estado_rut': 'Estado',
-                    'tiempo_rut': 'Tiempo',
-                    'longitud_rut': 'Longitud'
-                }
+            # Mapeo de nombres amigables para los campos
+            field_labels = {
+                'departamento': 'Departamento',
+                'municipio': 'Municipio',
+                'cod_depto': 'Código DANE Departamento',
+                'cod_mpio': 'Código DANE Municipio',
+                'nombre': 'Nombre',
+                'grupo_interes': 'Grupo de Interés',
+                'nombre_pe': 'Nombre Punto',
+                'codigo_pe': 'Código',
+                'nombre_mun': 'Municipio',
+                'tipo_señal': 'Tipo de Señal',
+                'cod_señal': 'Código Señal',
+                'estado': 'Estado',
+                'nombre_rut': 'Nombre Ruta',
+                'estado_rut': 'Estado',
+                'tiempo_rut': 'Tiempo',
+                'longitud_rut': 'Longitud'
+            }
 
-                fields = [
-                    {
-                        "id": row.column_name,
-                        "label": field_labels.get(row.column_name, row.column_name.replace('_', ' ').title()),
-                        "type": row.data_type
-                    }
-                    for row in result
-                ]
+            fields = [
+                {
+                    "id": row.column_name,
+                    "label": field_labels.get(row.column_name, row.column_name.replace('_', ' ').title()),
+                    "type": row.data_type
+                }
+                for row in result
+            ]
                 
-                logger.info(f"Campos obtenidos para {table_name}: {fields}")
-                return fields
+            logger.info(f"Campos obtenidos para {table_name}: {fields}")
+            return fields
                 
         except Exception as e:
             logger.error(f"Error obteniendo campos de {layer_name}: {str(e)}")
@@ -501,10 +703,9 @@ class SpatialAnalysisService:
                 ORDER BY {field_name};
             """
             
-            with self.engine.connect() as connection:
-                result = connection.execute(text(query))
-                values = [row[0] for row in result]
-                return values
+            result = await fetch_all(query)
+            values = [row[0] for row in result]
+            return values
         except Exception as e:
             logger.error(f"Error obteniendo valores de {field_name}: {str(e)}")
             raise e
@@ -515,21 +716,16 @@ class SpatialAnalysisService:
             # Formatear la consulta reemplazando el campo
             query = query_template.format(field=field)
             
-            with self.engine.connect() as connection:
-                result = connection.execute(
-                    text(query),
-                    {"value": value}
-                )
-                row = result.fetchone()
+            row = await fetch_one(query, {"value": value})
                 
-                if row and row.geojson:
-                    return row.geojson
+            if row and row.geojson:
+                return row.geojson
                 
-                # Si no hay resultados, devolver una colección vacía
-                return {
-                    "type": "FeatureCollection",
-                    "features": []
-                }
+            # Si no hay resultados, devolver una colección vacía
+            return {
+                "type": "FeatureCollection",
+                "features": []
+            }
                 
         except Exception as e:
             logger.error(f"Error ejecutando consulta de filtro: {str(e)}")
@@ -538,21 +734,26 @@ class SpatialAnalysisService:
             raise e
 
 class SpatialService:
-    def __init__(self, db: Session):
-        self.db = db
+    """Geometrías completas de los límites administrativos (sin simplificar)"""
 
     async def get_department_geometries(self):
         try:
-            departments = self.db.query(DepartmentalActivity).all()
+            query = """
+                SELECT id, cod_depto, departamento, ST_AsGeoJSON(geometry)::json as geom
+                FROM limites_departamentos
+                WHERE geometry IS NOT NULL
+                ORDER BY id;
+            """
+            departments = await fetch_all(query)
             
             features = []
             for dept in departments:
-                geom = to_shape(dept.geometry)
                 feature = {
                     "type": "Feature",
-                    "geometry": mapping(geom),
+                    "geometry": dept.geom,
                     "properties": {
                         "id": dept.id,
+                        "cod_depto": dept.cod_depto,
                         "nombre": dept.departamento
                     }
                 }
@@ -568,16 +769,22 @@ class SpatialService:
 
     async def get_municipal_geometries(self):
         try:
-            municipalities = self.db.query(MunicipalActivity).all()
+            query = """
+                SELECT id, cod_mpio, municipio, departamento, ST_AsGeoJSON(geometry)::json as geom
+                FROM limites_municipios
+                WHERE geometry IS NOT NULL
+                ORDER BY id;
+            """
+            municipalities = await fetch_all(query)
             
             features = []
             for mun in municipalities:
-                geom = to_shape(mun.geometry)
                 feature = {
                     "type": "Feature",
-                    "geometry": mapping(geom),
+                    "geometry": mun.geom,
                     "properties": {
                         "id": mun.id,
+                        "cod_mpio": mun.cod_mpio,
                         "nombre": mun.municipio,
                         "departamento": mun.departamento
                     }
@@ -590,4 +797,4 @@ class SpatialService:
             }
         except Exception as e:
             logger.error(f"Error al obtener geometrías municipales: {str(e)}")
-            raise Exception(f"Error al obtener geometrías municipales: {str(e)}") 
\ No newline at end of file
+            raise Exception(f"Error al obtener geometrías municipales: {str(e)}") 
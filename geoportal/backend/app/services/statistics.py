@@ -1,16 +1,93 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, extract
-from ..models.models import Activity
+from ..core.database import fetch_all, fetch_one, fetch_scalar
 from typing import Dict, Optional
-from datetime import date
+from datetime import date, timedelta
+import asyncio
 import logging
-from sqlalchemy.sql import text
 
 logger = logging.getLogger(__name__)
 
+# Vista materializada con conteos por mes, municipio, grupo de interés y categoría,
+# refrescada tras cada importación (Dashboard_BD_PHI/scripts/crear_rollups.py)
+ROLLUP_ESTADISTICAS = 'mv_actividades_mes_mun_grupo_cat'
+
 class StatisticsService:
-    def __init__(self, db: Session):
-        self.db = db
+    async def _can_use_rollup(self, start_date: Optional[date], end_date: Optional[date]) -> bool:
+        """
+        La vista agrega por mes, así que solo responde exactamente cuando no hay
+        rango de fechas o cuando el rango cubre meses completos
+        """
+        if start_date and end_date:
+            next_day = end_date + timedelta(days=1)
+            if start_date.day != 1 or next_day.day != 1:
+                return False
+        exists = await fetch_scalar(f"SELECT to_regclass('public.{ROLLUP_ESTADISTICAS}') IS NOT NULL")
+        return bool(exists)
+
+    def _get_rollup_queries(self, level: str, with_dates: bool):
+        """Consultas de estadísticas equivalentes resueltas sobre la vista materializada"""
+        if level == 'veredas':
+            condition = "grupo_interes = :geometry_id AND tipo_geometria = 'vereda'"
+            group_field = "municipio"
+        elif level == 'departamentos':
+            condition = "departamento = :geometry_id"
+            group_field = "COALESCE(grupo_interes, 'Sin especificar')"
+        elif level == 'municipios':
+            condition = "municipio = :geometry_id"
+            group_field = "COALESCE(grupo_interes, 'Sin especificar')"
+        else:
+            raise ValueError(f"Nivel no soportado: {level}")
+
+        if with_dates:
+            condition += " AND mes BETWEEN :start_date AND :end_date"
+
+        base_query = f"""
+            SELECT 
+                SUM(total_actividades) as total_actividades,
+                SUM(total_asistentes) as total_asistentes
+            FROM {ROLLUP_ESTADISTICAS}
+            WHERE {condition}
+        """
+
+        temporal_query = f"""
+            SELECT 
+                DATE_TRUNC('year', mes) as mes,
+                SUM(total_actividades) as total,
+                SUM(total_asistentes) as asistentes
+            FROM {ROLLUP_ESTADISTICAS}
+            WHERE {condition}
+            GROUP BY DATE_TRUNC('year', mes)
+            ORDER BY mes
+        """
+
+        grupos_query = f"""
+            SELECT 
+                {group_field} as nombre,
+                SUM(total_actividades) as total,
+                SUM(COALESCE(total_asistentes, 0)) as asistentes
+            FROM {ROLLUP_ESTADISTICAS}
+            WHERE {condition}
+            GROUP BY {group_field}
+            ORDER BY total DESC
+        """
+
+        categoria_query = f"""
+            WITH filtrado AS (
+                SELECT categoria_actividad, total_actividades, total_asistentes
+                FROM {ROLLUP_ESTADISTICAS}
+                WHERE {condition}
+            )
+            SELECT 
+                categoria_actividad as categoria,
+                SUM(total_actividades) as total,
+                COALESCE(SUM(total_asistentes), 0) as asistentes,
+                ROUND(SUM(total_actividades)::numeric / NULLIF((SELECT SUM(total_actividades) FROM filtrado), 0) * 100, 2) as porcentaje
+            FROM filtrado
+            GROUP BY categoria_actividad
+            HAVING categoria_actividad IS NOT NULL
+            ORDER BY total DESC
+        """
+
+        return base_query, temporal_query, grupos_query, categoria_query
 
     async def get_activity_statistics(
         self,
@@ -180,6 +257,12 @@ class StatisticsService:
                     ORDER BY total DESC;
                 """
             
+            # Con la vista materializada disponible no se recorre la tabla de actividades
+            if await self._can_use_rollup(start_date, end_date):
+                base_query, temporal_query, grupos_query, categoria_query = self._get_rollup_queries(
+                    level, bool(start_date and end_date)
+                )
+
             # Ejecutar consultas
             params = {
                 "geometry_id": geometry_id,
@@ -187,15 +270,18 @@ class StatisticsService:
                 "end_date": end_date
             }
 
-            result = self.db.execute(text(base_query), params).first()
-            temporal = self.db.execute(text(temporal_query), params).fetchall()
-            grupos = self.db.execute(text(grupos_query), params).fetchall()
-            categorias = self.db.execute(text(categoria_query), params).fetchall()
+            # Las consultas son independientes: se ejecutan en paralelo sin bloquear el event loop
+            result, temporal, grupos, categorias = await asyncio.gather(
+                fetch_one(base_query, params),
+                fetch_all(temporal_query, params),
+                fetch_all(grupos_query, params),
+                fetch_all(categoria_query, params)
+            )
 
             # Construir respuesta
             response = {
-                "total_actividades": result.total_actividades or 0,
-                "total_asistentes": result.total_asistentes or 0,
+                "total_actividades": int(result.total_actividades or 0),
+                "total_asistentes": int(result.total_asistentes or 0),
                 "temporal": [
                     {
                         "mes": mes.strftime("%Y-%m"),
@@ -0,0 +1,3 @@
+from .prediction import router as prediction_router
+
+__all__ = ['prediction_router']
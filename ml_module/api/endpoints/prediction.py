@@ -3,10 +3,9 @@ from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
 import pandas as pd
-from ..models.attendance_predictor import AttendancePredictor
-from ..preprocessing.data_cleaner import DataCleaner
-from ..config import ATTENDANCE_FEATURES
-from ..utils.data_loader import DataLoader
+from ...preprocessing.data_cleaner import DataCleaner
+from ...config import ATTENDANCE_FEATURES
+from ..registry import model_registry
 from sqlalchemy import text
 
 router = APIRouter(prefix="/ml", tags=["machine-learning"])
@@ -25,12 +24,25 @@ class PredictionResponse(BaseModel):
     confidence_score: float
     features_importance: dict
 
+class BatchPredictionItem(BaseModel):
+    departamento: str
+    municipio: str
+    zona_geografica: str
+    categoria_unica: str
+    fecha: datetime
+
+class BatchPredictionRequest(BaseModel):
+    items: List[BatchPredictionItem]
+
+# Límite de filas por lote para acotar memoria y tiempo de respuesta
+MAX_BATCH_SIZE = 5000
+
 # 1. Endpoints de datos geográficos (en orden de selección)
 @router.get("/zonas-geograficas")
 async def get_zonas_geograficas():
     """Obtiene lista de zonas geográficas disponibles"""
     try:
-        data_loader = DataLoader()
+        data_loader = model_registry.get_data_loader()
         zonas = data_loader.get_zonas_geograficas()
         
         return {
@@ -50,7 +62,7 @@ async def get_zonas_geograficas():
 async def get_departamentos(zona_geografica: str = Query(None)):
     """Obtiene departamentos, opcionalmente filtrados por zona geográfica"""
     try:
-        data_loader = DataLoader()
+        data_loader = model_registry.get_data_loader()
         if zona_geografica:
             departamentos = data_loader.get_departamentos_por_zona(zona_geografica)
         else:
@@ -85,7 +97,7 @@ async def get_municipios(
 ):
     """Obtiene municipios filtrados por departamento y/o zona geográfica"""
     try:
-        data_loader = DataLoader()
+        data_loader = model_registry.get_data_loader()
         municipios = data_loader.get_municipios(departamento, zona_geografica)
         
         return {
@@ -109,7 +121,7 @@ async def get_municipios(
 async def get_municipio_stats(municipio: str):
     """Obtiene estadísticas para un municipio específico"""
     try:
-        predictor = AttendancePredictor()
+        predictor = model_registry.get_predictor()
         stats = predictor.get_municipio_stats(municipio)
         
         if stats is None:
@@ -146,8 +158,7 @@ async def predict_attendance(request: PredictionRequest):
         cleaner = DataCleaner()
         df_cleaned = cleaner.clean_attendance_data(df)
         
-        predictor = AttendancePredictor()
-        predictor.load_model()
+        predictor = model_registry.get_legacy_model()
         
         X = df_cleaned[ATTENDANCE_FEATURES]
         prediction = predictor.predict(X)[0]
@@ -166,12 +177,48 @@ async def predict_attendance(request: PredictionRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/predict-attendance/batch")
+def predict_attendance_batch(request: BatchPredictionRequest):
+    """Predice la asistencia de un calendario completo de actividades en una sola llamada"""
+    if not request.items:
+        raise HTTPException(status_code=400, detail="El lote no contiene filas")
+    if len(request.items) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"El lote excede el máximo de {MAX_BATCH_SIZE} filas"
+        )
+
+    try:
+        inputs = [
+            {
+                'departamento': item.departamento,
+                'municipio': item.municipio,
+                'zona_geografica': item.zona_geografica,
+                'categoria_unica': item.categoria_unica,
+                'fecha': item.fecha
+            }
+            for item in request.items
+        ]
+
+        predictor = model_registry.get_predictor()
+        resultados = predictor.predict_batch(inputs)
+
+        return {
+            "status": "success",
+            "data": {
+                "predicciones": resultados,
+                "total": len(resultados),
+                "errores": sum(1 for r in resultados if 'error' in r)
+            }
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/model-metrics")
 async def get_model_metrics():
     """Obtiene métricas del modelo"""
     try:
-        predictor = AttendancePredictor()
-        predictor.load_model()
+        predictor = model_registry.get_legacy_model()
         
         return {
             "model_version": "1.0",
@@ -185,4 +232,10 @@ async def get_model_metrics():
             }
         }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/models/reload")
+async def reload_models():
+    """Fuerza la recarga de los modelos desde disco en la próxima petición"""
+    model_registry.reload()
+    return {"status": "success"}
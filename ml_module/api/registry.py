@@ -0,0 +1,81 @@
+import logging
+import threading
+from ..models.attendance_predictor import AttendancePredictor
+from ..ml_module.predict import AttendancePredictor as HistoricalAttendancePredictor
+from ..ml_module.predict import MODEL_ARTIFACTS, root_dir
+from ..config import MODELS_DIR
+from ..utils.data_loader import DataLoader
+
+logger = logging.getLogger(__name__)
+
+class ModelRegistry:
+    """
+    Registro de modelos compartido por todo el proceso de la API.
+
+    Carga cada artefacto una sola vez, comparte un único DataLoader (y por lo
+    tanto un único pool de conexiones) y recarga los predictores cuando los
+    archivos cambian en disco, comparando su fecha de modificación.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data_loader = None
+        self._predictor = None
+        self._predictor_version = None
+        self._legacy_model = None
+        self._legacy_version = None
+
+    def _artifacts_version(self, paths):
+        """Firma de los artefactos: (nombre, mtime) de cada archivo existente"""
+        version = []
+        for path in paths:
+            try:
+                version.append((path.name, path.stat().st_mtime_ns))
+            except FileNotFoundError:
+                version.append((path.name, None))
+        return tuple(version)
+
+    def get_data_loader(self) -> DataLoader:
+        """DataLoader compartido; se crea en el primer uso"""
+        if self._data_loader is None:
+            with self._lock:
+                if self._data_loader is None:
+                    self._data_loader = DataLoader()
+        return self._data_loader
+
+    def get_predictor(self) -> HistoricalAttendancePredictor:
+        """Predictor con datos históricos; se recarga si cambió algún artefacto"""
+        version = self._artifacts_version([root_dir / 'models' / name for name in MODEL_ARTIFACTS])
+        if self._predictor is None or version != self._predictor_version:
+            data_loader = self.get_data_loader()
+            with self._lock:
+                if self._predictor is None or version != self._predictor_version:
+                    logger.info("Cargando predictor de asistencia...")
+                    self._predictor = HistoricalAttendancePredictor(data_loader=data_loader)
+                    self._predictor_version = version
+        return self._predictor
+
+    def get_legacy_model(self) -> AttendancePredictor:
+        """Modelo XGBoost de trained_models usado por /predict-attendance"""
+        version = self._artifacts_version([MODELS_DIR / 'attendance_predictor.joblib'])
+        if self._legacy_model is None or version != self._legacy_version:
+            with self._lock:
+                if self._legacy_model is None or version != self._legacy_version:
+                    logger.info("Cargando modelo de asistencia de trained_models...")
+                    model = AttendancePredictor()
+                    model.load_model()
+                    self._legacy_model = model
+                    self._legacy_version = version
+        return self._legacy_model
+
+    def reload(self):
+        """Descarta los modelos cargados; se vuelven a leer de disco en el próximo uso"""
+        with self._lock:
+            self._predictor = None
+            self._predictor_version = None
+            self._legacy_model = None
+            self._legacy_version = None
+        logger.info("Registro de modelos reiniciado")
+
+
+model_registry = ModelRegistry()
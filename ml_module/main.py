@@ -1,7 +1,11 @@
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
+from .api.endpoints import prediction_router
 
 app = FastAPI()
 
 # Montar archivos estáticos
-app.mount("/static", StaticFiles(directory="static"), name="static") 
\ No newline at end of file
+app.mount("/static", StaticFiles(directory="static"), name="static")
+
+# Incluir routers
+app.include_router(prediction_router)
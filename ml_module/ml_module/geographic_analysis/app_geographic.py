@@ -23,6 +23,7 @@ sys.path.append(str(root_dir))
 
 # Actualizar las importaciones
 from predict_geographic import GeographicPredictor
+from map_layers import add_circle_layer, build_popup_html, format_values, heat_points
 
 try:
     from utils.data_loader import DataLoader
@@ -100,32 +101,35 @@ def create_cluster_map(predictor, results):
                 for i in range(n_clusters):
                     colors.append(base_colors[i % len(base_colors)])
         
-        # Agregar marcadores por cluster
-        for idx, row in df.iterrows():
-            if idx < len(clusters):  # Verificar que el índice es válido
-                cluster = clusters[idx]
-                color_idx = int(cluster) % len(colors)  # Asegurar índice válido
-                color = colors[color_idx]
-                
-                popup_html = f"""
-                    <div style="font-family: Arial; width: 200px;">
-                        <h4 style="color: {color};">{row['municipio']}</h4>
-                        <b>Departamento:</b> {row['departamento']}<br>
-                        <b>Cluster:</b> {cluster}<br>
-                        <b>Actividades:</b> {int(row['num_actividades'])}<br>
-                        <b>Asistentes:</b> {int(row['total_asistentes'])}<br>
-                        <b>Promedio:</b> {row['promedio_asistentes'] if 'promedio_asistentes' in row else 0:.1f}/actividad
-                    </div>
-                """
-                
-                folium.CircleMarker(
-                    location=[row['latitud'], row['longitud']],
-                    radius=10 + (row['num_actividades'] / df['num_actividades'].max() * 20),
-                    popup=folium.Popup(popup_html, max_width=300),
-                    color=color,
-                    fill=True,
-                    fill_opacity=0.7
-                ).add_to(m)
+        # Una sola capa con todos los municipios (el cluster de cada fila es posicional)
+        n_rows = min(len(df), len(clusters))
+        if n_rows > 0:
+            puntos = df.iloc[:n_rows]
+            cluster_ids = np.asarray(clusters[:n_rows], dtype=int)
+            point_colors = np.asarray(colors)[cluster_ids % len(colors)]
+            promedio = puntos['promedio_asistentes'] if 'promedio_asistentes' in puntos.columns else np.zeros(n_rows)
+            
+            popups = build_popup_html(
+                puntos['municipio'],
+                [
+                    ('Departamento', puntos['departamento']),
+                    ('Cluster', cluster_ids.astype(str)),
+                    ('Actividades', format_values(puntos['num_actividades'])),
+                    ('Asistentes', format_values(puntos['total_asistentes'])),
+                    ('Promedio', format_values(promedio, '%.1f') + '/actividad')
+                ],
+                title_color=point_colors
+            )
+            
+            add_circle_layer(
+                m,
+                puntos['latitud'],
+                puntos['longitud'],
+                popup=popups,
+                radius=10 + (puntos['num_actividades'] / df['num_actividades'].max() * 20).to_numpy(),
+                color=point_colors,
+                fill_opacity=0.7
+            )
         
         # Si no hay clusters, mostrar un mensaje
         if n_clusters == 0:
@@ -180,17 +184,8 @@ def create_density_map(df: pd.DataFrame) -> folium.Map:
             prefer_canvas=True  # Mejora el rendimiento
         )
         
-        # Preparar datos para el heatmap de manera segura
-        heat_data = []
-        for _, row in df.iterrows():
-            try:
-                lat = float(row['latitud'])
-                lon = float(row['longitud'])
-                weight = float(row['num_actividades'])
-                if not (pd.isna(lat) or pd.isna(lon) or pd.isna(weight)):
-                    heat_data.append([lat, lon, weight])
-            except (ValueError, TypeError) as e:
-                continue
+        # Preparar datos para el heatmap a partir de las columnas
+        heat_data = heat_points(df, 'num_actividades')
         
         logger.info(f"Agregando capa de calor con {len(heat_data)} puntos")
         
@@ -213,12 +208,13 @@ def create_density_map(df: pd.DataFrame) -> folium.Map:
         try:
             # Mostrar solo los top 5 para no sobrecargar el mapa
             top_municipios = df.nlargest(5, 'num_actividades')
-            for _, row in top_municipios.iterrows():
+            top_popups = top_municipios['municipio'].astype(str) + ': ' + format_values(top_municipios['num_actividades']).values + ' actividades'
+            for lat, lon, popup in zip(top_municipios['latitud'], top_municipios['longitud'], top_popups):
                 folium.Marker(
-                    location=[row['latitud'], row['longitud']],
-                    popup=f"{row['municipio']}: {int(row['num_actividades'])} actividades",
+                    location=[lat, lon],
+                    popup=popup,
                     icon=folium.Icon(color='red', icon='info-sign')
-            ).add_to(m)
+                ).add_to(m)
             logger.info("Marcadores de municipios agregados exitosamente")
         except Exception as e:
             logger.error(f"Error agregando marcadores: {str(e)}")
@@ -484,10 +480,11 @@ def create_base_map(center_lat: float, center_lon: float) -> folium.Map:
     try:
         # Crear mapa base con estilo limpio
         m = folium.Map(
-        location=[center_lat, center_lon],
-        zoom_start=7,
+            location=[center_lat, center_lon],
+            zoom_start=7,
             tiles='CartoDB positron',
-            control_scale=True
+            control_scale=True,
+            prefer_canvas=True
         )
         
         # Añadir control de escala
@@ -2305,16 +2302,7 @@ def create_enhanced_heatmap(df: pd.DataFrame, value_column: str = 'num_actividad
         )
         
         # Preparar datos para el heatmap (solo coordenadas y valores)
-        heat_data = []
-        for _, row in df.iterrows():
-            try:
-                lat = float(row['latitud'])
-                lon = float(row['longitud'])
-                # Usamos el valor directamente sin normalización
-                val = float(row[value_column])
-                heat_data.append([lat, lon, val])
-            except (ValueError, TypeError):
-                continue
+        heat_data = heat_points(df, value_column)
         
         # Crear heatmap simple sin componentes adicionales
         if heat_data:
@@ -0,0 +1,73 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Columnas con las que se entrenaron scaler y K-means (ver GeographicTrainer._prepare_features)
+KMEANS_FEATURES = (
+    'num_actividades',
+    'total_asistentes',
+    'meses_activos',
+    'eficiencia_actividad',
+    'intensidad_mensual'
+)
+
+def feature_matrix(df: pd.DataFrame, features=KMEANS_FEATURES) -> np.ndarray:
+    """Matriz float64 contigua con las columnas indicadas, sin pasar por registros"""
+    return np.ascontiguousarray(
+        np.column_stack([df[column].to_numpy(dtype=float) for column in features])
+    )
+
+def content_hash(X: np.ndarray) -> str:
+    """Hash barato del contenido de la matriz (forma más bytes)"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(X.shape).encode('utf-8'))
+    digest.update(np.ascontiguousarray(X, dtype=float).tobytes())
+    return digest.hexdigest()
+
+class ClusteringService:
+    """
+    Asigna clusters K-means usando el modelo y el scaler ya cargados en memoria.
+
+    Recibe la matriz de features directamente y guarda las etiquetas por hash
+    de contenido, así que repetir un análisis con los mismos datos no vuelve a
+    escalar ni a predecir. Un servicio corresponde a una versión de
+    los modelos; al recargarlos se crea uno nuevo y su cache empieza vacío.
+    """
+
+    def __init__(self, kmeans, scaler=None, max_entries: int = 32):
+        self.kmeans = kmeans
+        self.scaler = scaler
+        self.max_entries = max_entries
+        self._labels = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _assign(self, X: np.ndarray) -> np.ndarray:
+        """
+        Escala y asigna con los propios modelos: ambos se entrenaron con
+        nombres de columnas (ver GeographicTrainer._prepare_features)
+        """
+        features = pd.DataFrame(X, columns=list(KMEANS_FEATURES))
+        if self.scaler is not None:
+            features = pd.DataFrame(self.scaler.transform(features), columns=list(KMEANS_FEATURES))
+        return np.asarray(self.kmeans.predict(features))
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Etiquetas de cluster de cada fila de X (copia, se puede modificar)"""
+        key = content_hash(X)
+        with self._lock:
+            labels = self._labels.get(key)
+            if labels is not None:
+                self._labels.move_to_end(key)
+                return labels.copy()
+
+        labels = self._assign(X).astype(int)
+        with self._lock:
+            self._labels[key] = labels
+            while len(self._labels) > self.max_entries:
+                self._labels.popitem(last=False)
+        return labels.copy()
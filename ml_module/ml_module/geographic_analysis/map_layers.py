@@ -0,0 +1,114 @@
+"""
+Constructores de capas folium a partir de columnas completas.
+
+En lugar de agregar un folium.CircleMarker por municipio (un objeto JS por
+fila), cada capa se emite como un único GeoJSON de puntos dibujado en canvas,
+con el estilo de cada punto tomado de arreglos y los popups armados con
+concatenación vectorizada de strings.
+"""
+
+import logging
+import numpy as np
+import pandas as pd
+import folium
+
+logger = logging.getLogger(__name__)
+
+def format_values(values, pattern: str = '%d') -> pd.Series:
+    """Formatea una columna numérica con un patrón printf sin recorrer filas en Python"""
+    array = pd.to_numeric(pd.Series(values), errors='coerce').fillna(0).to_numpy(dtype=float)
+    return pd.Series(np.char.mod(pattern, array))
+
+def build_popup_html(title, fields, title_color=None, width: int = 200) -> pd.Series:
+    """
+    Arma el HTML de los popups de todas las filas.
+
+    Args:
+        title: columna con el título de cada popup (por ejemplo el municipio)
+        fields: lista de (etiqueta, columna de strings ya formateada)
+        title_color: color del título, escalar o columna
+        width: ancho del popup en píxeles
+
+    Returns:
+        Serie con un string HTML por fila
+    """
+    title = pd.Series(title).astype(str).reset_index(drop=True)
+    if title_color is None:
+        header = '<h4 style="margin-bottom: 10px;">' + title + '</h4>'
+    else:
+        color = pd.Series(title_color, index=title.index).astype(str) if not np.isscalar(title_color) else title_color
+        header = '<h4 style="color: ' + color + ';">' + title + '</h4>'
+
+    html = f'<div style="font-family: Arial; width: {width}px;">' + header
+    for label, values in fields:
+        html = html + f'<b>{label}:</b> ' + pd.Series(values).astype(str).reset_index(drop=True) + '<br>'
+    return html + '</div>'
+
+def _column(value, n: int) -> list:
+    """Expande un escalar a n valores o convierte un arreglo a lista de tipos nativos"""
+    if np.isscalar(value) or value is None:
+        return [value] * n
+    return np.asarray(value).tolist()
+
+def add_circle_layer(m: folium.Map, lat, lon, popup=None, radius=8, color='#3388ff',
+                     fill_color=None, fill_opacity=0.7, weight=1, name: str = None) -> folium.GeoJson:
+    """
+    Agrega al mapa una capa GeoJSON de círculos, uno por fila.
+
+    Los parámetros de estilo aceptan un escalar (igual para todos los puntos)
+    o un arreglo con un valor por punto. Para que los círculos se dibujen en
+    canvas el mapa debe crearse con prefer_canvas=True.
+
+    Returns:
+        La capa agregada
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    n = len(lat)
+
+    styles = {
+        'radius': _column(radius, n),
+        'color': _column(color, n),
+        'fillColor': _column(fill_color if fill_color is not None else color, n),
+        'fillOpacity': _column(fill_opacity, n),
+        'weight': _column(weight, n)
+    }
+    popups = _column(popup, n) if popup is not None else None
+
+    features = []
+    for i, (y, x) in enumerate(zip(lat.tolist(), lon.tolist())):
+        if np.isnan(y) or np.isnan(x):
+            continue
+        properties = {key: values[i] for key, values in styles.items()}
+        if popups is not None:
+            properties['popup'] = popups[i]
+        features.append({
+            'type': 'Feature',
+            'id': str(i),
+            'geometry': {'type': 'Point', 'coordinates': [x, y]},
+            'properties': properties
+        })
+
+    layer = folium.GeoJson(
+        {'type': 'FeatureCollection', 'features': features},
+        name=name,
+        marker=folium.CircleMarker(fill=True),
+        style_function=lambda feature: {
+            'radius': feature['properties']['radius'],
+            'color': feature['properties']['color'],
+            'fillColor': feature['properties']['fillColor'],
+            'fillOpacity': feature['properties']['fillOpacity'],
+            'weight': feature['properties']['weight']
+        },
+        popup=folium.GeoJsonPopup(fields=['popup'], labels=False, max_width=300) if popups is not None else None
+    )
+    layer.add_to(m)
+    logger.info(f"Capa de círculos agregada con {len(features)} puntos")
+    return layer
+
+def heat_points(df: pd.DataFrame, value_column: str, scale: float = 1.0) -> list:
+    """Lista [lat, lon, valor] para HeatMap a partir de columnas, sin filas inválidas"""
+    points = df[['latitud', 'longitud', value_column]].apply(pd.to_numeric, errors='coerce').dropna()
+    if scale != 1.0:
+        points[value_column] = points[value_column] * scale
+    return points.to_numpy(dtype=float).tolist()
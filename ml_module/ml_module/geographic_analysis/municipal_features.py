@@ -0,0 +1,246 @@
+"""
+Consultas de features municipales para el análisis geográfico.
+
+Cada consulta agrega `actividades` una sola vez por municipio y la une a un
+único centroide por municipio, de modo que el costo crece linealmente con
+el número de actividades (antes se unía `actividades_municipios`, con una fila
+por actividad, contra `actividades` y se colapsaba con DISTINCT).
+"""
+
+from sqlalchemy import text
+
+# Un centroide por municipio: se resuelve el código DANE una vez por
+# (municipio, departamento) y se lee el centroide precalculado en
+# municipios_centroides (Dashboard_BD_PHI/scripts/import_data_MunicipioDepartamento.py)
+MUNICIPIOS_GEOMETRIA_CTE = """
+    municipios_geometria AS (
+        SELECT
+            m.municipio,
+            m.departamento,
+            c.longitud,
+            c.latitud
+        FROM (
+            SELECT municipio, departamento, MIN(cod_mpio) as cod_mpio
+            FROM actividades_municipios
+            WHERE cod_mpio IS NOT NULL
+            GROUP BY municipio, departamento
+        ) m
+        JOIN municipios_centroides c ON c.cod_mpio = m.cod_mpio
+    )
+"""
+
+# Alternativa para bases sin municipios_centroides: calcula el centroide del límite
+MUNICIPIOS_GEOMETRIA_CTE_SIN_CENTROIDES = """
+    municipios_geometria AS (
+        SELECT
+            m.municipio,
+            m.departamento,
+            ST_X(ST_Centroid(l.geometry)) as longitud,
+            ST_Y(ST_Centroid(l.geometry)) as latitud
+        FROM (
+            SELECT municipio, departamento, MIN(cod_mpio) as cod_mpio
+            FROM actividades_municipios
+            WHERE cod_mpio IS NOT NULL
+            GROUP BY municipio, departamento
+        ) m
+        JOIN limites_municipios l ON l.cod_mpio = m.cod_mpio
+    )
+"""
+
+# Resultado de la verificación por URL de la base: el predictor crea un engine por consulta
+_centroides_por_url = {}
+
+def centroides_disponibles(engine) -> bool:
+    """Indica si la tabla municipios_centroides existe; se verifica una vez por base"""
+    url = str(engine.url)
+    if url not in _centroides_por_url:
+        try:
+            with engine.connect() as conn:
+                _centroides_por_url[url] = bool(
+                    conn.execute(text("SELECT to_regclass('municipios_centroides') IS NOT NULL")).scalar()
+                )
+        except Exception:
+            # Sin conexión no se cachea: se vuelve a verificar en la siguiente consulta
+            return False
+    return _centroides_por_url[url]
+
+def _geometria_cte(usar_centroides: bool) -> str:
+    return MUNICIPIOS_GEOMETRIA_CTE if usar_centroides else MUNICIPIOS_GEOMETRIA_CTE_SIN_CENTROIDES
+
+def build_prediction_query(where_clause: str, usar_centroides: bool = True) -> str:
+    """
+    Consulta de features para GeographicPredictor. where_clause filtra la
+    tabla `actividades` con alias `a`; solo se retornan municipios con al
+    menos una actividad que cumpla el filtro, una fila por grupo de interés.
+    """
+    return f"""
+        WITH {_geometria_cte(usar_centroides)},
+        actividades_filtradas AS (
+            SELECT
+                a.id,
+                a.municipio,
+                a.departamento,
+                a.zona_geografica,
+                a.grupo_interes,
+                a.categoria_unica,
+                a.fecha,
+                COALESCE(a.total_asistentes, 0) as total_asistentes
+            FROM actividades a
+            WHERE {where_clause}
+        ),
+        activity_stats AS (
+            SELECT
+                a.municipio,
+                a.departamento,
+                COALESCE(MODE() WITHIN GROUP (ORDER BY a.zona_geografica), 'No definida') as zona_geografica,
+                COUNT(DISTINCT a.grupo_interes) as num_grupos_interes,
+                COUNT(DISTINCT a.id) as num_actividades,
+                SUM(a.total_asistentes) as total_asistentes,
+                COUNT(DISTINCT EXTRACT(MONTH FROM a.fecha)) as meses_activos,
+                MAX(a.categoria_unica) as categoria_unica,
+                COUNT(DISTINCT EXTRACT(YEAR FROM a.fecha)) as anos_activos,
+                string_agg(DISTINCT CAST(a.grupo_interes AS TEXT), ',') as grupos_interes_list,
+                AVG(EXTRACT(DOW FROM a.fecha)) as dia_semana_promedio
+            FROM actividades_filtradas a
+            GROUP BY a.municipio, a.departamento
+        ),
+        grupos_stats AS (
+            SELECT
+                a.municipio,
+                a.departamento,
+                a.grupo_interes,
+                CONCAT('Grupo ', a.grupo_interes) as nombre_grupo_interes,
+                COUNT(DISTINCT a.id) as actividades_por_grupo,
+                SUM(a.total_asistentes) as asistentes_por_grupo
+            FROM actividades_filtradas a
+            GROUP BY a.municipio, a.departamento, a.grupo_interes
+        )
+        SELECT
+            s.municipio,
+            s.departamento,
+            s.zona_geografica,
+            mg.longitud,
+            mg.latitud,
+            s.num_grupos_interes,
+            s.num_actividades,
+            s.total_asistentes,
+            s.meses_activos,
+            s.categoria_unica,
+            s.anos_activos,
+            s.grupos_interes_list,
+            s.dia_semana_promedio,
+            g.grupo_interes as grupo_interes_id,
+            g.nombre_grupo_interes,
+            g.actividades_por_grupo,
+            g.asistentes_por_grupo,
+            CASE
+                WHEN s.num_actividades > 0 THEN s.total_asistentes::float / s.num_actividades
+                ELSE 0
+            END as promedio_asistentes,
+            CASE
+                WHEN s.meses_activos > 0 THEN s.num_actividades::float / s.meses_activos
+                ELSE 0
+            END as intensidad_mensual,
+            CASE
+                WHEN s.num_actividades > 0 THEN s.total_asistentes::float / s.num_actividades
+                ELSE 0
+            END as eficiencia_actividad,
+            CASE
+                WHEN g.actividades_por_grupo > 0 THEN g.asistentes_por_grupo::float / g.actividades_por_grupo
+                ELSE 0
+            END as eficiencia_actividad_grupo
+        FROM activity_stats s
+        JOIN municipios_geometria mg ON
+            mg.municipio = s.municipio AND
+            mg.departamento = s.departamento
+        LEFT JOIN grupos_stats g ON
+            s.municipio = g.municipio AND
+            s.departamento = g.departamento
+        WHERE mg.longitud IS NOT NULL AND mg.latitud IS NOT NULL
+    """
+
+def build_training_query(usar_centroides: bool = True) -> str:
+    """
+    Consulta de entrenamiento: todos los municipios con geometría, tengan o no
+    actividades desde 2014.
+    """
+    return f"""
+    WITH {_geometria_cte(usar_centroides)},
+    activity_stats AS (
+        -- Una sola pasada: la zona usa todo el histórico y las métricas desde 2014
+        SELECT
+            a.municipio,
+            a.departamento,
+            MODE() WITHIN GROUP (ORDER BY a.zona_geografica) as zona_geografica,
+            COUNT(*) FILTER (WHERE a.fecha >= '2014-01-01') as num_actividades,
+            COALESCE(SUM(a.total_asistentes) FILTER (WHERE a.fecha >= '2014-01-01'), 0) as total_asistentes,
+            COUNT(DISTINCT EXTRACT(MONTH FROM a.fecha)) FILTER (WHERE a.fecha >= '2014-01-01') as meses_activos
+        FROM actividades a
+        GROUP BY a.municipio, a.departamento
+    ),
+    categorias_municipio AS (
+        SELECT
+            municipio,
+            departamento,
+            categoria_unica::integer as categoria_unica,
+            COUNT(*) as conteo
+        FROM actividades
+        WHERE categoria_unica IS NOT NULL
+        AND categoria_unica ~ '^[0-9]+$'  -- Asegurar que es numérico
+        GROUP BY municipio, departamento, categoria_unica
+    ),
+    categoria_principal AS (
+        SELECT DISTINCT ON (municipio, departamento)
+            municipio,
+            departamento,
+            categoria_unica
+        FROM categorias_municipio
+        ORDER BY municipio, departamento, conteo DESC
+    ),
+    municipal_stats AS (
+        SELECT
+            mg.municipio,
+            mg.departamento,
+            COALESCE(s.zona_geografica, 'No definida') as zona_geografica,
+            mg.longitud,
+            mg.latitud,
+            COALESCE(s.num_actividades, 0) as num_actividades,
+            COALESCE(s.total_asistentes, 0) as total_asistentes,
+            COALESCE(s.meses_activos, 0) as meses_activos,
+            COALESCE(cp.categoria_unica, 0) as categoria_unica,
+            -- Filas del municipio tras el LEFT JOIN original: al menos una
+            GREATEST(COALESCE(s.num_actividades, 0), 1) as actividades_tipo
+        FROM municipios_geometria mg
+        LEFT JOIN activity_stats s ON
+            s.municipio = mg.municipio AND
+            s.departamento = mg.departamento
+        LEFT JOIN categoria_principal cp ON
+            cp.municipio = mg.municipio AND
+            cp.departamento = mg.departamento
+    )
+    SELECT
+        municipio,
+        departamento,
+        zona_geografica,
+        longitud,
+        latitud,
+        num_actividades,
+        total_asistentes,
+        meses_activos,
+        categoria_unica,
+        actividades_tipo,
+        CASE
+            WHEN num_actividades > 0 THEN total_asistentes::float / num_actividades
+            ELSE 0
+        END as promedio_asistentes,
+        CASE
+            WHEN meses_activos > 0 THEN num_actividades::float / meses_activos
+            ELSE 0
+        END as intensidad_mensual,
+        CASE
+            WHEN num_actividades > 0 THEN total_asistentes::float / num_actividades
+            ELSE 0
+        END as eficiencia_actividad
+    FROM municipal_stats
+    WHERE longitud IS NOT NULL AND latitud IS NOT NULL
+"""
@@ -20,14 +20,31 @@ sys.path.append(str(root_dir))
 
 from utils.data_loader import DataLoader
 from analysis_utils import calculate_municipal_metrics, generate_municipal_recommendations
+from municipal_features import build_prediction_query, centroides_disponibles
+from map_layers import add_circle_layer, build_popup_html, format_values
+from result_cache import artifacts_hash, get_result_cache, normalize_filters
+from clustering_service import ClusteringService, feature_matrix
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+MODELS_DIR = Path(root_dir) / 'models/geographic_models'
+# Artefactos que determinan el resultado de predict (clave del cache de resultados)
+MODEL_FILES = [
+    'kmeans_model.joblib',
+    'dbscan_model.joblib',
+    'scaler_model.joblib',
+    'feature_weights_model.joblib',
+    'type_specific_weights_model.joblib',
+    'model_metrics.json'
+]
+
 class GeographicPredictor:
     # Variable de clase para almacenar los modelos
     _instance = None
     _models = None
+    _models_hash = None
+    _clustering = None
     _metrics = None
 
     def __new__(cls, *args, **kwargs):
@@ -38,7 +55,16 @@ class GeographicPredictor:
 
     def __init__(self):
         self.data_loader = DataLoader()
-        self.models = self._load_models()
+        # Firma de los artefactos tal como estaban al cargarlos
+        self.model_hash = artifacts_hash([MODELS_DIR / name for name in MODEL_FILES])
+        # Los modelos quedan residentes a nivel de clase; solo se leen de disco si cambiaron
+        if GeographicPredictor._models is None or GeographicPredictor._models_hash != self.model_hash:
+            GeographicPredictor._models = self._load_models()
+            # Si la carga falló se reintenta en la siguiente instancia
+            GeographicPredictor._models_hash = self.model_hash if GeographicPredictor._models else None
+            GeographicPredictor._clustering = None
+        self.models = GeographicPredictor._models
+        self.result_cache = get_result_cache(MODELS_DIR)
         # Mapeo de tipos de actividad a IDs
         self.tipo_mapping = {
             'Talleres': '1',
@@ -121,7 +147,7 @@ class GeographicPredictor:
     def _load_models(self):
         """Carga los modelos entrenados y sus pesos"""
         try:
-            models_dir = Path(root_dir) / 'models/geographic_models'
+            models_dir = MODELS_DIR
             
             models = {
                 'kmeans': joblib.load(models_dir / 'kmeans_model.joblib'),
@@ -144,6 +170,14 @@ class GeographicPredictor:
     def predict(self, input_data: dict) -> dict:
         """Realiza predicciones usando los modelos entrenados"""
         try:
+            # Resultados ya calculados para los mismos filtros y modelos
+            filters = normalize_filters(input_data)
+            cached = self.result_cache.get(filters, self.model_hash)
+            if cached is not None:
+                self.current_weights = cached['model_weights']
+                logger.info(f"Resultado geográfico servido desde cache: {filters}")
+                return cached
+            
             # Obtener datos
             data = self._get_data(input_data)
             if data.empty:
@@ -178,6 +212,7 @@ class GeographicPredictor:
                 'weights_source': 'specific' if tipo_actividad else 'general'
             }
             
+            self.result_cache.set(filters, self.model_hash, results)
             return results
             
         except Exception as e:
@@ -270,88 +305,7 @@ class GeographicPredictor:
             logger.info(f"Where clause: {where_clause}")
             logger.info(f"Parámetros: {params}")
             
-            query = f"""
-                WITH municipios_base AS (
-                    SELECT DISTINCT 
-                        m.municipio,
-                        m.departamento,
-                        m.geometry,
-                        COALESCE(a.zona_geografica, 'No definida') as zona_geografica
-                    FROM actividades_municipios m
-                    LEFT JOIN actividades a ON 
-                        m.municipio = a.municipio AND 
-                        m.departamento = a.departamento
-                    WHERE m.geometry IS NOT NULL
-                ),
-                activity_stats AS (
-                    SELECT 
-                        m.municipio,
-                        m.departamento,
-                        m.zona_geografica,
-                        ST_X(ST_Centroid(m.geometry::geometry)) as longitud,
-                        ST_Y(ST_Centroid(m.geometry::geometry)) as latitud,
-                        COUNT(DISTINCT CASE WHEN {where_clause} THEN a.grupo_interes ELSE NULL END) as num_grupos_interes,
-                        COUNT(DISTINCT CASE WHEN {where_clause} THEN a.id ELSE NULL END) as num_actividades,
-                        SUM(CASE WHEN {where_clause} THEN COALESCE(a.total_asistentes, 0) ELSE 0 END) as total_asistentes,
-                        COUNT(DISTINCT CASE WHEN {where_clause} THEN EXTRACT(MONTH FROM a.fecha) ELSE NULL END) as meses_activos,
-                        MAX(CASE WHEN {where_clause} THEN a.categoria_unica ELSE NULL END) as categoria_unica,
-                        COUNT(DISTINCT CASE WHEN {where_clause} THEN EXTRACT(YEAR FROM a.fecha) ELSE NULL END) as anos_activos,
-                        string_agg(DISTINCT CAST(a.grupo_interes AS TEXT), ',') as grupos_interes_list,
-                        AVG(CASE WHEN {where_clause} THEN EXTRACT(DOW FROM a.fecha) ELSE NULL END) as dia_semana_promedio
-                    FROM municipios_base m
-                    LEFT JOIN actividades a ON 
-                        m.municipio = a.municipio AND 
-                        m.departamento = a.departamento
-                    GROUP BY 
-                        m.municipio, 
-                        m.departamento,
-                        m.zona_geografica,
-                        m.geometry
-                    HAVING COUNT(DISTINCT CASE WHEN {where_clause} THEN a.id ELSE NULL END) > 0
-                ),
-                grupos_stats AS (
-                    SELECT 
-                        a.municipio,
-                        a.departamento,
-                        a.grupo_interes,
-                        CONCAT('Grupo ', a.grupo_interes) as nombre_grupo_interes,
-                        COUNT(DISTINCT CASE WHEN {where_clause} THEN a.id ELSE NULL END) as actividades_por_grupo,
-                        SUM(CASE WHEN {where_clause} THEN COALESCE(a.total_asistentes, 0) ELSE 0 END) as asistentes_por_grupo
-                    FROM actividades a
-                    WHERE {where_clause}
-                    GROUP BY 
-                        a.municipio, 
-                        a.departamento,
-                        a.grupo_interes
-                )
-                SELECT 
-                    m.*,
-                    g.grupo_interes as grupo_interes_id,
-                    g.nombre_grupo_interes,
-                    g.actividades_por_grupo,
-                    g.asistentes_por_grupo,
-                    CASE 
-                        WHEN m.num_actividades > 0 THEN m.total_asistentes::float / m.num_actividades 
-                        ELSE 0 
-                    END as promedio_asistentes,
-                    CASE 
-                        WHEN m.meses_activos > 0 THEN m.num_actividades::float / m.meses_activos 
-                        ELSE 0 
-                    END as intensidad_mensual,
-                    CASE 
-                        WHEN m.num_actividades > 0 THEN m.total_asistentes::float / m.num_actividades 
-                        ELSE 0 
-                    END as eficiencia_actividad,
-                    CASE 
-                        WHEN g.actividades_por_grupo > 0 THEN g.asistentes_por_grupo::float / g.actividades_por_grupo 
-                        ELSE 0 
-                    END as eficiencia_actividad_grupo
-                FROM activity_stats m
-                LEFT JOIN grupos_stats g ON
-                    m.municipio = g.municipio AND
-                    m.departamento = g.departamento
-                WHERE m.longitud IS NOT NULL AND m.latitud IS NOT NULL
-            """
+            query = build_prediction_query(where_clause, centroides_disponibles(data_loader.engine))
             
             df = pd.read_sql(query, data_loader.engine, params=params)
             logger.info(f"Datos geográficos obtenidos: {len(df)} municipios")
@@ -411,38 +365,14 @@ class GeographicPredictor:
             logger.error(f"Error obteniendo datos: {str(e)}")
             return pd.DataFrame()
 
-    @staticmethod
-    @st.cache_data(ttl=3600, show_spinner=False)
-    def _cached_apply_kmeans(data_records: tuple, features: tuple, model_name: str, model_path: Path) -> dict:
-        """Versión cacheada de apply_kmeans"""
-        try:
-            # Cargar el modelo específicamente para esta ejecución
-            model_dict = joblib.load(model_path / f'{model_name}_model.joblib')
-            
-            # Convertir los records a DataFrame
-            df = pd.DataFrame.from_records(data_records)
-            
-            kmeans = model_dict['model']
-            scaler = model_dict['scaler']
-            
-            # Preparar datos
-            X = df[list(features)].copy()
-            X_scaled = scaler.transform(X)
-            
-            # Predecir clusters
-            clusters = kmeans.predict(X_scaled)
-            
-            return {
-                'clusters': clusters.tolist(),
-                'n_clusters': len(set(clusters))
-            }
-            
-        except Exception as e:
-            logger.error(f"Error aplicando K-means: {str(e)}")
-            return {
-                'clusters': [0] * len(data_records),
-                'n_clusters': 1
-            }
+    def _get_clustering(self) -> ClusteringService:
+        """Servicio de clustering sobre el K-means y el scaler residentes"""
+        if GeographicPredictor._clustering is None:
+            GeographicPredictor._clustering = ClusteringService(
+                self.models['kmeans'],
+                self.models.get('scaler')
+            )
+        return GeographicPredictor._clustering
 
     def _apply_kmeans(self, df: pd.DataFrame) -> dict:
         """Aplica clustering K-means a los datos"""
@@ -450,29 +380,8 @@ class GeographicPredictor:
             if 'kmeans' not in self.models:
                 raise ValueError("Modelo K-means no encontrado")
             
-            kmeans = self.models['kmeans']
-            scaler = self.models.get('scaler')
-            
-            # Preparar datos con nombres de features
-            features = pd.DataFrame({
-                'num_actividades': df['num_actividades'],
-                'total_asistentes': df['total_asistentes'],
-                'meses_activos': df['meses_activos'],
-                'eficiencia_actividad': df['eficiencia_actividad'],
-                'intensidad_mensual': df['intensidad_mensual']
-            })
-            
-            if scaler:
-                features_scaled = pd.DataFrame(
-                    scaler.transform(features),
-                    columns=features.columns,
-                    index=features.index
-                )
-            else:
-                features_scaled = features
-            
-            # Predecir clusters
-            clusters = kmeans.predict(features_scaled)
+            # Predecir clusters a partir de las columnas de features
+            clusters = self._get_clustering().predict(feature_matrix(df))
             
             # Calcular perfiles de cluster
             df['cluster'] = clusters
@@ -602,31 +511,33 @@ class GeographicPredictor:
             # Crear mapa base
             m = folium.Map(
                 location=[df['latitud'].mean(), df['longitud'].mean()],
-                zoom_start=7
+                zoom_start=7,
+                prefer_canvas=True
             )
             
             # Crear colormap para clusters
             n_clusters = len(set(clusters))
             colors = px.colors.qualitative.Set3[:n_clusters]
             
-            # Agregar marcadores por cluster
-            for idx, row in df.iterrows():
-                cluster = clusters[idx]
-                color = colors[cluster]
-                
-                folium.CircleMarker(
-                    location=[row['latitud'], row['longitud']],
-                    radius=8,
-                    popup=f"""
-                        <b>{row['municipio']}</b><br>
-                        Cluster: {cluster}<br>
-                        Actividades: {row['num_actividades']}<br>
-                        Asistentes: {row['total_asistentes']}
-                    """,
-                    color=color,
-                    fill=True,
-                    fill_color=color
-                ).add_to(m)
+            # Una sola capa con todos los municipios
+            cluster_ids = np.asarray(clusters, dtype=int)
+            point_colors = np.asarray(colors)[cluster_ids]
+            popups = (
+                '<b>' + df['municipio'].astype(str) + '</b><br>'
+                + 'Cluster: ' + pd.Series(cluster_ids.astype(str), index=df.index) + '<br>'
+                + 'Actividades: ' + df['num_actividades'].astype(str) + '<br>'
+                + 'Asistentes: ' + df['total_asistentes'].astype(str)
+            )
+            
+            add_circle_layer(
+                m,
+                df['latitud'],
+                df['longitud'],
+                popup=popups,
+                radius=8,
+                color=point_colors,
+                fill_opacity=0.2
+            )
             
             return m
             
@@ -868,76 +779,62 @@ class GeographicPredictor:
             m = folium.Map(
                 location=[df['latitud'].mean(), df['longitud'].mean()],
                 zoom_start=7,
-                tiles='cartodbpositron'
+                tiles='cartodbpositron',
+                prefer_canvas=True
             )
             
-            # Normalizar los valores de potencial para mejor visualización
-            max_potencial = df['potencial_expansion'].max()
-            min_potencial = df['potencial_expansion'].min()
-            
-            # Agregar círculos con radio proporcional al potencial
-            for _, row in df.iterrows():
-                # Calcular el color basado en el potencial de expansión
-                if row['potencial_expansion'] > 70:
-                    color = '#ff4444'  # Rojo para alto potencial
-                elif row['potencial_expansion'] > 40:
-                    color = '#ffbb33'  # Naranja para potencial medio
-                else:
-                    color = '#00C851'  # Verde para bajo potencial
-                
-                # Crear popup detallado
-                popup_html = f"""
-                    <div style="font-family: Arial; width: 200px;">
-                        <h4 style="margin-bottom: 10px;">{row['municipio']}</h4>
-                        <b>Potencial:</b> {row['potencial_expansion']:.1f}%<br>
-                        <b>Actividades actuales:</b> {int(row['num_actividades'])}<br>
-                        <b>Actividades sugeridas:</b> {int(row['actividades_sugeridas'])}<br>
-                        <b>Prioridad:</b> {row.get('categoria_expansion', 'No definida')}<br>
-                        <b>Score:</b> {row.get('prioridad_score', 0):.2f}
-                    </div>
-                """
-                
-                # Ajustar el tamaño del círculo según el potencial
-                radius = 8 + (row['potencial_expansion'] / 10)
-                
-                # Si hay un municipio seleccionado
-                if 'municipio_seleccionado' in df.columns:
-                    if row['municipio'] == df['municipio_seleccionado'].iloc[0]:
-                        # Municipio seleccionado: resaltado y más grande
-                        folium.CircleMarker(
-                            location=[row['latitud'], row['longitud']],
-                            radius=radius * 1.5,  # 50% más grande
-                            popup=folium.Popup(popup_html, max_width=300),
-                            color='white',
-                            fill=True,
-                            fill_color=color,
-                            fill_opacity=0.9,
-                            weight=3
-                        ).add_to(m)
-                    else:
-                        # Otros municipios: más tenues pero manteniendo su color
-                        folium.CircleMarker(
-                            location=[row['latitud'], row['longitud']],
-                            radius=radius * 0.8,  # 20% más pequeño
-                            popup=folium.Popup(popup_html, max_width=300),
-                            color=color,
-                            fill=True,
-                            fill_color=color,
-                            fill_opacity=0.4,  # Más transparente
-                            weight=1
-                        ).add_to(m)
-                else:
-                    # Visualización normal cuando no hay municipio seleccionado
-                    folium.CircleMarker(
-                        location=[row['latitud'], row['longitud']],
-                        radius=radius,
-                        popup=folium.Popup(popup_html, max_width=300),
-                        color=color,
-                        fill=True,
-                        fill_color=color,
-                        fill_opacity=0.7,
-                        weight=1
-                    ).add_to(m)
+            potencial = df['potencial_expansion'].astype(float).to_numpy()
+            
+            # Color según el potencial de expansión: alto, medio o bajo
+            color = np.select(
+                [potencial > 70, potencial > 40],
+                ['#ff4444', '#ffbb33'],
+                default='#00C851'
+            )
+            
+            # Popups de todos los municipios
+            categoria = df['categoria_expansion'] if 'categoria_expansion' in df.columns else 'No definida'
+            score = df['prioridad_score'] if 'prioridad_score' in df.columns else np.zeros(len(df))
+            popups = build_popup_html(
+                df['municipio'],
+                [
+                    ('Potencial', format_values(potencial, '%.1f') + '%'),
+                    ('Actividades actuales', format_values(df['num_actividades'])),
+                    ('Actividades sugeridas', format_values(df['actividades_sugeridas'])),
+                    ('Prioridad', pd.Series(categoria, index=df.index).fillna('No definida')),
+                    ('Score', format_values(score, '%.2f'))
+                ]
+            )
+            
+            # Ajustar el tamaño del círculo según el potencial
+            radius = 8 + potencial / 10
+            
+            if 'municipio_seleccionado' in df.columns:
+                # Municipio seleccionado resaltado y más grande; el resto más tenue
+                seleccionado = (df['municipio'] == df['municipio_seleccionado'].iloc[0]).to_numpy()
+                add_circle_layer(
+                    m,
+                    df['latitud'],
+                    df['longitud'],
+                    popup=popups,
+                    radius=np.where(seleccionado, radius * 1.5, radius * 0.8),
+                    color=np.where(seleccionado, 'white', color),
+                    fill_color=color,
+                    fill_opacity=np.where(seleccionado, 0.9, 0.4),
+                    weight=np.where(seleccionado, 3, 1)
+                )
+            else:
+                # Visualización normal cuando no hay municipio seleccionado
+                add_circle_layer(
+                    m,
+                    df['latitud'],
+                    df['longitud'],
+                    popup=popups,
+                    radius=radius,
+                    color=color,
+                    fill_opacity=0.7,
+                    weight=1
+                )
             
             # Agregar leyenda
             legend_html = """
@@ -0,0 +1,170 @@
+import os
+import copy
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from pathlib import Path
+import joblib
+
+logger = logging.getLogger(__name__)
+
+# Resultados guardados en memoria por proceso antes de descartar los menos usados
+DEFAULT_MEMORY_ENTRIES = int(os.getenv('GEOGRAPHIC_CACHE_ENTRIES', '64'))
+# Vigencia de un resultado, en segundos (los datos de actividades cambian sin reentrenar)
+DEFAULT_TTL = int(os.getenv('GEOGRAPHIC_CACHE_TTL', '3600'))
+# Resultados que se conservan en disco; al guardar se eliminan los vencidos y los más antiguos
+DEFAULT_DISK_ENTRIES = int(os.getenv('GEOGRAPHIC_CACHE_DISK_ENTRIES', '512'))
+# Valores que la consulta de features trata como 'sin filtro' (además de vacío o None)
+SIN_FILTRO = {'municipio': {'Todos'}, 'zona_geografica': {'Todas'}}
+FILTER_KEYS = ('zona_geografica', 'departamento', 'municipio', 'fecha_inicio', 'fecha_fin', 'tipo_actividad')
+
+def normalize_filters(input_data: dict) -> tuple:
+    """
+    Tupla canónica de filtros: los valores que la consulta ignora ('', 'Todos'
+    en municipio, 'Todas' en zona) pasan a None y las fechas se llevan a ISO,
+    de modo que entradas equivalentes de la app, la API o un proceso batch
+    compartan la misma entrada del cache.
+    """
+    normalized = []
+    for key in FILTER_KEYS:
+        value = input_data.get(key)
+        if isinstance(value, datetime):
+            value = value.isoformat() if value.time() != datetime.min.time() else value.date().isoformat()
+        elif isinstance(value, date):
+            value = value.isoformat()
+        elif isinstance(value, str):
+            if value == '' or value in SIN_FILTRO.get(key, ()):
+                value = None
+        normalized.append(value)
+    return tuple(normalized)
+
+def artifacts_hash(paths) -> str:
+    """Firma de los artefactos del modelo a partir de nombre, tamaño y fecha de modificación"""
+    version = []
+    for path in paths:
+        try:
+            stat = Path(path).stat()
+            version.append([Path(path).name, stat.st_size, stat.st_mtime_ns])
+        except FileNotFoundError:
+            version.append([Path(path).name, None, None])
+    return hashlib.sha256(json.dumps(version).encode('utf-8')).hexdigest()[:16]
+
+class PredictionResultCache:
+    """
+    Cache de resultados completos de GeographicPredictor.predict.
+
+    La clave es la tupla normalizada de filtros más la firma de los artefactos
+    del modelo, así que al reentrenar las entradas anteriores dejan de usarse.
+    Tiene un nivel en memoria (LRU) y otro en disco compartido entre procesos;
+    no depende de Streamlit, por lo que sirve igual a la app, la API y los
+    procesos batch. Cada entrada vence después de ttl segundos; el disco se
+    limpia al guardar, dejando a lo sumo max_disk_entries archivos vigentes.
+    """
+
+    def __init__(self, cache_dir, max_entries: int = DEFAULT_MEMORY_ENTRIES, ttl: int = DEFAULT_TTL,
+                 max_disk_entries: int = DEFAULT_DISK_ENTRIES):
+        self.cache_dir = Path(cache_dir)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, filters: tuple, model_hash: str) -> str:
+        raw = json.dumps([list(filters), model_hash], ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _expired(self, entry: dict) -> bool:
+        return time.time() - entry['creado'] > self.ttl
+
+    def get(self, filters: tuple, model_hash: str):
+        """Retorna una copia del resultado cacheado o None"""
+        key = self._key(filters, model_hash)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry):
+                    self._memory.move_to_end(key)
+                    return copy.deepcopy(entry['resultado'])
+                del self._memory[key]
+
+        path = self.cache_dir / f'{key}.joblib'
+        if path.exists():
+            try:
+                entry = joblib.load(path)
+                if not self._expired(entry):
+                    self._remember(key, entry)
+                    return copy.deepcopy(entry['resultado'])
+                path.unlink(missing_ok=True)
+            except Exception as e:
+                logger.warning(f"Error leyendo resultado geográfico cacheado: {str(e)}")
+        return None
+
+    def set(self, filters: tuple, model_hash: str, result: dict):
+        """Guarda el resultado completo en memoria y en disco"""
+        key = self._key(filters, model_hash)
+        entry = {'creado': time.time(), 'resultado': copy.deepcopy(result)}
+        self._remember(key, entry)
+
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.cache_dir / f'{key}.joblib.tmp'
+            joblib.dump(entry, tmp_path)
+            os.replace(tmp_path, self.cache_dir / f'{key}.joblib')
+        except OSError as e:
+            logger.warning(f"No se pudo guardar el resultado geográfico en disco: {str(e)}")
+            return
+        self._prune_disk()
+
+    def _prune_disk(self):
+        """
+        Elimina los archivos vencidos (la fecha de modificación es la de creación
+        de la entrada) y, si aún sobran, los más antiguos. Así también se
+        descartan las entradas de firmas de modelo anteriores, que no se vuelven a leer.
+        """
+        files = []
+        for path in self.cache_dir.glob('*.joblib'):
+            try:
+                files.append((path.stat().st_mtime, path))
+            except OSError:
+                continue
+        files.sort(reverse=True)
+
+        limite = time.time() - self.ttl
+        stale = [path for mtime, path in files[self.max_disk_entries:]]
+        stale += [path for mtime, path in files[:self.max_disk_entries] if mtime < limite]
+        for path in stale:
+            try:
+                path.unlink(missing_ok=True)
+            except OSError as e:
+                logger.warning(f"No se pudo eliminar el resultado geográfico {path.name}: {str(e)}")
+        if stale:
+            logger.info(f"Resultados geográficos eliminados del disco: {len(stale)}")
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def clear(self):
+        """Vacía el nivel en memoria (el de disco se invalida por firma del modelo y vigencia)"""
+        with self._lock:
+            self._memory.clear()
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_result_cache(models_dir) -> PredictionResultCache:
+    """Cache compartido por el proceso para el directorio de modelos indicado"""
+    cache_dir = Path(models_dir) / 'result_cache'
+    with _caches_lock:
+        if cache_dir not in _caches:
+            _caches[cache_dir] = PredictionResultCache(cache_dir)
+        return _caches[cache_dir]
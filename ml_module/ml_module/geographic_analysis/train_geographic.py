@@ -19,6 +19,7 @@ root_dir = Path(__file__).parent.parent.parent
 sys.path.append(str(root_dir))
 
 from utils.data_loader import DataLoader
+from municipal_features import build_training_query, centroides_disponibles
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -38,92 +39,7 @@ class GeographicTrainer:
     def prepare_geographic_data(self):
         """Prepara los datos geográficos para el clustering"""
         try:
-            query = """
-                WITH municipios_base AS (
-                    SELECT DISTINCT 
-                        m.municipio,
-                        m.departamento,
-                        m.geometry,
-                        COALESCE(a.zona_geografica, 'No definida') as zona_geografica
-                    FROM actividades_municipios m
-                    LEFT JOIN actividades a ON 
-                        m.municipio = a.municipio AND 
-                        m.departamento = a.departamento
-                    WHERE m.geometry IS NOT NULL
-                ),
-                categorias_municipio AS (
-                    SELECT 
-                        municipio,
-                        departamento,
-                        categoria_unica::integer as categoria_unica,
-                        COUNT(*) as conteo
-                    FROM actividades
-                    WHERE categoria_unica IS NOT NULL
-                    AND categoria_unica ~ '^[0-9]+$'  -- Asegurar que es numérico
-                    GROUP BY municipio, departamento, categoria_unica
-                ),
-                categoria_principal AS (
-                    SELECT DISTINCT ON (municipio, departamento)
-                        municipio,
-                        departamento,
-                        categoria_unica
-                    FROM categorias_municipio
-                    ORDER BY municipio, departamento, conteo DESC
-                ),
-                activity_stats AS (
-                    SELECT 
-                        m.municipio,
-                        m.departamento,
-                        m.zona_geografica,
-                        ST_X(ST_Centroid(m.geometry::geometry)) as longitud,
-                        ST_Y(ST_Centroid(m.geometry::geometry)) as latitud,
-                        COUNT(a.*) as num_actividades,
-                        SUM(COALESCE(a.total_asistentes, 0)) as total_asistentes,
-                        COUNT(DISTINCT EXTRACT(MONTH FROM a.fecha)) as meses_activos,
-                        COALESCE(cp.categoria_unica, 0) as categoria_unica,
-                        COUNT(*) as actividades_tipo
-                    FROM municipios_base m
-                    LEFT JOIN actividades a ON 
-                        m.municipio = a.municipio AND 
-                        m.departamento = a.departamento AND
-                        a.fecha >= '2014-01-01'
-                    LEFT JOIN categoria_principal cp ON
-                        m.municipio = cp.municipio AND
-                        m.departamento = cp.departamento
-                    GROUP BY 
-                        m.municipio, 
-                        m.departamento, 
-                        m.zona_geografica,
-                        m.geometry,
-                        cp.categoria_unica
-                )
-                SELECT 
-                    municipio,
-                    departamento,
-                    zona_geografica,
-                    longitud,
-                    latitud,
-                    num_actividades,
-                    total_asistentes,
-                    meses_activos,
-                    categoria_unica,
-                    actividades_tipo,
-                    CASE 
-                        WHEN num_actividades > 0 THEN total_asistentes::float / num_actividades 
-                        ELSE 0 
-                    END as promedio_asistentes,
-                    CASE 
-                        WHEN meses_activos > 0 THEN num_actividades::float / meses_activos 
-                        ELSE 0 
-                    END as intensidad_mensual,
-                    CASE 
-                        WHEN num_actividades > 0 THEN total_asistentes::float / num_actividades 
-                        ELSE 0 
-                    END as eficiencia_actividad
-                FROM activity_stats
-                WHERE longitud IS NOT NULL AND latitud IS NOT NULL
-            """
-            
+            query = build_training_query(centroides_disponibles(self.data_loader.engine))
             df = pd.read_sql(query, self.data_loader.engine)
             logger.info(f"Datos geográficos cargados: {len(df)} municipios")
             
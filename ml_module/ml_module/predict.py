@@ -10,7 +10,9 @@ import pandas as pd
 # Ajustar el cálculo del directorio raíz
 root_dir = Path(__file__).parent.parent
 sys.path.append(str(root_dir))
+sys.path.append(str(Path(__file__).parent))
 
+import copy
 import joblib
 import pandas as pd
 import numpy as np
@@ -18,14 +20,58 @@ from feature_engineering import FeatureEngineer
 import logging
 from scipy.stats import norm
 from utils.data_loader import DataLoader
+from utils.feature_store import existe_feature_store, obtener_features, obtener_features_lote, calcular_features_lote
 from scipy import stats
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class HistoricalContext:
+    """
+    Contexto de una predicción: memoriza los datos históricos consultados por
+    (departamento, municipio, categoria, fecha) para que las distintas etapas de
+    la predicción no repitan las mismas consultas a la base de datos.
+    """
+    def __init__(self, predictor):
+        self.predictor = predictor
+        self._cache = {}
+
+    def memoize(self, key, func):
+        """Ejecuta func solo la primera vez que se pide key; devuelve una copia del resultado"""
+        if key not in self._cache:
+            self._cache[key] = func()
+        # Copia para que las etapas que modifican el diccionario no alteren el cache
+        return copy.deepcopy(self._cache[key])
+
+    def get_historical_data(self, departamento: str, categoria_unica: str, fecha: str, municipio: str = None) -> dict:
+        return self.memoize(
+            ('historico', departamento, municipio, categoria_unica, str(fecha)),
+            lambda: self.predictor._get_historical_data(departamento, categoria_unica, fecha, municipio)
+        )
+
+    def set_historical_data(self, departamento: str, categoria_unica: str, fecha: str, municipio: str, data: dict):
+        """Registra datos históricos ya resueltos (por ejemplo, en bloque para un lote)"""
+        self._cache[('historico', departamento, municipio, categoria_unica, str(fecha))] = data
+
+    def has_historical_data(self, departamento: str, categoria_unica: str, fecha: str, municipio: str) -> bool:
+        return ('historico', departamento, municipio, categoria_unica, str(fecha)) in self._cache
+
+# Artefactos que carga AttendancePredictor; el registro de modelos de la API
+# los vigila para recargar el predictor cuando cambian en disco
+MODEL_ARTIFACTS = [
+    'attendance_predictor.joblib',
+    'model_info.json',
+    'feature_list.json',
+    'category_mappings.joblib',
+    'feature_importance.csv'
+]
+
 class AttendancePredictor:
-    def __init__(self, model_path=None):
-        """Inicializa el predictor cargando el modelo y los recursos necesarios"""
+    def __init__(self, model_path=None, data_loader: DataLoader = None):
+        """
+        Inicializa el predictor cargando el modelo y los recursos necesarios.
+        Si se recibe data_loader se reutiliza su engine en lugar de crear uno nuevo.
+        """
         try:
             if model_path is None:
                 model_path = root_dir / 'models' / 'attendance_predictor.joblib'
@@ -64,7 +110,11 @@ class AttendancePredictor:
                 ]
             
             # Agregar DataLoader
-            self.data_loader = DataLoader()
+            self.data_loader = data_loader or DataLoader()
+            
+            # Si el feature store está construido, las estadísticas históricas se leen de ahí
+            self.usar_feature_store = existe_feature_store(self.data_loader.engine)
+            logger.info(f"Feature store disponible: {self.usar_feature_store}")
             
             logger.info("Modelo cargado exitosamente")
             logger.info(f"Número de features esperadas: {len(self.expected_features)}")
@@ -81,6 +131,18 @@ class AttendancePredictor:
             logger.info(f"- Categoría: {categoria_unica}")
             logger.info(f"- Fecha: {fecha}")
             
+            if self.usar_feature_store:
+                try:
+                    result_dict = obtener_features(
+                        self.data_loader.engine, departamento, categoria_unica, fecha, municipio
+                    )
+                    if result_dict is not None:
+                        logger.info(f"Usando feature store (corte {result_dict['as_of_month']})")
+                        return result_dict
+                    logger.info("Sin fila en el feature store, consultando actividades")
+                except Exception as e:
+                    logger.warning(f"Error leyendo feature store, consultando actividades: {str(e)}")
+            
             fecha_dt = pd.to_datetime(fecha)
             params = {
                 'departamento': departamento,
@@ -352,122 +414,139 @@ class AttendancePredictor:
         except:
             return 0.0
 
-    def prepare_input_features(self, input_data: dict) -> pd.DataFrame:
+    def prepare_input_features(self, input_data: dict, context: HistoricalContext = None) -> pd.DataFrame:
         try:
-            # Convertir fecha a datetime
-            fecha_dt = pd.to_datetime(input_data['fecha'])
+            context = context or HistoricalContext(self)
             
             # Obtener datos históricos
-            historical_data = self._get_historical_data(
+            historical_data = context.get_historical_data(
                 input_data['departamento'],
                 input_data['categoria_unica'],
                 input_data['fecha'],
                 input_data.get('municipio')
             )
             
-            # Asegurar que los valores no sean None
-            promedio_movil = historical_data.get('promedio_movil_30', 0) or 0
-            promedio_mismo_mes = historical_data.get('promedio_mismo_mes_cat', 0) or 0
-            promedio_mismo_dia = historical_data.get('promedio_mismo_dia_semana_cat', 0) or 0
-            dia_semana_comun = historical_data.get('dia_semana_mas_comun', 0) or 0
-            mes_comun = historical_data.get('mes_mas_comun', 0) or 0
-            
-            # Manejar asistentes_previos cuando es None
-            asistentes_previos = historical_data.get('asistentes_previos', [])
-            if asistentes_previos is None:
-                asistentes_previos = []
-            
-            # Características temporales y principales
-            features_dict = {
-                # Features temporales
-                'mes': fecha_dt.month,
-                'dia_semana': fecha_dt.weekday(),
-                'trimestre': (fecha_dt.month - 1) // 3 + 1,
-                'es_fin_semana': 1 if fecha_dt.weekday() >= 5 else 0,
-                'es_mismo_mes_que_historico': 1 if fecha_dt.month == mes_comun else 0,
-                'es_mismo_dia_semana_que_historico': 1 if fecha_dt.weekday() == dia_semana_comun else 0,
-                
-                # Features de actividad
-                'actividades_previas': len(asistentes_previos),
-                'actividades_acumuladas_departamento': historical_data.get('actividades_departamento', 0) or 0,
-                'actividades_acumuladas_categoria_unica': historical_data.get('actividades_categoria', 0) or 0,
-                
-                # Features de promedios y medianas
-                'promedio_historico_categoria_unica': historical_data.get('promedio_categoria', 0) or 0,
-                'mediana_historica_categoria_unica': historical_data.get('mediana_categoria', 0) or 0,
-                'promedio_historico_departamento': historical_data.get('promedio_departamento', 0) or 0,
-                'mediana_historica_departamento': historical_data.get('mediana_departamento', 0) or 0,
-                
-                # Features de volatilidad
-                'volatilidad_departamento': historical_data.get('desviacion_departamento', 0) or 0,
-                'volatilidad_categoria_unica': historical_data.get('desviacion_categoria', 0) or 0,
-                
-                # Features de tendencia
-                'tendencia_departamento': historical_data.get('tendencia_departamento', 0) or 0,
-                'tendencia_categoria_unica': historical_data.get('tendencia_categoria', 0) or 0,
-                
-                # Features de máximos y mínimos
-                'max_asistentes_departamento': historical_data.get('max_departamento', 0) or 0,
-                'min_asistentes_departamento': historical_data.get('min_departamento', 0) or 0,
-                'max_asistentes_categoria_unica': historical_data.get('max_categoria', 0) or 0,
-                'min_asistentes_categoria_unica': historical_data.get('min_categoria', 0) or 0,
-                
-                # Promedios móviles
-                'avg_asistentes_departamento_30': historical_data.get('promedio_movil_30', 0) or 0,
-                'avg_asistentes_categoria_unica_30': historical_data.get('promedio_movil_30', 0) or 0,
-                
-                # Features de frecuencia
-                'categoria_unica_frequency': (
-                    historical_data.get('actividades_categoria', 0) / historical_data.get('actividades_departamento', 0)
-                    if historical_data.get('actividades_departamento', 0) > 0 else 0
-                ),
-                'departamento_frequency': (
-                    historical_data.get('actividades_departamento', 0) / 3704  # Total de actividades en la base
-                ),
-                'zona_geografica_frequency': (
-                    historical_data.get('actividades_departamento', 0) / 3704  # Total de actividades en la base
-                ),
-                'promedio_mismo_mes_dept': historical_data.get('promedio_mismo_mes_dept', 0) or 0,
-                'promedio_mismo_mes_cat': promedio_mismo_mes,
-                'promedio_mismo_dia_semana_cat': promedio_mismo_dia,
-                'dia_semana_mas_comun': dia_semana_comun,
-                'mes_mas_comun': mes_comun,
-                'trimestre_mas_comun': historical_data.get('trimestre_mas_comun', 0) or 0,
-                'percentil_asistentes_categoria': historical_data.get('percentil_asistentes_categoria', 0.5)
-            }
-            
-            # Calcular rankings y percentiles
-            features_dict.update({
-                'ranking_asistentes_departamento': self._calculate_ranking(
-                    historical_data.get('promedio_departamento', 0),
-                    historical_data.get('total_actividades_departamento', 1)
-                ),
-                'percentil_asistentes_departamento': self._calculate_percentile(
-                    historical_data.get('promedio_departamento', 0),
-                    historical_data.get('promedio_categoria', 0),
-                    historical_data.get('desviacion_categoria', 1)
-                ),
-                'ratio_asistentes_vs_promedio': (
-                    historical_data.get('promedio_categoria', 0) / 
-                    historical_data.get('promedio_departamento', 1)
-                    if historical_data.get('promedio_departamento', 0) > 0 else 1.0
-                )
-            })
-            
-            # Agregar encodings
-            features_dict.update({
-                'departamento_encoded': self._get_encoding(input_data['departamento'], 'departamento'),
-                'categoria_unica_encoded': self._get_encoding(input_data['categoria_unica'], 'categoria_unica'),
-                'zona_geografica_encoded': self._get_encoding(input_data['zona_geografica'], 'zona_geografica')
-            })
-            
-            # Asegurar que los valores sean escalares y no Series
-            for key in features_dict:
-                if isinstance(features_dict[key], (pd.Series, np.ndarray)):
-                    features_dict[key] = features_dict[key].iloc[0] if isinstance(features_dict[key], pd.Series) else features_dict[key][0]
+            features_dict = self._build_feature_dict(input_data, historical_data)
+            return self._features_to_frame([features_dict])
             
+        except Exception as e:
+            logger.error(f"Error al preparar features: {str(e)}")
+            logger.error(f"Input data: {input_data}")
+            raise
+
+    def _build_feature_dict(self, input_data: dict, historical_data: dict) -> dict:
+        """Construye el diccionario de features de una fila a partir de sus datos históricos"""
+        # Convertir fecha a datetime
+        fecha_dt = pd.to_datetime(input_data['fecha'])
+        
+        # Asegurar que los valores no sean None
+        promedio_movil = historical_data.get('promedio_movil_30', 0) or 0
+        promedio_mismo_mes = historical_data.get('promedio_mismo_mes_cat', 0) or 0
+        promedio_mismo_dia = historical_data.get('promedio_mismo_dia_semana_cat', 0) or 0
+        dia_semana_comun = historical_data.get('dia_semana_mas_comun', 0) or 0
+        mes_comun = historical_data.get('mes_mas_comun', 0) or 0
+        
+        # Manejar asistentes_previos cuando es None
+        asistentes_previos = historical_data.get('asistentes_previos', [])
+        if asistentes_previos is None:
+            asistentes_previos = []
+        
+        # Características temporales y principales
+        features_dict = {
+            # Features temporales
+            'mes': fecha_dt.month,
+            'dia_semana': fecha_dt.weekday(),
+            'trimestre': (fecha_dt.month - 1) // 3 + 1,
+            'es_fin_semana': 1 if fecha_dt.weekday() >= 5 else 0,
+            'es_mismo_mes_que_historico': 1 if fecha_dt.month == mes_comun else 0,
+            'es_mismo_dia_semana_que_historico': 1 if fecha_dt.weekday() == dia_semana_comun else 0,
+            
+            # Features de actividad
+            'actividades_previas': len(asistentes_previos),
+            'actividades_acumuladas_departamento': historical_data.get('actividades_departamento', 0) or 0,
+            'actividades_acumuladas_categoria_unica': historical_data.get('actividades_categoria', 0) or 0,
+            
+            # Features de promedios y medianas
+            'promedio_historico_categoria_unica': historical_data.get('promedio_categoria', 0) or 0,
+            'mediana_historica_categoria_unica': historical_data.get('mediana_categoria', 0) or 0,
+            'promedio_historico_departamento': historical_data.get('promedio_departamento', 0) or 0,
+            'mediana_historica_departamento': historical_data.get('mediana_departamento', 0) or 0,
+            
+            # Features de volatilidad
+            'volatilidad_departamento': historical_data.get('desviacion_departamento', 0) or 0,
+            'volatilidad_categoria_unica': historical_data.get('desviacion_categoria', 0) or 0,
+            
+            # Features de tendencia
+            'tendencia_departamento': historical_data.get('tendencia_departamento', 0) or 0,
+            'tendencia_categoria_unica': historical_data.get('tendencia_categoria', 0) or 0,
+            
+            # Features de máximos y mínimos
+            'max_asistentes_departamento': historical_data.get('max_departamento', 0) or 0,
+            'min_asistentes_departamento': historical_data.get('min_departamento', 0) or 0,
+            'max_asistentes_categoria_unica': historical_data.get('max_categoria', 0) or 0,
+            'min_asistentes_categoria_unica': historical_data.get('min_categoria', 0) or 0,
+            
+            # Promedios móviles
+            'avg_asistentes_departamento_30': historical_data.get('promedio_movil_30', 0) or 0,
+            'avg_asistentes_categoria_unica_30': historical_data.get('promedio_movil_30', 0) or 0,
+            
+            # Features de frecuencia
+            'categoria_unica_frequency': (
+                historical_data.get('actividades_categoria', 0) / historical_data.get('actividades_departamento', 0)
+                if historical_data.get('actividades_departamento', 0) > 0 else 0
+            ),
+            'departamento_frequency': (
+                historical_data.get('actividades_departamento', 0) / 3704  # Total de actividades en la base
+            ),
+            'zona_geografica_frequency': (
+                historical_data.get('actividades_departamento', 0) / 3704  # Total de actividades en la base
+            ),
+            'promedio_mismo_mes_dept': historical_data.get('promedio_mismo_mes_dept', 0) or 0,
+            'promedio_mismo_mes_cat': promedio_mismo_mes,
+            'promedio_mismo_dia_semana_cat': promedio_mismo_dia,
+            'dia_semana_mas_comun': dia_semana_comun,
+            'mes_mas_comun': mes_comun,
+            'trimestre_mas_comun': historical_data.get('trimestre_mas_comun', 0) or 0,
+            'percentil_asistentes_categoria': historical_data.get('percentil_asistentes_categoria', 0.5)
+        }
+        
+        # Calcular rankings y percentiles
+        features_dict.update({
+            'ranking_asistentes_departamento': self._calculate_ranking(
+                historical_data.get('promedio_departamento', 0),
+                historical_data.get('total_actividades_departamento', 1)
+            ),
+            'percentil_asistentes_departamento': self._calculate_percentile(
+                historical_data.get('promedio_departamento', 0),
+                historical_data.get('promedio_categoria', 0),
+                historical_data.get('desviacion_categoria', 1)
+            ),
+            'ratio_asistentes_vs_promedio': (
+                historical_data.get('promedio_categoria', 0) / 
+                historical_data.get('promedio_departamento', 1)
+                if historical_data.get('promedio_departamento', 0) > 0 else 1.0
+            )
+        })
+        
+        # Agregar encodings
+        features_dict.update({
+            'departamento_encoded': self._get_encoding(input_data['departamento'], 'departamento'),
+            'categoria_unica_encoded': self._get_encoding(input_data['categoria_unica'], 'categoria_unica'),
+            'zona_geografica_encoded': self._get_encoding(input_data['zona_geografica'], 'zona_geografica')
+        })
+        
+        # Asegurar que los valores sean escalares y no Series
+        for key in features_dict:
+            if isinstance(features_dict[key], (pd.Series, np.ndarray)):
+                features_dict[key] = features_dict[key].iloc[0] if isinstance(features_dict[key], pd.Series) else features_dict[key][0]
+        
+        return features_dict
+
+    def _features_to_frame(self, features_dicts: list) -> pd.DataFrame:
+        """Convierte una lista de diccionarios de features en la matriz que espera el modelo"""
+        try:
             # Crear DataFrame y asegurar tipos
-            df_final = pd.DataFrame([features_dict])
+            df_final = pd.DataFrame(features_dicts)
             
             # Convertir todas las columnas a float64
             for col in df_final.columns:
@@ -491,7 +570,6 @@ class AttendancePredictor:
             
         except Exception as e:
             logger.error(f"Error al preparar features: {str(e)}")
-            logger.error(f"Input data: {input_data}")
             logger.error("Features esperadas vs generadas:")
             logger.error(f"Esperadas ({len(self.expected_features)}): {self.expected_features}")
             if 'df_final' in locals():
@@ -521,8 +599,11 @@ class AttendancePredictor:
                 if field not in input_data:
                     raise ValueError(f"Campo requerido faltante: {field}")
             
+            # Las consultas históricas se hacen una sola vez por predicción
+            context = HistoricalContext(self)
+            
             # Obtener datos históricos
-            historical_data = self._get_historical_data(
+            historical_data = context.get_historical_data(
                 input_data['departamento'],
                 input_data['categoria_unica'],
                 input_data['fecha'],
@@ -538,7 +619,7 @@ class AttendancePredictor:
             if total_actividades < 1:
                 logger.warning(f"Datos históricos insuficientes. Total actividades: {total_actividades}")
                 # En lugar de lanzar error, usar datos del departamento
-                historical_data = self._get_historical_data(
+                historical_data = context.get_historical_data(
                     input_data['departamento'],
                     input_data['categoria_unica'],
                     input_data['fecha'],
@@ -549,7 +630,7 @@ class AttendancePredictor:
             logger.info(f"Procesando predicción con {total_actividades} actividades históricas")
             
             # Preparar features
-            df = self.prepare_input_features(input_data)
+            df = self.prepare_input_features(input_data, context)
             
             # Verificar que tenemos todas las features necesarias
             if df.shape[1] != len(self.expected_features):
@@ -561,58 +642,15 @@ class AttendancePredictor:
             logger.info(f"Predicción base: {prediction_base}")
             
             # Obtener datos históricos
-            historical_data = self._get_historical_data(
+            historical_data = context.get_historical_data(
                 input_data['departamento'],
                 input_data['categoria_unica'],
                 input_data['fecha'],
                 input_data.get('municipio')
             )
             
-            # Asegurar valores no nulos
             promedio_categoria = historical_data.get('promedio_categoria', 0)
-            promedio_movil = historical_data.get('promedio_movil_30', 0) or 0
-            max_categoria = historical_data.get('max_categoria', 0) or 0
-            promedio_mismo_mes = historical_data.get('promedio_mismo_mes_cat', 0) or 0
-            promedio_mismo_dia = historical_data.get('promedio_mismo_dia_semana_cat', 0) or 0
-            
-            # Ajustar predicción según promedios históricos
-            prediction_adjusted = prediction_base * (
-                0.5 +  # Reducir peso de predicción base
-                0.25 * (promedio_mismo_mes / promedio_categoria if promedio_categoria > 0 else 1.0) +
-                0.25 * (promedio_mismo_dia / promedio_categoria if promedio_categoria > 0 else 1.0)
-            )
-            
-            # Establecer límites más estrictos
-            min_prediction = max(
-                promedio_categoria * 0.4,  # No menor al 40% del promedio
-                promedio_movil * 0.5 if promedio_movil > 0 else 5
-            )
-            
-            max_prediction = min(
-                max_categoria * 1.1,  # Solo 10% más que máximo histórico
-                promedio_categoria * 1.5  # Máximo 50% sobre el promedio
-            )
-            
-            # Validar predicción
-            if not self._validate_prediction(prediction_adjusted, historical_data):
-                # Si la predicción es atípica, ajustar hacia el promedio
-                prediction_adjusted = (prediction_adjusted + promedio_categoria) / 2
-            
-            prediction_final = np.clip(prediction_adjusted, min_prediction, max_prediction)
-            
-            # Validación final de realismo
-            if prediction_final > promedio_categoria * 2:
-                logger.warning("Predicción muy alta, ajustando...")
-                prediction_final = promedio_categoria * 1.5
-            
-            # Calcular nivel de confianza basado en la variación temporal
-            desviacion = historical_data.get('desviacion_categoria', 1) or 1
-            variacion_temporal = abs(prediction_final - promedio_mismo_mes) / desviacion
-            std_distances = min(
-                abs(prediction_final - promedio_movil) / desviacion,
-                variacion_temporal
-            )
-            confidence = 'Alta' if std_distances < 1 else 'Media' if std_distances < 2 else 'Baja'
+            prediction_final, confidence = self._ajustar_prediccion(prediction_base, historical_data)
             
             # Calcular importancia de variables de forma dinámica
             feature_importance = {
@@ -691,14 +729,15 @@ class AttendancePredictor:
             # Calcular insights dinámicos
             mejor_dia = self._calcular_mejor_dia(historical_data)
             tendencia = self._calcular_tendencia(historical_data)
-            confianza = self._calcular_confianza(input_data, prediction_final)
+            confianza = self._calcular_confianza(input_data, prediction_final, context)
             
             # Calcular recomendaciones dinámicas
             recomendaciones = self._generar_recomendaciones(
                 historical_data,
                 input_data,
                 prediction_final,
-                feature_importance
+                feature_importance,
+                context
             )
             
             # Agregar al resultado
@@ -728,6 +767,167 @@ class AttendancePredictor:
             logger.error(f"Error en predicción: {str(e)}")
             raise
 
+    def predict_batch(self, inputs: list) -> list:
+        """
+        Predice la asistencia para muchas combinaciones (municipio, categoría, fecha).
+
+        Los datos históricos del lote se resuelven en una sola consulta al feature
+        store y, para las combinaciones sin fila, en una consulta en vivo por
+        (departamento, categoría). El modelo puntúa la matriz completa en una
+        sola llamada y los resultados se retornan en el orden de entrada, con la
+        confianza como número entre 0 y 1 igual que predict(). Una fila inválida
+        retorna {'error': ...} sin detener el lote.
+        """
+        context = HistoricalContext(self)
+        resultados = [None] * len(inputs)
+        required_fields = ['departamento', 'municipio', 'categoria_unica', 'fecha']
+        
+        validas = []
+        for i, input_data in enumerate(inputs):
+            faltantes = [field for field in required_fields if field not in input_data]
+            if faltantes:
+                resultados[i] = {'error': f"Campos requeridos faltantes: {', '.join(faltantes)}"}
+            else:
+                validas.append(i)
+        
+        self._precargar_historicos([inputs[i] for i in validas], context)
+        
+        indices, features, historicos = [], [], []
+        for i in validas:
+            input_data = inputs[i]
+            try:
+                historical_data = context.get_historical_data(
+                    input_data['departamento'],
+                    input_data['categoria_unica'],
+                    input_data['fecha'],
+                    input_data['municipio']
+                )
+                features.append(self._build_feature_dict(input_data, historical_data))
+                historicos.append(historical_data)
+                indices.append(i)
+            except Exception as e:
+                logger.error(f"Error preparando fila {i} del lote: {str(e)}")
+                resultados[i] = {'error': str(e)}
+        
+        if not features:
+            return resultados
+        
+        # Una sola llamada al modelo para todo el lote
+        X = self._features_to_frame(features)
+        predicciones = self.model.predict(X.values)
+        
+        for i, historical_data, prediction_base in zip(indices, historicos, predicciones):
+            prediction_final, nivel_confianza = self._ajustar_prediccion(prediction_base, historical_data)
+            resultados[i] = {
+                'prediccion_asistentes': round(float(prediction_final), 0),
+                # Mismo cálculo que predict(); los históricos ya están en el contexto
+                'confianza_prediccion': float(self._calcular_confianza(inputs[i], prediction_final, context)),
+                'nivel_confianza': nivel_confianza,
+                'promedio_historico': float(historical_data.get('promedio_categoria', 0) or 0),
+                'total_actividades': int(historical_data.get('total_actividades_categoria', 0) or 0)
+            }
+        
+        logger.info(f"Lote procesado: {len(indices)} predicciones, {len(inputs) - len(indices)} con error")
+        return resultados
+
+    def _precargar_historicos(self, inputs: list, context: HistoricalContext):
+        """
+        Resuelve en bloque los datos históricos de un lote: primero con una
+        consulta al feature store y, para las combinaciones que no estén ahí,
+        con una consulta en vivo por (departamento, categoría) que calcula
+        todas sus (municipio, fecha) a la vez.
+        """
+        if not inputs:
+            return
+        
+        consultas = list(dict.fromkeys(
+            (input_data['departamento'], input_data['categoria_unica'], input_data['fecha'], input_data['municipio'])
+            for input_data in inputs
+        ))
+        if self.usar_feature_store:
+            try:
+                resultados = obtener_features_lote(self.data_loader.engine, consultas)
+                for (departamento, categoria_unica, fecha, municipio), historical_data in zip(consultas, resultados):
+                    if historical_data is not None:
+                        context.set_historical_data(departamento, categoria_unica, fecha, municipio, historical_data)
+            except Exception as e:
+                logger.warning(f"Error leyendo feature store en bloque, consultando actividades: {str(e)}")
+        
+        grupos = {}
+        for departamento, categoria_unica, fecha, municipio in consultas:
+            if not context.has_historical_data(departamento, categoria_unica, fecha, municipio):
+                grupos.setdefault((departamento, categoria_unica), []).append((municipio, fecha))
+        if not grupos:
+            return
+        
+        logger.info(
+            f"Consultando actividades en vivo para {sum(len(c) for c in grupos.values())} combinaciones "
+            f"en {len(grupos)} grupos (departamento, categoría)"
+        )
+        for (departamento, categoria_unica), claves in grupos.items():
+            try:
+                resultados = calcular_features_lote(self.data_loader.engine, departamento, categoria_unica, claves)
+            except Exception as e:
+                logger.error(f"Error calculando históricos de {departamento} - {categoria_unica}: {str(e)}")
+                resultados = [None] * len(claves)
+            # Sin actividades de la categoría se usan las estadísticas por defecto,
+            # igual que la consulta en vivo de _get_historical_data
+            for (municipio, fecha), historical_data in zip(claves, resultados):
+                context.set_historical_data(
+                    departamento, categoria_unica, fecha, municipio,
+                    historical_data if historical_data is not None else self._get_default_stats()
+                )
+
+    def _ajustar_prediccion(self, prediction_base: float, historical_data: dict):
+        """Ajusta la predicción del modelo con los promedios históricos y estima su confianza"""
+        # Asegurar valores no nulos
+        promedio_categoria = historical_data.get('promedio_categoria', 0)
+        promedio_movil = historical_data.get('promedio_movil_30', 0) or 0
+        max_categoria = historical_data.get('max_categoria', 0) or 0
+        promedio_mismo_mes = historical_data.get('promedio_mismo_mes_cat', 0) or 0
+        promedio_mismo_dia = historical_data.get('promedio_mismo_dia_semana_cat', 0) or 0
+        
+        # Ajustar predicción según promedios históricos
+        prediction_adjusted = prediction_base * (
+            0.5 +  # Reducir peso de predicción base
+            0.25 * (promedio_mismo_mes / promedio_categoria if promedio_categoria > 0 else 1.0) +
+            0.25 * (promedio_mismo_dia / promedio_categoria if promedio_categoria > 0 else 1.0)
+        )
+        
+        # Establecer límites más estrictos
+        min_prediction = max(
+            promedio_categoria * 0.4,  # No menor al 40% del promedio
+            promedio_movil * 0.5 if promedio_movil > 0 else 5
+        )
+        
+        max_prediction = min(
+            max_categoria * 1.1,  # Solo 10% más que máximo histórico
+            promedio_categoria * 1.5  # Máximo 50% sobre el promedio
+        )
+        
+        # Validar predicción
+        if not self._validate_prediction(prediction_adjusted, historical_data):
+            # Si la predicción es atípica, ajustar hacia el promedio
+            prediction_adjusted = (prediction_adjusted + promedio_categoria) / 2
+        
+        prediction_final = np.clip(prediction_adjusted, min_prediction, max_prediction)
+        
+        # Validación final de realismo
+        if prediction_final > promedio_categoria * 2:
+            logger.warning("Predicción muy alta, ajustando...")
+            prediction_final = promedio_categoria * 1.5
+        
+        # Calcular nivel de confianza basado en la variación temporal
+        desviacion = historical_data.get('desviacion_categoria', 1) or 1
+        variacion_temporal = abs(prediction_final - promedio_mismo_mes) / desviacion
+        std_distances = min(
+            abs(prediction_final - promedio_movil) / desviacion,
+            variacion_temporal
+        )
+        confidence = 'Alta' if std_distances < 1 else 'Media' if std_distances < 2 else 'Baja'
+        
+        return prediction_final, confidence
+
     def _calcular_mejor_dia(self, historical_data):
         """Calcula el mejor día basado en datos históricos"""
         try:
@@ -799,9 +999,11 @@ class AttendancePredictor:
             logger.error(f"Error calculando tendencia: {str(e)}")
             return 0
 
-    def _generar_recomendaciones(self, historical_data, input_data, prediccion, importancias):
+    def _generar_recomendaciones(self, historical_data, input_data, prediccion, importancias, context: HistoricalContext = None):
         """Genera recomendaciones basadas en datos históricos y predicción"""
         try:
+            context = context or HistoricalContext(self)
+            
             # Identificar factores clave (top 2 más importantes)
             factores_clave = sorted(importancias.items(), key=lambda x: x[1], reverse=True)[:2]
             
@@ -824,14 +1026,17 @@ class AttendancePredictor:
             query_final = query_mejor_mes.format(where_municipio=where_municipio)
             
             try:
-                mejor_mes_df = pd.read_sql_query(
-                    query_final,
-                    self.data_loader.engine,
-                    params={
-                        'departamento': input_data['departamento'],
-                        'categoria_unica': input_data['categoria_unica'],
-                        'municipio': input_data.get('municipio')
-                    }
+                mejor_mes_df = context.memoize(
+                    ('mejor_mes', input_data['departamento'], input_data.get('municipio'), input_data['categoria_unica']),
+                    lambda: pd.read_sql_query(
+                        query_final,
+                        self.data_loader.engine,
+                        params={
+                            'departamento': input_data['departamento'],
+                            'categoria_unica': input_data['categoria_unica'],
+                            'municipio': input_data.get('municipio')
+                        }
+                    )
                 )
                 
                 meses = {
@@ -867,11 +1072,13 @@ class AttendancePredictor:
                 'factores_clave': ['Histórico', 'Categoría']
             }
 
-    def _calcular_confianza(self, input_data, prediction):
+    def _calcular_confianza(self, input_data, prediction, context: HistoricalContext = None):
         """Calcula el nivel de confianza de la predicción"""
         try:
+            context = context or HistoricalContext(self)
+            
             # Obtener datos históricos
-            historical_data = self._get_historical_data(
+            historical_data = context.get_historical_data(
                 input_data['departamento'],
                 input_data['categoria_unica'],
                 input_data['fecha'],
@@ -0,0 +1,150 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Pronósticos guardados en memoria por proceso antes de descartar los menos usados
+DEFAULT_MEMORY_ENTRIES = int(os.getenv('FORECAST_CACHE_ENTRIES', '256'))
+
+class ForecastCache:
+    """
+    Cache de pronósticos de los modelos temporales.
+
+    Con un modelo entrenado fijo, el pronóstico depende solo del modelo y del
+    horizonte, así que se guarda por (model_key, versión del archivo del modelo,
+    periodos). Tiene un nivel en memoria (LRU) y otro en disco compartido entre
+    sesiones y procesos; al reentrenar cambia la versión del archivo y las
+    entradas anteriores dejan de usarse.
+
+    Los archivos del disco se nombran {modelo}_{versión}_{periodos}.json (los
+    dos primeros como hash), así que al guardar un pronóstico se eliminan los de
+    versiones anteriores del mismo modelo; prune descarta además los de modelos
+    que ya no existen.
+    """
+
+    def __init__(self, cache_dir, max_entries: int = DEFAULT_MEMORY_ENTRIES):
+        self.cache_dir = Path(cache_dir)
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, model_key: str, model_version, periods: int) -> str:
+        return f'{_hash(model_key)}_{_hash(model_version)}_{int(periods)}'
+
+    def get(self, model_key: str, model_version, periods: int):
+        """Retorna una copia del pronóstico cacheado o None"""
+        key = self._key(model_key, model_version, periods)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return _copy_forecast(entry)
+
+        path = self.cache_dir / f'{key}.json'
+        if path.exists():
+            try:
+                with open(path, 'r') as f:
+                    entry = json.load(f)
+                self._remember(key, entry)
+                return _copy_forecast(entry)
+            except Exception as e:
+                logger.warning(f"Error leyendo pronóstico cacheado de {model_key}: {str(e)}")
+        return None
+
+    def set(self, model_key: str, model_version, periods: int, forecast: dict):
+        """Guarda values, lower y upper del pronóstico en memoria y en disco"""
+        key = self._key(model_key, model_version, periods)
+        entry = {name: list(forecast[name]) for name in ('values', 'lower', 'upper')}
+        self._remember(key, entry)
+
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.cache_dir / f'{key}.json.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self.cache_dir / f'{key}.json')
+        except OSError as e:
+            logger.warning(f"No se pudo guardar el pronóstico de {model_key} en disco: {str(e)}")
+            return
+
+        # Un pronóstico nuevo implica que las versiones anteriores del modelo ya no se usan
+        model_hash, version_hash = _hash(model_key), _hash(model_version)
+        self._remove_files(
+            lambda parts: parts[0] == model_hash and parts[1] != version_hash
+        )
+
+    def prune(self, model_versions: dict) -> int:
+        """
+        Elimina del disco los pronósticos de modelos que no están en
+        model_versions (clave -> versión actual) o de versiones anteriores.
+        Retorna la cantidad de archivos eliminados.
+        """
+        valid = {(_hash(model_key), _hash(version)) for model_key, version in model_versions.items()}
+        removed = self._remove_files(lambda parts: (parts[0], parts[1]) not in valid)
+        if removed:
+            logger.info(f"Pronósticos cacheados obsoletos eliminados: {removed}")
+        return removed
+
+    def _remove_files(self, is_stale) -> int:
+        """Elimina los archivos del directorio para los que is_stale(partes del nombre) es verdadero"""
+        removed = 0
+        if not self.cache_dir.exists():
+            return removed
+        for path in self.cache_dir.glob('*.json'):
+            parts = path.stem.split('_')
+            # Archivos con otro formato de nombre (versiones anteriores del cache) también sobran
+            if len(parts) != 3 or is_stale(parts):
+                try:
+                    path.unlink()
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def clear(self):
+        """Vacía el nivel en memoria (el de disco se invalida por versión del modelo)"""
+        with self._lock:
+            self._memory.clear()
+
+
+def model_version(model_path):
+    """Versión del archivo de un modelo (mtime y tamaño), o None si no existe"""
+    try:
+        stat = Path(model_path).stat()
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _hash(value) -> str:
+    raw = json.dumps(value, ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:24]
+
+
+def _copy_forecast(entry: dict) -> dict:
+    # El predictor agrega claves al resultado, así que nunca se entrega la entrada cacheada
+    return {name: list(values) for name, values in entry.items()}
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_forecast_cache(models_path) -> ForecastCache:
+    """Cache compartido por el proceso para el directorio de modelos indicado"""
+    cache_dir = Path(models_path) / 'forecast_cache'
+    with _caches_lock:
+        if cache_dir not in _caches:
+            _caches[cache_dir] = ForecastCache(cache_dir)
+        return _caches[cache_dir]
@@ -0,0 +1,241 @@
+import os
+import json
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+import joblib
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = 'model_index.json'
+BEST_MODELS_FILE = 'best_models.json'
+# Archivos del directorio de modelos que no son modelos
+NON_MODEL_FILES = {'category_mappings', 'model_metrics'}
+# Presupuesto de memoria por defecto para los modelos cargados, en MB
+DEFAULT_MEMORY_BUDGET_MB = int(os.getenv('TEMPORAL_MODELS_MEMORY_MB', '512'))
+
+def build_model_index(models_path) -> dict:
+    """
+    Construye y guarda el índice de modelos del directorio: por cada clave, el
+    archivo, su tamaño, su fecha de modificación y el tipo de modelo.
+    Solo lista archivos, no carga ningún modelo.
+    """
+    models_path = Path(models_path)
+    index = {}
+    for model_path in sorted(models_path.glob('*.joblib')):
+        if model_path.stem in NON_MODEL_FILES:
+            continue
+        stat = model_path.stat()
+        index[model_path.stem] = {
+            'archivo': model_path.name,
+            'tamano': stat.st_size,
+            'mtime': stat.st_mtime,
+            'tipo': model_path.stem.split('_', 1)[0]
+        }
+
+    try:
+        with open(models_path / INDEX_FILE, 'w') as f:
+            json.dump(index, f, indent=2, ensure_ascii=False)
+        logger.info(f"Índice de modelos temporales actualizado: {len(index)} modelos")
+    except OSError as e:
+        # En despliegues de solo lectura el índice se usa igual, solo que en memoria
+        logger.warning(f"No se pudo guardar el índice de modelos: {str(e)}")
+    return index
+
+def _comparable_rmse(model_key: str, metrics: dict) -> float:
+    """
+    RMSE de validación cruzada en la escala original de la serie. Los SARIMA se
+    entrenan sobre sqrt(y + 1), así que solo son comparables si el entrenamiento
+    guardó rmse_original_mean; sin ella se consideran peor que cualquier Prophet.
+    """
+    model_metrics = metrics.get(model_key) or {}
+    if model_key.startswith('sarima'):
+        value = model_metrics.get('rmse_original_mean')
+    else:
+        value = model_metrics.get('rmse')
+    try:
+        return float(value) if value is not None else float('inf')
+    except (TypeError, ValueError):
+        return float('inf')
+
+def build_best_model_index(metrics: dict, model_keys, models_path=None) -> dict:
+    """
+    Construye el índice alcance -> mejor modelo a partir de las métricas de
+    validación cruzada del entrenamiento. El alcance es la clave del modelo sin
+    el tipo (por ejemplo 'departamento_Antioquia' para 'sarima_departamento_Antioquia').
+    Si se indica models_path, el índice se guarda en disco.
+    """
+    candidates = {}
+    for model_key in model_keys:
+        if '_' not in model_key:
+            continue
+        scope = model_key.split('_', 1)[1]
+        # Ante empate se prefiere Prophet, cuyas métricas siempre están en la escala original
+        score = (_comparable_rmse(model_key, metrics), 0 if model_key.startswith('prophet') else 1)
+        if scope not in candidates or score < candidates[scope][0]:
+            candidates[scope] = (score, model_key)
+
+    best_models = {scope: model_key for scope, (_, model_key) in candidates.items()}
+
+    if models_path is not None:
+        try:
+            with open(Path(models_path) / BEST_MODELS_FILE, 'w') as f:
+                json.dump(best_models, f, indent=2, ensure_ascii=False)
+            logger.info(f"Índice de mejores modelos actualizado: {len(best_models)} alcances")
+        except OSError as e:
+            logger.warning(f"No se pudo guardar el índice de mejores modelos: {str(e)}")
+    return best_models
+
+def load_best_model_index(models_path, metrics: dict, model_keys) -> dict:
+    """Lee el índice de mejores modelos o lo construye en memoria si no existe"""
+    best_path = Path(models_path) / BEST_MODELS_FILE
+    if best_path.exists():
+        try:
+            with open(best_path, 'r') as f:
+                best_models = json.load(f)
+            # Ignorar entradas de modelos que ya no están en disco
+            return {scope: key for scope, key in best_models.items() if key in model_keys}
+        except Exception as e:
+            logger.warning(f"Error leyendo índice de mejores modelos: {str(e)}")
+    return build_best_model_index(metrics, model_keys)
+
+class LazyModelStore:
+    """
+    Almacén de modelos temporales con carga diferida.
+
+    Al iniciar solo lee el índice de modelos disponibles; cada modelo se carga
+    de disco la primera vez que se usa (con mmap_mode para que los arreglos
+    grandes se lean bajo demanda) y se mantiene en un cache LRU acotado por un
+    presupuesto de memoria, estimado con el tamaño de los archivos.
+    Los arreglos mapeados son de solo lectura: si un modelo necesita
+    modificarlos al predecir, reload_in_memory lo vuelve a cargar completo.
+    Se comporta como un diccionario de solo lectura clave -> modelo.
+    """
+
+    def __init__(self, models_path, memory_budget_mb: int = DEFAULT_MEMORY_BUDGET_MB):
+        self.models_path = Path(models_path)
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        # Modelos que no admiten arreglos de solo lectura; se cargan sin mmap
+        self._in_memory = set()
+        self.index = self._load_index()
+
+    def _load_index(self) -> dict:
+        """Lee el índice; lo reconstruye si no existe o no coincide con los archivos"""
+        index_path = self.models_path / INDEX_FILE
+        if not self.models_path.exists():
+            logger.warning(f"Directorio de modelos no encontrado: {self.models_path}")
+            return {}
+
+        model_files = {p.stem for p in self.models_path.glob('*.joblib')} - NON_MODEL_FILES
+        if index_path.exists():
+            try:
+                with open(index_path, 'r') as f:
+                    index = json.load(f)
+                if set(index) == model_files:
+                    return index
+                logger.info("Índice de modelos desactualizado, reconstruyendo...")
+            except Exception as e:
+                logger.warning(f"Error leyendo índice de modelos: {str(e)}")
+        return build_model_index(self.models_path)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def keys(self):
+        return self.index.keys()
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __getitem__(self, key):
+        if key not in self.index:
+            raise KeyError(key)
+
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+            return self._load(key)
+
+    def reload_in_memory(self, key):
+        """
+        Vuelve a cargar el modelo sin mmap_mode y lo reemplaza en el cache.
+        Se usa cuando la predicción falla porque intenta escribir en un arreglo
+        mapeado (ValueError "buffer source array is read-only" en statsmodels).
+        """
+        if key not in self.index:
+            raise KeyError(key)
+
+        with self._lock:
+            self._in_memory.add(key)
+            if key in self._cache:
+                del self._cache[key]
+                self._cache_bytes -= self.index[key].get('tamano', 0)
+            return self._load(key)
+
+    def _load(self, key):
+        """Carga el modelo de disco y lo agrega al cache (con el lock tomado)"""
+        info = self.index[key]
+        model_path = self.models_path / info['archivo']
+        # Los modelos se guardan sin compresión, así que mmap_mode deja sus
+        # arreglos mapeados y de solo lectura
+        mmap_mode = None if key in self._in_memory else 'r'
+        model = joblib.load(model_path, mmap_mode=mmap_mode)
+        if not hasattr(model, 'predict'):
+            raise KeyError(f"Archivo no es un modelo válido: {key}")
+        logger.info(f"Modelo cargado: {key}" + ("" if mmap_mode else " (en memoria)"))
+
+        self._cache[key] = model
+        self._cache_bytes += info.get('tamano', 0)
+        self._evict()
+        return model
+
+    def _evict(self):
+        """Descarta los modelos menos usados hasta respetar el presupuesto (siempre deja uno)"""
+        while self._cache_bytes > self.memory_budget and len(self._cache) > 1:
+            key, _ = self._cache.popitem(last=False)
+            self._cache_bytes -= self.index.get(key, {}).get('tamano', 0)
+            logger.info(f"Modelo descartado del cache: {key}")
+
+    def clear(self):
+        """Vacía el cache de modelos cargados"""
+        with self._lock:
+            self._cache.clear()
+            self._cache_bytes = 0
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_model_store(models_path, memory_budget_mb: int = DEFAULT_MEMORY_BUDGET_MB) -> LazyModelStore:
+    """
+    Retorna el almacén compartido por el proceso para el directorio indicado,
+    de modo que los predictores creados en cada ejecución reutilicen los
+    modelos ya cargados. Se recrea si el índice cambió en disco.
+    """
+    models_path = Path(models_path)
+    index_path = models_path / INDEX_FILE
+    index_mtime = index_path.stat().st_mtime if index_path.exists() else None
+
+    with _stores_lock:
+        entry = _stores.get(models_path)
+        if entry is None or entry[1] != index_mtime:
+            store = LazyModelStore(models_path, memory_budget_mb)
+            index_mtime = index_path.stat().st_mtime if index_path.exists() else None
+            _stores[models_path] = (store, index_mtime)
+            return store
+        return entry[0]
@@ -16,6 +16,8 @@ root_dir = Path(__file__).parent.parent.parent
 sys.path.append(str(root_dir))
 
 from utils.data_loader import DataLoader
+from model_store import get_model_store, load_best_model_index
+from forecast_cache import get_forecast_cache, model_version
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -27,23 +29,17 @@ class TemporalPredictor:
         self.models_path = Path(root_dir) / models_path
         self.models = {}
         self.metrics = {}
+        self.best_models = {}
+        self.forecast_cache = get_forecast_cache(self.models_path)
         self.load_models()
         
     def load_models(self):
-        """Carga los modelos guardados y sus métricas"""
+        """
+        Prepara el acceso a los modelos y carga sus métricas. Los modelos no se
+        leen aquí: el almacén compartido los carga de disco al usarlos por primera vez.
+        """
         try:
-            # Cargar modelos
-            for model_path in self.models_path.glob('*.joblib'):
-                if model_path.stem != 'category_mappings' and model_path.stem != 'model_metrics':
-                    try:
-                        model = joblib.load(model_path)
-                        if hasattr(model, 'predict'):  # Verificar que sea un modelo válido
-                            self.models[model_path.stem] = model
-                            logger.info(f"Modelo cargado: {model_path.stem}")
-                        else:
-                            logger.warning(f"Archivo no es un modelo válido: {model_path.stem}")
-                    except Exception as e:
-                        logger.error(f"Error cargando modelo {model_path.stem}: {str(e)}")
+            self.models = get_model_store(self.models_path)
             
             # Cargar métricas
             metrics_path = self.models_path / 'model_metrics.json'
@@ -51,8 +47,10 @@ class TemporalPredictor:
                 with open(metrics_path, 'r') as f:
                     self.metrics = json.load(f)
             
-            logger.info(f"Modelos cargados exitosamente: {len(self.models)}")
-            logger.info(f"Modelos disponibles: {list(self.models.keys())}")
+            # Mejor modelo por alcance según las métricas de validación del entrenamiento
+            self.best_models = load_best_model_index(self.models_path, self.metrics, set(self.models.keys()))
+            
+            logger.info(f"Modelos disponibles: {len(self.models)}")
             
         except Exception as e:
             logger.error(f"Error cargando modelos: {str(e)}")
@@ -100,11 +98,8 @@ class TemporalPredictor:
             adjusted_period = months_to_current + input_data['periodo']
             logger.info(f"Período ajustado: {adjusted_period} meses (incluyendo {months_to_current} meses hasta fecha actual)")
             
-            # Realizar predicción según el tipo de modelo
-            if 'sarima' in model_key:
-                predictions = self._predict_sarima(model_key, adjusted_period)
-            else:  # prophet
-                predictions = self._predict_prophet(model_key, adjusted_period)
+            # Realizar predicción según el tipo de modelo (o tomarla del cache)
+            predictions = self._forecast(model_key, adjusted_period)
             
             logger.info(f"Predicciones generadas: {len(predictions.get('values', []))} valores")
             
@@ -136,27 +131,26 @@ class TemporalPredictor:
             return self._handle_prediction_error(str(e))
 
     def _get_best_model_key(self, input_data: dict) -> str:
-        """Selecciona el mejor modelo con validación mejorada"""
+        """
+        Selecciona el mejor modelo del alcance más específico disponible
+        (municipio, departamento, categoría) con el índice construido a partir
+        de las métricas de entrenamiento, sin ejecutar pronósticos de prueba.
+        """
         try:
-            errors = {}
-            for model_key in self.models:
-                if self._is_applicable_model(model_key, input_data):
-                    try:
-                        # Obtener predicciones de prueba
-                        error_metrics = self._calculate_model_error(model_key, input_data)
-                        predictions = self._predict_sarima(model_key, 6) if 'sarima' in model_key else self._predict_prophet(model_key, 6)
-                        
-                        # Validar coherencia de las predicciones
-                        historical_data = self._get_historical_data(input_data)
-                        if self._validate_predictions(predictions, historical_data):
-                            errors[model_key] = error_metrics['rmse']
-                    except Exception as e:
-                        logger.warning(f"Error evaluando modelo {model_key}: {str(e)}")
-                        continue
+            departamento = input_data['departamento']
+            scopes = []
+            if input_data.get('municipio'):
+                scopes.append(f"departamento_municipio_{departamento}_{input_data['municipio']}")
+            scopes.append(f"departamento_{departamento}")
+            if input_data.get('categoria'):
+                scopes.append(f"categoria_unica_{input_data['categoria']}")
             
-            if errors:
-                return min(errors.items(), key=lambda x: x[1])[0]
+            for scope in scopes:
+                model_key = self.best_models.get(scope)
+                if model_key:
+                    return model_key
             
+            # Zona geográfica u otros modelos disponibles
             return self._get_fallback_model(input_data)
             
         except Exception as e:
@@ -238,6 +232,47 @@ class TemporalPredictor:
             logger.exception("Traceback completo:")
             return {'dates': [], 'activities': [], 'empty': True}
 
+    def _forecast(self, model_key: str, periods: int, regressors: dict = None) -> dict:
+        """
+        Pronóstico del modelo para el horizonte indicado. Es determinístico para
+        un archivo de modelo dado, así que se reutiliza el del cache compartido
+        mientras el archivo no cambie. Los pronósticos con regresores propios
+        (solo Prophet) no se cachean.
+        """
+        if regressors is not None and 'sarima' not in model_key:
+            return self._predict_with_reload(self._predict_prophet, model_key, periods, regressors)
+        
+        version = model_version(self.models_path / f'{model_key}.joblib')
+        
+        if version is not None:
+            cached = self.forecast_cache.get(model_key, version, periods)
+            if cached is not None:
+                logger.info(f"Pronóstico de {model_key} ({periods} periodos) tomado del cache")
+                return cached
+        
+        if 'sarima' in model_key:
+            predictions = self._predict_with_reload(self._predict_sarima, model_key, periods)
+        else:  # prophet
+            predictions = self._predict_with_reload(self._predict_prophet, model_key, periods)
+        
+        if version is not None:
+            self.forecast_cache.set(model_key, version, periods, predictions)
+        return predictions
+
+    def _predict_with_reload(self, predict, model_key: str, *args) -> dict:
+        """
+        Ejecuta la predicción y, si falla por escribir en los arreglos de solo
+        lectura del modelo mapeado (mmap), la repite con el modelo cargado en memoria
+        """
+        try:
+            return predict(model_key, *args)
+        except ValueError as e:
+            if 'read-only' not in str(e):
+                raise
+            logger.warning(f"Modelo {model_key} no admite arreglos de solo lectura, recargando en memoria")
+            self.models.reload_in_memory(model_key)
+            return predict(model_key, *args)
+
     def _predict_sarima(self, model_key: str, periods: int) -> dict:
         """Realiza predicción con modelo SARIMA"""
         try:
@@ -269,30 +304,39 @@ class TemporalPredictor:
             logger.exception("Traceback completo:")
             raise
 
-    def _predict_prophet(self, model_key: str, periods: int) -> dict:
-        """Realiza predicción usando modelo Prophet con todas las variables requeridas"""
+    def _predict_prophet(self, model_key: str, periods: int, regressors: dict = None) -> dict:
+        """
+        Realiza predicción usando modelo Prophet con todas las variables requeridas.
+        Solo se construyen y predicen las filas del horizonte. regressors permite
+        pasar valores precalculados (escalar o arreglo de largo periods) por regresor.
+        """
         try:
-            future = self.models[model_key].make_future_dataframe(
+            model = self.models[model_key]
+            future = model.make_future_dataframe(
                 periods=periods, 
-                freq='ME'  # Cambiar 'M' a 'ME' para evitar el warning
+                freq='ME',  # Cambiar 'M' a 'ME' para evitar el warning
+                include_history=False
             )
             
-            # Agregar todas las variables requeridas
-            future['asistentes_ratio'] = future['ds'].map(lambda x: 30)
-            future['intensidad_actividad'] = future['ds'].map(lambda x: 1)
-            future['es_temporada_alta'] = future['ds'].map(
-                lambda x: 1 if x.month in [3,4,9,10] else 0
-            )
+            # Valores por defecto de las variables requeridas
+            defaults = {
+                'asistentes_ratio': 30,
+                'intensidad_actividad': 1,
+                'es_temporada_alta': future['ds'].dt.month.isin([3, 4, 9, 10]).astype(int)
+            }
+            regressors = regressors or {}
+            for name in set(defaults) | set(model.extra_regressors):
+                future[name] = regressors.get(name, defaults.get(name, 0))
             
-            forecast = self.models[model_key].predict(future)
+            forecast = model.predict(future)
             
             # Aplicar transformaciones inversas si es necesario
-            predictions = forecast['yhat'][-periods:].clip(0)  # No permitir valores negativos
+            predictions = forecast['yhat'].clip(0)  # No permitir valores negativos
             
             return {
                 'values': predictions.tolist(),
-                'lower': forecast['yhat_lower'][-periods:].clip(0).tolist(),
-                'upper': forecast['yhat_upper'][-periods:].tolist()
+                'lower': forecast['yhat_lower'].clip(0).tolist(),
+                'upper': forecast['yhat_upper'].tolist()
             }
         except Exception as e:
             logger.error(f"Error en predicción Prophet: {str(e)}")
@@ -618,34 +662,6 @@ class TemporalPredictor:
             'historical_data': {'dates': [], 'activities': [], 'empty': True}
         }
 
-    def _is_applicable_model(self, model_key: str, input_data: dict) -> bool:
-        """Determina si un modelo es aplicable para los datos de entrada"""
-        try:
-            # Verificar si el modelo coincide con el departamento y municipio
-            if input_data.get('municipio'):
-                if f"_{input_data['departamento']}_{input_data['municipio']}" in model_key:
-                    return True
-            
-            # Verificar si el modelo coincide con el departamento
-            if f"_{input_data['departamento']}" in model_key:
-                return True
-            
-            # Verificar si el modelo coincide con la categoría
-            if input_data.get('categoria') and f"_categoria_unica_{input_data['categoria']}" in model_key:
-                return True
-            
-            # Verificar si es un modelo de zona geográfica
-            if 'zona_geografica' in model_key:
-                zona = self.data_loader.get_zona_from_departamento(input_data['departamento'])
-                if f"_zona_geografica_{zona}" in model_key:
-                    return True
-            
-            return False
-            
-        except Exception as e:
-            logger.error(f"Error verificando aplicabilidad del modelo {model_key}: {str(e)}")
-            return False
-
     def _get_fallback_model(self, input_data: dict) -> str:
         """Obtiene un modelo alternativo cuando no hay métricas disponibles"""
         try:
@@ -684,56 +700,6 @@ class TemporalPredictor:
             logger.error(f"Error obteniendo modelo fallback: {str(e)}")
             return None
 
-    def _calculate_model_error(self, model_key: str, input_data: dict) -> dict:
-        """Calcula métricas de error para un modelo específico"""
-        try:
-            # Obtener datos históricos
-            historical_data = self._get_historical_data(input_data)
-            if historical_data.get('empty', True):
-                return {'rmse': np.inf}
-            
-            # Obtener últimos N valores para validación
-            n_validation = 6  # últimos 6 meses
-            actual_values = np.array(historical_data['activities'][-n_validation:])
-            
-            # Realizar predicción
-            if 'sarima' in model_key:
-                predictions = self._predict_sarima(model_key, n_validation)
-            else:
-                predictions = self._predict_prophet(model_key, n_validation)
-            
-            predicted_values = np.array(predictions['values'])
-            
-            # Calcular RMSE
-            rmse = np.sqrt(np.mean((actual_values - predicted_values) ** 2))
-            
-            return {'rmse': rmse}
-            
-        except Exception as e:
-            logger.error(f"Error calculando error del modelo {model_key}: {str(e)}")
-            return {'rmse': np.inf}
-
-    def _validate_predictions(self, predictions: dict, historical_data: dict) -> bool:
-        """Valida que las predicciones sean coherentes con ajustes por contexto"""
-        hist_mean = np.mean(historical_data['activities'])
-        pred_mean = np.mean(predictions['values'])
-        
-        # Ajustar umbrales según el volumen de actividades
-        if hist_mean < 2:  # Pocas actividades
-            lower_threshold = 0
-            upper_threshold = hist_mean * 3
-        elif hist_mean < 5:  # Actividades moderadas
-            lower_threshold = hist_mean * 0.3
-            upper_threshold = hist_mean * 2
-        else:  # Muchas actividades
-            lower_threshold = hist_mean * 0.5
-            upper_threshold = hist_mean * 1.5
-        
-        if pred_mean < lower_threshold or pred_mean > upper_threshold:
-            logger.warning(f"Predicción fuera de rango: histórico={hist_mean:.2f}, predicción={pred_mean:.2f}")
-            return False
-        return True
-
     def _create_pattern_analysis_plot(self, historical_data: dict) -> go.Figure:
         """Crea visualización de patrones temporales"""
         try:
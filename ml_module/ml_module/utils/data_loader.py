@@ -149,13 +149,25 @@ class DataLoader:
                     filter_conditions.append("a.categoria_unica = :tipo")
                     params['tipo'] = filters['tipo_actividad']
 
-            # Construir la consulta base
+            # Centroides precalculados si existe municipios_centroides; si no, se calculan del límite
+            with self.engine.connect() as conn:
+                usar_centroides = conn.execute(
+                    text("SELECT to_regclass('municipios_centroides') IS NOT NULL")
+                ).scalar()
+            if usar_centroides:
+                centroide_join = "JOIN municipios_centroides c ON c.cod_mpio = m.cod_mpio"
+                longitud, latitud = "c.longitud", "c.latitud"
+            else:
+                centroide_join = "JOIN limites_municipios l ON l.cod_mpio = m.cod_mpio"
+                longitud, latitud = "ST_X(ST_Centroid(l.geometry))", "ST_Y(ST_Centroid(l.geometry))"
+
+            # Construir la consulta base (un registro por municipio)
             base_query = """
                 SELECT 
                     m.municipio,
                     m.departamento,
-                    ST_X(ST_Centroid(m.geometry::geometry)) as longitud,
-                    ST_Y(ST_Centroid(m.geometry::geometry)) as latitud,
+                    {longitud} as longitud,
+                    {latitud} as latitud,
                     COALESCE(act.num_actividades, 0) as num_actividades,
                     COALESCE(act.total_asistentes, 0) as total_asistentes,
                     CASE 
@@ -163,7 +175,13 @@ class DataLoader:
                         THEN COALESCE(act.total_asistentes, 0)::float / act.num_actividades
                         ELSE 0 
                     END as eficiencia_actividad
-                FROM actividades_municipios m
+                FROM (
+                    SELECT municipio, departamento, MIN(cod_mpio) as cod_mpio
+                    FROM actividades_municipios
+                    WHERE cod_mpio IS NOT NULL
+                    GROUP BY municipio, departamento
+                ) m
+                {centroide_join}
                 LEFT JOIN (
                     SELECT 
                         municipio,
@@ -175,14 +193,18 @@ class DataLoader:
                     {where_clause}
                     GROUP BY municipio, departamento
                 ) act ON m.municipio = act.municipio AND m.departamento = act.departamento
-                WHERE m.geometry IS NOT NULL
-                AND COALESCE(act.num_actividades, 0) > 0
+                WHERE COALESCE(act.num_actividades, 0) > 0
                 ORDER BY m.departamento, m.municipio
             """
             
             # Agregar cláusula WHERE si hay filtros
             where_clause = f"AND {' AND '.join(filter_conditions)}" if filter_conditions else ""
-            query = text(base_query.format(where_clause=where_clause))
+            query = text(base_query.format(
+                where_clause=where_clause,
+                centroide_join=centroide_join,
+                longitud=longitud,
+                latitud=latitud
+            ))
 
             # Ejecutar la consulta
             with self.engine.connect() as conn:
@@ -0,0 +1,481 @@
+"""
+Feature store del modelo de asistencia.
+
+Guarda en la tabla features_asistencia las estadísticas históricas que el
+predictor necesita, precalculadas por (departamento, municipio, categoria_unica,
+as_of_month). Cada fila resume únicamente las actividades con fecha anterior a
+as_of_month, sin información del futuro. Las filas con municipio = '' son las
+del nivel departamental. Dashboard_BD_PHI/scripts/import_data.py lo actualiza
+de forma incremental después de cada importación.
+"""
+
+import logging
+import pandas as pd
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+FEATURE_STORE_TABLE = 'features_asistencia'
+
+CREATE_TABLE_QUERY = f"""
+    CREATE TABLE IF NOT EXISTS {FEATURE_STORE_TABLE} (
+        departamento TEXT NOT NULL,
+        municipio TEXT NOT NULL DEFAULT '',
+        categoria_unica TEXT NOT NULL,
+        as_of_month DATE NOT NULL,
+        total_actividades_departamento BIGINT,
+        promedio_departamento DOUBLE PRECISION,
+        desviacion_departamento DOUBLE PRECISION,
+        max_departamento DOUBLE PRECISION,
+        min_departamento DOUBLE PRECISION,
+        total_actividades_categoria BIGINT,
+        promedio_categoria DOUBLE PRECISION,
+        mediana_categoria DOUBLE PRECISION,
+        desviacion_categoria DOUBLE PRECISION,
+        max_categoria DOUBLE PRECISION,
+        min_categoria DOUBLE PRECISION,
+        tendencia_categoria DOUBLE PRECISION,
+        asistentes_previos INTEGER[],
+        promedio_movil_30 DOUBLE PRECISION,
+        promedio_por_mes DOUBLE PRECISION[],
+        promedio_por_dia DOUBLE PRECISION[],
+        PRIMARY KEY (departamento, municipio, categoria_unica, as_of_month)
+    )
+"""
+
+# Una fila por clave y mes, desde el mes siguiente a la primera actividad de la
+# clave hasta el mes siguiente a la última actividad registrada. Las estadísticas
+# de categoría y departamento son departamentales (igual que en la consulta en
+# vivo del predictor); las recientes y los promedios por mes y día se filtran
+# además por municipio cuando la fila es municipal.
+INSERT_FEATURES_QUERY = f"""
+    WITH claves AS (
+        SELECT departamento, municipio, categoria_unica,
+               MIN(DATE_TRUNC('month', fecha))::date AS primer_mes
+        FROM actividades
+        WHERE departamento IS NOT NULL AND municipio IS NOT NULL
+        AND categoria_unica IS NOT NULL
+        GROUP BY departamento, municipio, categoria_unica
+        UNION ALL
+        SELECT departamento, '' AS municipio, categoria_unica,
+               MIN(DATE_TRUNC('month', fecha))::date AS primer_mes
+        FROM actividades
+        WHERE departamento IS NOT NULL AND categoria_unica IS NOT NULL
+        GROUP BY departamento, categoria_unica
+    ),
+    limites AS (
+        SELECT (DATE_TRUNC('month', MAX(fecha)) + INTERVAL '1 month')::date AS ultimo_mes
+        FROM actividades
+    ),
+    meses AS (
+        SELECT k.departamento, k.municipio, k.categoria_unica, m.mes::date AS as_of_month
+        FROM claves k
+        CROSS JOIN limites l
+        CROSS JOIN LATERAL generate_series(
+            GREATEST(k.primer_mes + INTERVAL '1 month', CAST(:desde AS date)),
+            l.ultimo_mes,
+            INTERVAL '1 month'
+        ) AS m(mes)
+    )
+    INSERT INTO {FEATURE_STORE_TABLE}
+    SELECT
+        k.departamento,
+        k.municipio,
+        k.categoria_unica,
+        k.as_of_month,
+        d.total_actividades_departamento,
+        d.promedio_departamento,
+        d.desviacion_departamento,
+        d.max_departamento,
+        d.min_departamento,
+        c.total_actividades_categoria,
+        c.promedio_categoria,
+        c.mediana_categoria,
+        c.desviacion_categoria,
+        c.max_categoria,
+        c.min_categoria,
+        c.tendencia_categoria,
+        COALESCE(r.asistentes_previos, ARRAY[]::integer[]),
+        COALESCE(r.promedio_movil_30, 0),
+        pm.promedio_por_mes,
+        pd.promedio_por_dia
+    FROM meses k
+    CROSS JOIN LATERAL (
+        SELECT
+            COUNT(*) AS total_actividades_departamento,
+            AVG(total_asistentes)::float8 AS promedio_departamento,
+            STDDEV(total_asistentes)::float8 AS desviacion_departamento,
+            MAX(total_asistentes)::float8 AS max_departamento,
+            MIN(total_asistentes)::float8 AS min_departamento
+        FROM actividades a
+        WHERE a.departamento = k.departamento
+        AND a.fecha < k.as_of_month
+    ) d
+    CROSS JOIN LATERAL (
+        SELECT
+            COUNT(*) AS total_actividades_categoria,
+            AVG(total_asistentes)::float8 AS promedio_categoria,
+            PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY total_asistentes) AS mediana_categoria,
+            STDDEV(total_asistentes)::float8 AS desviacion_categoria,
+            MAX(total_asistentes)::float8 AS max_categoria,
+            MIN(CASE WHEN total_asistentes > 0 THEN total_asistentes END)::float8 AS min_categoria,
+            COALESCE(
+                REGR_SLOPE(total_asistentes, EXTRACT(EPOCH FROM fecha)::float),
+                0
+            ) AS tendencia_categoria
+        FROM actividades a
+        WHERE a.departamento = k.departamento
+        AND a.categoria_unica = k.categoria_unica
+        AND a.fecha < k.as_of_month
+        AND a.total_asistentes >= 0
+    ) c
+    CROSS JOIN LATERAL (
+        SELECT
+            ARRAY_AGG(total_asistentes::integer ORDER BY fecha DESC) AS asistentes_previos,
+            AVG(total_asistentes)::float8 AS promedio_movil_30
+        FROM (
+            SELECT total_asistentes, fecha
+            FROM actividades a
+            WHERE a.departamento = k.departamento
+            AND (k.municipio = '' OR a.municipio = k.municipio)
+            AND a.fecha < k.as_of_month
+            AND a.total_asistentes >= 0
+            ORDER BY a.fecha DESC
+            LIMIT 30
+        ) recientes
+        WHERE total_asistentes > 0
+    ) r
+    CROSS JOIN LATERAL (
+        SELECT ARRAY_AGG(p.promedio ORDER BY s.mes) AS promedio_por_mes
+        FROM generate_series(1, 12) AS s(mes)
+        LEFT JOIN (
+            SELECT EXTRACT(MONTH FROM fecha)::int AS mes, AVG(total_asistentes)::float8 AS promedio
+            FROM actividades a
+            WHERE a.departamento = k.departamento
+            AND (k.municipio = '' OR a.municipio = k.municipio)
+            AND a.categoria_unica = k.categoria_unica
+            AND a.fecha < k.as_of_month
+            GROUP BY 1
+        ) p ON p.mes = s.mes
+    ) pm
+    CROSS JOIN LATERAL (
+        SELECT ARRAY_AGG(p.promedio ORDER BY s.dia) AS promedio_por_dia
+        FROM generate_series(0, 6) AS s(dia)
+        LEFT JOIN (
+            SELECT EXTRACT(DOW FROM fecha)::int AS dia, AVG(total_asistentes)::float8 AS promedio
+            FROM actividades a
+            WHERE a.departamento = k.departamento
+            AND (k.municipio = '' OR a.municipio = k.municipio)
+            AND a.categoria_unica = k.categoria_unica
+            AND a.fecha < k.as_of_month
+            GROUP BY 1
+        ) p ON p.dia = s.dia
+    ) pd
+"""
+
+# Lectura puntual: la fila municipal si existe, si no la departamental, siempre
+# la más reciente que no sea posterior al mes de la fecha consultada
+LOOKUP_QUERY = f"""
+    SELECT *
+    FROM {FEATURE_STORE_TABLE}
+    WHERE departamento = :departamento
+    AND categoria_unica = :categoria_unica
+    AND municipio IN (:municipio, '')
+    AND as_of_month <= DATE_TRUNC('month', CAST(:fecha AS date))
+    ORDER BY (municipio = ''), as_of_month DESC
+    LIMIT 1
+"""
+
+# Misma búsqueda que LOOKUP_QUERY para muchas claves a la vez; idx es la
+# posición (base 1) de la clave en los arreglos de entrada
+BATCH_LOOKUP_QUERY = f"""
+    SELECT s.idx, f.*
+    FROM unnest(
+        CAST(:departamentos AS text[]),
+        CAST(:municipios AS text[]),
+        CAST(:categorias AS text[]),
+        CAST(:meses AS date[])
+    ) WITH ORDINALITY AS s(departamento, municipio, categoria_unica, mes, idx)
+    CROSS JOIN LATERAL (
+        SELECT *
+        FROM {FEATURE_STORE_TABLE} fs
+        WHERE fs.departamento = s.departamento
+        AND fs.categoria_unica = s.categoria_unica
+        AND fs.municipio IN (s.municipio, '')
+        AND fs.as_of_month <= s.mes
+        ORDER BY (fs.municipio = ''), fs.as_of_month DESC
+        LIMIT 1
+    ) f
+"""
+
+# Mismas estadísticas que INSERT_FEATURES_QUERY, calculadas en vivo sobre
+# actividades para muchas (municipio, fecha) de un mismo departamento y
+# categoría, con corte en la fecha exacta como la consulta en vivo del
+# predictor. Se usa para los lotes cuando el feature store no existe o no
+# tiene fila para la clave; municipio = '' equivale a la consulta departamental.
+LIVE_BATCH_QUERY = """
+    SELECT
+        s.idx,
+        d.total_actividades_departamento,
+        d.promedio_departamento,
+        d.desviacion_departamento,
+        d.max_departamento,
+        d.min_departamento,
+        c.total_actividades_categoria,
+        c.promedio_categoria,
+        c.mediana_categoria,
+        c.desviacion_categoria,
+        c.max_categoria,
+        c.min_categoria,
+        c.tendencia_categoria,
+        COALESCE(r.asistentes_previos, ARRAY[]::integer[]) AS asistentes_previos,
+        COALESCE(r.promedio_movil_30, 0) AS promedio_movil_30,
+        pm.promedio_por_mes,
+        pd.promedio_por_dia
+    FROM unnest(
+        CAST(:municipios AS text[]),
+        CAST(:fechas AS date[])
+    ) WITH ORDINALITY AS s(municipio, fecha, idx)
+    CROSS JOIN LATERAL (
+        SELECT
+            COUNT(*) AS total_actividades_departamento,
+            AVG(total_asistentes)::float8 AS promedio_departamento,
+            STDDEV(total_asistentes)::float8 AS desviacion_departamento,
+            MAX(total_asistentes)::float8 AS max_departamento,
+            MIN(total_asistentes)::float8 AS min_departamento
+        FROM actividades a
+        WHERE a.departamento = :departamento
+        AND a.fecha < s.fecha
+    ) d
+    CROSS JOIN LATERAL (
+        SELECT
+            COUNT(*) AS total_actividades_categoria,
+            AVG(total_asistentes)::float8 AS promedio_categoria,
+            PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY total_asistentes) AS mediana_categoria,
+            STDDEV(total_asistentes)::float8 AS desviacion_categoria,
+            MAX(total_asistentes)::float8 AS max_categoria,
+            MIN(CASE WHEN total_asistentes > 0 THEN total_asistentes END)::float8 AS min_categoria,
+            COALESCE(
+                REGR_SLOPE(total_asistentes, EXTRACT(EPOCH FROM fecha)::float),
+                0
+            ) AS tendencia_categoria
+        FROM actividades a
+        WHERE a.departamento = :departamento
+        AND a.categoria_unica = :categoria_unica
+        AND a.fecha < s.fecha
+        AND a.total_asistentes >= 0
+    ) c
+    CROSS JOIN LATERAL (
+        SELECT
+            ARRAY_AGG(total_asistentes::integer ORDER BY fecha DESC) AS asistentes_previos,
+            AVG(total_asistentes)::float8 AS promedio_movil_30
+        FROM (
+            SELECT total_asistentes, fecha
+            FROM actividades a
+            WHERE a.departamento = :departamento
+            AND (s.municipio = '' OR a.municipio = s.municipio)
+            AND a.fecha < s.fecha
+            AND a.total_asistentes >= 0
+            ORDER BY a.fecha DESC
+            LIMIT 30
+        ) recientes
+        WHERE total_asistentes > 0
+    ) r
+    CROSS JOIN LATERAL (
+        SELECT ARRAY_AGG(p.promedio ORDER BY m.mes) AS promedio_por_mes
+        FROM generate_series(1, 12) AS m(mes)
+        LEFT JOIN (
+            SELECT EXTRACT(MONTH FROM fecha)::int AS mes, AVG(total_asistentes)::float8 AS promedio
+            FROM actividades a
+            WHERE a.departamento = :departamento
+            AND (s.municipio = '' OR a.municipio = s.municipio)
+            AND a.categoria_unica = :categoria_unica
+            AND a.fecha < s.fecha
+            GROUP BY 1
+        ) p ON p.mes = m.mes
+    ) pm
+    CROSS JOIN LATERAL (
+        SELECT ARRAY_AGG(p.promedio ORDER BY w.dia) AS promedio_por_dia
+        FROM generate_series(0, 6) AS w(dia)
+        LEFT JOIN (
+            SELECT EXTRACT(DOW FROM fecha)::int AS dia, AVG(total_asistentes)::float8 AS promedio
+            FROM actividades a
+            WHERE a.departamento = :departamento
+            AND (s.municipio = '' OR a.municipio = s.municipio)
+            AND a.categoria_unica = :categoria_unica
+            AND a.fecha < s.fecha
+            GROUP BY 1
+        ) p ON p.dia = w.dia
+    ) pd
+"""
+
+def existe_feature_store(engine) -> bool:
+    """Indica si la tabla del feature store existe y tiene filas"""
+    try:
+        with engine.connect() as conn:
+            existe = conn.execute(
+                text("SELECT to_regclass(:tabla) IS NOT NULL"),
+                {"tabla": FEATURE_STORE_TABLE}
+            ).scalar()
+            if not existe:
+                return False
+            return conn.execute(
+                text(f"SELECT EXISTS (SELECT 1 FROM {FEATURE_STORE_TABLE})")
+            ).scalar()
+    except Exception as e:
+        logger.warning(f"No se pudo verificar el feature store: {str(e)}")
+        return False
+
+def construir_feature_store(engine, completo: bool = False) -> int:
+    """
+    Construye o actualiza el feature store.
+
+    Por defecto es incremental: recalcula desde el último as_of_month guardado
+    (que es el que cambia cuando se importan actividades del mes en curso) y
+    agrega los meses nuevos. Con completo=True, o si la tabla está vacía,
+    recalcula todo; es lo indicado cuando se corrigen datos antiguos.
+    Retorna el número de filas escritas.
+    """
+    with engine.begin() as conn:
+        conn.execute(text(CREATE_TABLE_QUERY))
+
+        desde = None
+        if not completo:
+            desde = conn.execute(
+                text(f"SELECT MAX(as_of_month) FROM {FEATURE_STORE_TABLE}")
+            ).scalar()
+
+        if desde is None:
+            logger.info("Construyendo feature store completo...")
+            conn.execute(text(f"TRUNCATE {FEATURE_STORE_TABLE}"))
+            desde = '1900-01-01'
+        else:
+            logger.info(f"Actualizando feature store desde {desde}...")
+            conn.execute(
+                text(f"DELETE FROM {FEATURE_STORE_TABLE} WHERE as_of_month >= :desde"),
+                {"desde": desde}
+            )
+
+        filas = conn.execute(text(INSERT_FEATURES_QUERY), {"desde": desde}).rowcount
+
+    with engine.connect() as conn:
+        conn.execute(text(f"ANALYZE {FEATURE_STORE_TABLE}"))
+        conn.commit()
+
+    logger.info(f"Feature store actualizado: {filas} filas escritas")
+    return filas
+
+def obtener_features(engine, departamento: str, categoria_unica: str, fecha, municipio: str = None):
+    """
+    Retorna las estadísticas históricas del feature store con las mismas claves
+    que produce la consulta en vivo del predictor, o None si no hay fila.
+    """
+    fecha_dt = pd.to_datetime(fecha)
+    with engine.connect() as conn:
+        row = conn.execute(text(LOOKUP_QUERY), {
+            "departamento": departamento,
+            "categoria_unica": categoria_unica,
+            "municipio": municipio or '',
+            "fecha": fecha_dt.date()
+        }).mappings().first()
+
+    return _features_desde_fila(row, fecha_dt)
+
+def obtener_features_lote(engine, consultas: list) -> list:
+    """
+    Versión en bloque de obtener_features para predicciones masivas.
+
+    consultas es una lista de tuplas (departamento, categoria_unica, fecha, municipio).
+    Las claves repetidas en el mismo mes se resuelven una sola vez y todas se
+    buscan en una única consulta. Retorna una lista alineada con consultas.
+    """
+    fechas = [pd.to_datetime(fecha) for _, _, fecha, _ in consultas]
+    claves = list(dict.fromkeys(
+        (departamento, municipio or '', categoria_unica, fecha_dt.to_period('M').to_timestamp().date())
+        for (departamento, categoria_unica, _, municipio), fecha_dt in zip(consultas, fechas)
+    ))
+    if not claves:
+        return []
+
+    departamentos, municipios, categorias, meses = (list(col) for col in zip(*claves))
+    with engine.connect() as conn:
+        rows = conn.execute(text(BATCH_LOOKUP_QUERY), {
+            "departamentos": departamentos,
+            "municipios": municipios,
+            "categorias": categorias,
+            "meses": meses
+        }).mappings().all()
+
+    filas = {claves[row['idx'] - 1]: row for row in rows}
+    return [
+        _features_desde_fila(
+            filas.get((departamento, municipio or '', categoria_unica, fecha_dt.to_period('M').to_timestamp().date())),
+            fecha_dt
+        )
+        for (departamento, categoria_unica, _, municipio), fecha_dt in zip(consultas, fechas)
+    ]
+
+def calcular_features_lote(engine, departamento: str, categoria_unica: str, claves: list) -> list:
+    """
+    Calcula en vivo, en una sola consulta, las estadísticas históricas de un
+    departamento y categoría para varias claves (municipio, fecha). Retorna una
+    lista alineada con claves; None donde no hay actividades de la categoría.
+    """
+    if not claves:
+        return []
+    fechas = [pd.to_datetime(fecha) for _, fecha in claves]
+
+    with engine.connect() as conn:
+        rows = conn.execute(text(LIVE_BATCH_QUERY), {
+            "departamento": departamento,
+            "categoria_unica": categoria_unica,
+            "municipios": [municipio or '' for municipio, _ in claves],
+            "fechas": [fecha_dt.date() for fecha_dt in fechas]
+        }).mappings().all()
+
+    filas = {row['idx']: row for row in rows}
+    return [_features_desde_fila(filas.get(idx), fecha_dt) for idx, fecha_dt in enumerate(fechas, start=1)]
+
+def _features_desde_fila(row, fecha_dt):
+    """Completa una fila del feature store con los valores que dependen de la fecha"""
+    if row is None or not row['total_actividades_categoria']:
+        return None
+
+    features = {k: v for k, v in dict(row).items() if k != 'idx'}
+    promedio_por_mes = features.pop('promedio_por_mes') or []
+    promedio_por_dia = features.pop('promedio_por_dia') or []
+    promedio_categoria = features['promedio_categoria']
+    promedio_departamento = features['promedio_departamento']
+
+    # Mismos índices que la consulta en vivo: mes calendario y weekday() de pandas
+    promedio_mes = promedio_por_mes[fecha_dt.month - 1] if len(promedio_por_mes) == 12 else None
+    promedio_dia = promedio_por_dia[fecha_dt.weekday()] if len(promedio_por_dia) == 7 else None
+
+    features.update({
+        'promedio_mismo_mes_cat': promedio_mes if promedio_mes is not None else promedio_categoria,
+        'promedio_mismo_dia_semana_cat': promedio_dia if promedio_dia is not None else promedio_categoria,
+        'asistentes_previos': list(features['asistentes_previos'] or []),
+        'dia_semana_mas_comun': (fecha_dt.weekday() + 1) % 7,
+        'mes_mas_comun': fecha_dt.month,
+        'trimestre_mas_comun': fecha_dt.quarter,
+        'ratio_asistentes_vs_promedio': (
+            promedio_categoria / promedio_departamento
+            if promedio_departamento and promedio_departamento > 0 else 1
+        ),
+        'percentil_asistentes_categoria': 0,
+        'promedios_por_dia': {
+            str(dia): float(promedio)
+            for dia, promedio in enumerate(promedio_por_dia)
+            if promedio is not None
+        }
+    })
+    return features
+
+if __name__ == "__main__":
+    import sys
+    from pathlib import Path
+    sys.path.append(str(Path(__file__).parent.parent))
+    from utils.data_loader import DataLoader
+
+    logging.basicConfig(level=logging.INFO)
+    construir_feature_store(DataLoader().engine, completo='--completo' in sys.argv)